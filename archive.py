@@ -0,0 +1,50 @@
+# archive.py
+from sqlalchemy import MetaData, column, table, text
+from config import ARCHIVE_DATABASE
+from migrations import SEARCH_SCOPE
+from models import Comment, Recognition
+
+# Cold copies of the recognitions and comments tables in the attached archive
+# database, with the same columns and indexes, plus its own search index.
+# A migration that changes either table has to change these as well.
+ARCHIVE_SCHEMA = 'archive'
+
+_metadata = MetaData()
+archived_recognitions = Recognition.__table__.to_metadata(_metadata, schema=ARCHIVE_SCHEMA)
+archived_comments = Comment.__table__.to_metadata(_metadata, schema=ARCHIVE_SCHEMA)
+
+def attach_archive(cursor, journal_mode, synchronous):
+    """Attach the archive database to a new SQLite connection."""
+    cursor.execute(f"ATTACH DATABASE ? AS {ARCHIVE_SCHEMA}", (ARCHIVE_DATABASE,))
+    cursor.execute(f"PRAGMA {ARCHIVE_SCHEMA}.journal_mode={journal_mode}")
+    cursor.execute(f"PRAGMA {ARCHIVE_SCHEMA}.synchronous={synchronous}")
+
+def has_archive(bind):
+    return ARCHIVE_DATABASE is not None and bind.dialect.name == 'sqlite'
+
+def create_archive(engine):
+    with engine.begin() as conn:
+        _metadata.create_all(conn)
+        conn.execute(text(
+            f"CREATE VIRTUAL TABLE IF NOT EXISTS {ARCHIVE_SCHEMA}.search_index USING fts5("
+            "body, scope, tokenize = 'unicode61 remove_diacritics 2', prefix = '2 3')"
+        ))
+        # Comments added to already archived recognitions were once indexed with only
+        # their commenter's scope (no space in it); give them the recognition's too
+        conn.execute(text(
+            "UPDATE main.search_index SET scope = (SELECT " + SEARCH_SCOPE.format(r="r") + " FROM "
+            f"main.comments AS c JOIN {ARCHIVE_SCHEMA}.recognitions AS r ON r.id = c.recognition_id "
+            "WHERE c.id * 2 + 1 = search_index.rowid) || ' ' || scope "
+            "WHERE rowid IN (SELECT c.id * 2 + 1 FROM main.comments AS c "
+            f"JOIN {ARCHIVE_SCHEMA}.recognitions AS r ON r.id = c.recognition_id) AND scope NOT LIKE '% %'"
+        ))
+
+def recognition_tables(bind):
+    """Recognitions tables to read, cold first: both their ids and their dates are older."""
+    return [archived_recognitions, Recognition.__table__] if has_archive(bind) else [Recognition.__table__]
+
+def comment_tables(bind):
+    return [archived_comments, Comment.__table__] if has_archive(bind) else [Comment.__table__]
+
+def search_index(schema='main'):
+    return table('search_index', column('rowid'), column('body'), column('scope'), schema=schema)
@@ -0,0 +1,125 @@
+# benchmarks/fakes.py
+# Stand-ins for the python-telegram-bot objects handlers touch, so benchmarks
+# can drive handlers without talking to Telegram.
+import asyncio
+import json
+import time
+from telegram.error import RetryAfter
+from telegram.request import BaseRequest
+
+class FakeMessage:
+    def __init__(self, text=None):
+        self.text = text
+
+    async def reply_text(self, text, **kwargs):
+        return FakeMessage(text)
+
+    async def edit_text(self, text, **kwargs):
+        self.text = text
+        return self
+
+class FakeBot:
+    async def send_message(self, chat_id, text, **kwargs):
+        return FakeMessage(text)
+
+class FloodLimitedBot(FakeBot):
+    """Enforces a messages-per-second limit like Telegram, raising RetryAfter when exceeded."""
+
+    def __init__(self, limit=30, latency=0.05):
+        self.limit = limit
+        self.latency = latency
+        self.sent = []
+        self.flood_errors = 0
+        self._window = []
+
+    async def send_message(self, chat_id, text, **kwargs):
+        now = time.monotonic()
+        self._window = [t for t in self._window if now - t < 1.0]
+        if len(self._window) >= self.limit:
+            self.flood_errors += 1
+            raise RetryAfter(1)
+        self._window.append(now)
+        await asyncio.sleep(self.latency)
+        self.sent.append(chat_id)
+        return FakeMessage(text)
+
+class FakeEntity:
+    def __init__(self, id, username=None, type='private'):
+        self.id = id
+        self.username = username
+        self.type = type
+
+class FakeUpdate:
+    def __init__(self, user_id, chat_id, chat_type, text=None):
+        self.effective_user = FakeEntity(user_id, f"user{user_id}")
+        self.effective_chat = FakeEntity(chat_id, type=chat_type)
+        self.message = FakeMessage(text)
+
+class FakeApplication:
+    def create_task(self, coroutine):
+        return asyncio.create_task(coroutine)
+
+class FakeContext:
+    def __init__(self, args, bot=None):
+        self.args = args
+        self.bot = bot or FakeBot()
+        self.application = FakeApplication()
+        self.user_data = {}
+
+class FakeBotAPI(BaseRequest):
+    """Answers Bot API calls locally so a real Application can run without Telegram.
+
+    Pass it to main.build_application(request=...); every call is recorded as
+    (method, parameters, monotonic time). With flood_limit set, sends beyond
+    that many per second get Telegram's 429 reply, which PTB raises as RetryAfter.
+    """
+
+    BOT = {"id": 1, "is_bot": True, "first_name": "Rahmat", "username": "rahmat_bot"}
+
+    def __init__(self, latency=0.0, flood_limit=None):
+        self.latency = latency
+        self.flood_limit = flood_limit
+        self.calls = []
+        self.flood_errors = 0
+        self._message_id = 0
+        self._window = []
+
+    async def initialize(self):
+        pass
+
+    async def shutdown(self):
+        pass
+
+    async def do_request(self, url, method, request_data=None, **kwargs):
+        name = url.rsplit("/", 1)[-1]
+        params = request_data.parameters if request_data else {}
+        if self.latency:
+            await asyncio.sleep(self.latency)
+
+        if self.flood_limit and name.startswith(("send", "edit")):
+            now = time.monotonic()
+            self._window = [t for t in self._window if now - t < 1.0]
+            if len(self._window) >= self.flood_limit:
+                self.flood_errors += 1
+                return 429, json.dumps({
+                    "ok": False,
+                    "error_code": 429,
+                    "description": "Too Many Requests: retry after 1",
+                    "parameters": {"retry_after": 1}
+                }).encode()
+            self._window.append(now)
+        self.calls.append((name, params, time.monotonic()))
+
+        if name == "getMe":
+            result = self.BOT
+        elif name.startswith("send"):
+            self._message_id += 1
+            result = {
+                "message_id": self._message_id,
+                "date": int(time.time()),
+                "chat": {"id": int(params["chat_id"]), "type": "private"},
+                "text": params.get("text", "")
+            }
+        else:
+            result = True
+        return 200, json.dumps({"ok": True, "result": result}).encode()
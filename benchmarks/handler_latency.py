@@ -0,0 +1,91 @@
+# benchmarks/handler_latency.py
+# Fires a burst of concurrent updates at the handlers and reports per-handler
+# latency plus event-loop lag. Run from the repository root:
+#   python benchmarks/handler_latency.py [--updates 50] [--users 1000]
+import argparse
+import asyncio
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.chdir(tempfile.mkdtemp(prefix="bench-"))
+
+import main
+from database import Session
+from fakes import FakeUpdate, FakeContext
+from models import User, Recognition
+
+def seed(n_users, n_recognitions):
+    session = Session()
+    session.add_all(User(telegram_id=str(i), username=f"user{i}", points_balance=1e9) for i in range(n_users))
+    session.add_all(
+        Recognition(
+            giver_id=str(random.randrange(n_users)),
+            receiver_id=str(random.randrange(n_users)),
+            points=10,
+            message="seed",
+            group_id="-1"
+        )
+        for _ in range(n_recognitions)
+    )
+    session.commit()
+    session.close()
+
+def percentile(samples, p):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * p / 100))]
+
+async def timed(handler, update, context):
+    started = time.perf_counter()
+    await handler(update, context)
+    return time.perf_counter() - started
+
+async def monitor_loop_lag(lags, stop):
+    while not stop.is_set():
+        started = time.perf_counter()
+        await asyncio.sleep(0.001)
+        lags.append(time.perf_counter() - started - 0.001)
+
+async def burst(n_updates, n_users):
+    calls = []
+    for i in range(n_updates):
+        user_id = random.randrange(n_users)
+        kind = i % 3
+        if kind == 0:
+            calls.append((main.leaderboard, FakeUpdate(user_id, -1, 'group'), FakeContext([])))
+        elif kind == 1:
+            receiver = f"@user{random.randrange(n_users)}"
+            calls.append((main.give_bonus, FakeUpdate(user_id, -1, 'group'), FakeContext([receiver, "1", "#bench", "thanks"])))
+        else:
+            calls.append((main.balance, FakeUpdate(user_id, user_id, 'private'), FakeContext([])))
+
+    lags = []
+    stop = asyncio.Event()
+    monitor = asyncio.create_task(monitor_loop_lag(lags, stop))
+    started = time.perf_counter()
+    latencies = await asyncio.gather(*(timed(*call) for call in calls))
+    elapsed = time.perf_counter() - started
+    stop.set()
+    await monitor
+    return latencies, lags, elapsed
+
+def run():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--updates", type=int, default=50)
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--recognitions", type=int, default=100000)
+    args = parser.parse_args()
+
+    seed(args.users, args.recognitions)
+    asyncio.run(main.recognitions.rebuild_group_points())
+    latencies, lags, elapsed = asyncio.run(burst(args.updates, args.users))
+    print(f"{args.updates} concurrent updates in {elapsed * 1000:.1f} ms")
+    for p in (50, 95, 99):
+        print(f"  handler p{p}: {percentile(latencies, p) * 1000:.1f} ms")
+    print(f"  max event-loop lag: {max(lags or [0]) * 1000:.1f} ms")
+
+if __name__ == "__main__":
+    run()
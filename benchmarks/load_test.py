@@ -0,0 +1,267 @@
+# benchmarks/load_test.py
+# Load test for the whole bot: builds the real Application on a fake Bot API,
+# seeds a database of the requested size, feeds it a synthetic mix of /bonus,
+# /leaderboard, /balance, /redeem and complete /recognize conversations through
+# its update queue, then runs the recurring bonus job. Reports throughput and
+# p50/p95/p99 latency per command (update queued -> all its handlers finished),
+# plus SQL statements and DB time per handler run.
+# Run from the repository root:
+#   python benchmarks/load_test.py [--users 10000] [--groups 50] [--recognitions 200000]
+#       [--sessions 2000] [--concurrency 50] [--bonuses 5000] [--api-latency 0.05] [--flood-limit 30]
+import argparse
+import asyncio
+import datetime
+import itertools
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.chdir(tempfile.mkdtemp(prefix="bench-"))
+
+from sqlalchemy import insert
+from telegram import Update
+from telegram.ext import TypeHandler
+import main
+from database import Session
+from metrics import metrics
+from fakes import FakeBotAPI
+from models import Organization, UserOrganization, User, Recognition, Reward, RecurringBonus, Group
+from repository import warm_username_index
+
+GROUPS_PER_ORG = 5
+WORKLOAD = {"/bonus": 40, "/leaderboard": 25, "/balance": 20, "/redeem": 10, "/recognize": 5}
+
+def group_chat_id(group_id):
+    return -1000 - group_id
+
+def seed(n_users, n_groups, n_recognitions, n_bonuses):
+    session = Session()
+    session.execute(insert(User), [
+        {"telegram_id": str(i), "username": f"user{i}", "points_balance": 1e9} for i in range(n_users)
+    ])
+    n_orgs = max(1, n_groups // GROUPS_PER_ORG)
+    # The first users administer an organization each, so they can run /recognize
+    session.execute(insert(Organization), [{"id": o + 1, "name": f"org{o + 1}", "admin_id": str(o)} for o in range(n_orgs)])
+    session.execute(insert(Group), [
+        {"id": g + 1, "org_id": g % n_orgs + 1, "group_name": f"group{g + 1}", "telegram_group_id": str(group_chat_id(g + 1))}
+        for g in range(n_groups)
+    ])
+    session.execute(insert(UserOrganization), [{"user_id": str(i), "org_id": i % n_orgs + 1} for i in range(n_users)])
+    session.execute(insert(Reward), [
+        {"name": f"reward{r}", "description": "seed", "points_required": 10, "requires_approval": r % 2 == 0}
+        for r in range(4)
+    ])
+    for offset in range(0, n_recognitions, 10000):
+        session.execute(insert(Recognition), [
+            {
+                "giver_id": str(random.randrange(n_users)),
+                "receiver_id": str(random.randrange(n_users)),
+                "points": 10,
+                "message": "seed",
+                "group_id": str(group_chat_id(random.randrange(n_groups) + 1))
+            }
+            for _ in range(min(10000, n_recognitions - offset))
+        ])
+    due = datetime.datetime.now() - datetime.timedelta(minutes=5)
+    session.execute(insert(RecurringBonus), [
+        {
+            "giver_id": str(random.randrange(n_users)),
+            "receiver_id": str(random.randrange(n_users)),
+            "amount": 1,
+            "interval": random.choice(['daily', 'weekly', 'monthly']),
+            "next_run": due,
+            "is_active": True
+        }
+        for _ in range(n_bonuses)
+    ])
+    session.commit()
+    session.close()
+    asyncio.run(main.recognitions.rebuild_group_points())
+    warm_username_index()
+    return n_orgs
+
+class Workload:
+    """Builds Update payloads the way Telegram sends them."""
+
+    def __init__(self, n_users, n_groups, n_orgs):
+        self.n_users = n_users
+        self.n_groups = n_groups
+        self.n_orgs = n_orgs
+        self._ids = itertools.count(1)
+
+    def _user(self, user_id):
+        return {"id": user_id, "is_bot": False, "first_name": f"user{user_id}", "username": f"user{user_id}"}
+
+    def _message(self, user_id, chat, text):
+        update_id = next(self._ids)
+        entities = []
+        if text.startswith("/"):
+            entities = [{"type": "bot_command", "offset": 0, "length": len(text.split()[0])}]
+        return {
+            "update_id": update_id,
+            "message": {
+                "message_id": update_id,
+                "date": int(time.time()),
+                "from": self._user(user_id),
+                "chat": chat,
+                "text": text,
+                "entities": entities
+            }
+        }
+
+    def _callback(self, user_id, data):
+        update_id = next(self._ids)
+        return {
+            "update_id": update_id,
+            "callback_query": {
+                "id": str(update_id),
+                "from": self._user(user_id),
+                "chat_instance": str(user_id),
+                "data": data,
+                "message": {"message_id": update_id, "date": int(time.time()), "chat": self._private(user_id), "text": "menu"}
+            }
+        }
+
+    def _private(self, user_id):
+        return {"id": user_id, "type": "private", "first_name": f"user{user_id}"}
+
+    def _group(self):
+        group_id = random.randrange(self.n_groups) + 1
+        return {"id": group_chat_id(group_id), "type": "supergroup", "title": f"group{group_id}"}
+
+    def session(self, command):
+        """(user id, [(label, update payload)]) sent one after another by a single user."""
+        user_id = random.randrange(self.n_users)
+        receiver = f"@user{random.randrange(self.n_users)}"
+        if command == "/bonus":
+            return user_id, [(command, self._message(user_id, self._group(), f"/bonus {receiver} 1 #load thanks for the help"))]
+        if command == "/leaderboard":
+            chat = self._group() if random.random() < 0.8 else self._private(user_id)
+            return user_id, [(command, self._message(user_id, chat, "/leaderboard"))]
+        if command == "/balance":
+            return user_id, [(command, self._message(user_id, self._private(user_id), "/balance"))]
+        if command == "/redeem":
+            return user_id, [(command, self._message(user_id, self._private(user_id), f"/redeem {random.randrange(4) + 1}"))]
+
+        # /recognize is run by an organization admin: users 0..n_orgs-1
+        admin = random.randrange(self.n_orgs)
+        org_id = admin + 1
+        group_id = random.choice([g + 1 for g in range(self.n_groups) if g % self.n_orgs == admin])
+        chat = self._private(admin)
+        return admin, [
+            ("/recognize", self._message(admin, chat, "/recognize")),
+            ("/recognize org", self._callback(admin, f"org_{org_id}")),
+            ("/recognize group", self._callback(admin, f"group_{group_id}")),
+            ("/recognize receiver", self._message(admin, chat, receiver)),
+            ("/recognize amount", self._message(admin, chat, "1")),
+            ("/recognize message", self._message(admin, chat, "great sprint")),
+        ]
+
+def percentile(samples, p):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * p / 100))]
+
+async def drive(app, sessions, concurrency):
+    loop = asyncio.get_running_loop()
+    pending = {}
+    errors = {}
+    latencies = {}
+    failures = {}
+
+    async def finished(update, context):
+        future = pending.pop(update.update_id, None)
+        if future:
+            future.set_result(None)
+
+    async def failed(update, context):
+        if isinstance(update, Update):
+            errors[update.update_id] = context.error
+
+    # Runs after every other handler group, so it marks the update as fully handled
+    app.add_handler(TypeHandler(Update, finished), group=99)
+    app.add_error_handler(failed)
+
+    limit = asyncio.Semaphore(concurrency)
+    # A person finishes one flow before starting another; interleaving two
+    # /recognize conversations of the same user would derail both
+    user_locks = {}
+
+    async def run_session(user_id, steps):
+        async with user_locks.setdefault(user_id, asyncio.Lock()), limit:
+            for label, payload in steps:
+                update = Update.de_json(payload, app.bot)
+                done = loop.create_future()
+                pending[update.update_id] = done
+                started = time.perf_counter()
+                await app.update_queue.put(update)
+                await done
+                latencies.setdefault(label, []).append(time.perf_counter() - started)
+                if update.update_id in errors:
+                    failures[label] = failures.get(label, 0) + 1
+                    break
+
+    started = time.perf_counter()
+    await asyncio.gather(*(run_session(user_id, steps) for user_id, steps in sessions))
+    return latencies, failures, time.perf_counter() - started
+
+async def bench(args, n_orgs):
+    api = FakeBotAPI(latency=args.api_latency, flood_limit=args.flood_limit)
+    app = main.build_application("123456:load", request=api, get_updates_request=api)
+    main.app = app
+
+    workload = Workload(args.users, args.groups, n_orgs)
+    commands = random.choices(list(WORKLOAD), weights=list(WORKLOAD.values()), k=args.sessions)
+    sessions = [workload.session(command) for command in commands]
+
+    await app.initialize()
+    await app.start()
+    try:
+        latencies, failures, elapsed = await drive(app, sessions, args.concurrency)
+        job_started = time.perf_counter()
+        await metrics.instrument(main.process_recurring_bonuses, "process_recurring_bonuses", kind='job')()
+        job_elapsed = time.perf_counter() - job_started
+    finally:
+        await app.stop()
+        await app.shutdown()
+    return api, latencies, failures, elapsed, job_elapsed
+
+def run():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--users", type=int, default=10000)
+    parser.add_argument("--groups", type=int, default=50)
+    parser.add_argument("--recognitions", type=int, default=200000)
+    parser.add_argument("--bonuses", type=int, default=5000, help="due recurring bonuses")
+    parser.add_argument("--sessions", type=int, default=2000, help="user sessions; a /recognize session is six updates")
+    parser.add_argument("--concurrency", type=int, default=50, help="users acting at once")
+    parser.add_argument("--api-latency", type=float, default=0.05, help="seconds per Bot API call")
+    parser.add_argument("--flood-limit", type=int, default=None, help="sends per second before 429s")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+    random.seed(args.seed)
+
+    seed_started = time.perf_counter()
+    n_orgs = seed(args.users, args.groups, args.recognitions, args.bonuses)
+    print(f"Seeded {args.users} users, {args.groups} groups, {args.recognitions} recognitions in {time.perf_counter() - seed_started:.1f} s")
+
+    api, latencies, failures, elapsed, job_elapsed = asyncio.run(bench(args, n_orgs))
+    updates = sum(len(samples) for samples in latencies.values())
+    print(f"{updates} updates from {args.sessions} sessions in {elapsed:.1f} s ({updates / elapsed:.0f} updates/s)")
+    print(f"  {'command':<20}{'count':>7}{'errors':>8}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+    for label, samples in sorted(latencies.items()):
+        print(
+            f"  {label:<20}{len(samples):>7}{failures.get(label, 0):>8}"
+            + "".join(f"{percentile(samples, p) * 1000:>10.1f}" for p in (50, 95, 99))
+        )
+    print(f"Recurring job: {args.bonuses} due bonuses in {job_elapsed:.1f} s ({args.bonuses / job_elapsed:.0f}/s)")
+    print(f"Bot API: {len(api.calls)} calls, {api.flood_errors} answered 429 (RetryAfter)")
+    statements = metrics.histograms("rahmat_handler_sql_statements")
+    db_seconds = metrics.histograms("rahmat_handler_db_seconds")
+    print(f"  {'handler':<28}{'runs':>7}{'SQL/run':>10}{'DB ms/run':>11}")
+    for name, h in sorted(statements.items(), key=lambda item: -item[1].count):
+        print(f"  {name:<28}{h.count:>7}{h.sum / h.count:>10.1f}{db_seconds[name].sum / h.count * 1000:>11.1f}")
+
+if __name__ == "__main__":
+    run()
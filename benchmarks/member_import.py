@@ -0,0 +1,71 @@
+# benchmarks/member_import.py
+# Times a bulk organization member import: parses a generated CSV roster, half of
+# whose users already exist (some under old usernames), and enrolls it in chunked
+# transactions. The import is then repeated to check that it is idempotent.
+# Run from the repository root:
+#   python benchmarks/member_import.py [--members 10000] [--existing 5000]
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.chdir(tempfile.mkdtemp(prefix="bench-"))
+
+from sqlalchemy import func, insert
+import main
+from database import Session
+from models import LedgerEntry, User, UserOrganization
+from roster import parse_roster
+
+def seed(n_existing):
+    session = Session()
+    session.execute(insert(User), [
+        {"telegram_id": str(1000 + i), "username": f"old{i}" if i % 10 == 0 else f"member{i}"} for i in range(n_existing)
+    ])
+    session.commit()
+    session.close()
+
+def roster_csv(n_members):
+    lines = ["telegram_id,username"] + [f"{1000 + i},@member{i}" for i in range(n_members)]
+    return "\n".join(lines).encode()
+
+def counts(org_id):
+    session = Session()
+    try:
+        return (
+            session.query(func.count(User.id)).scalar(),
+            session.query(func.count(UserOrganization.id)).filter_by(org_id=org_id).scalar(),
+            session.query(func.count(LedgerEntry.id)).filter_by(kind='opening').scalar(),
+            session.query(func.count(User.id)).filter(User.username.like("old%")).scalar()
+        )
+    finally:
+        session.close()
+
+async def bench(args):
+    org = await main.organizations.create("bench", "1")
+    data = roster_csv(args.members)
+    for attempt in ("first import", "repeat"):
+        started = time.perf_counter()
+        members = parse_roster("roster.csv", data)
+        created, joined = await main.import_in_chunks(org.id, members)
+        elapsed = time.perf_counter() - started
+        users, memberships, openings, stale = counts(org.id)
+        print(
+            f"{attempt:<13} {len(members)} members in {elapsed:.2f} s ({len(members) / elapsed:.0f}/s): "
+            f"{created} new users, {joined} new memberships"
+        )
+        print(f"{'':<13} totals: {users} users, {memberships} memberships, {openings} opening entries, {stale} stale usernames")
+
+def run():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--members", type=int, default=10000)
+    parser.add_argument("--existing", type=int, default=5000, help="roster members who are already users")
+    args = parser.parse_args()
+    seed(args.existing)
+    asyncio.run(bench(args))
+
+if __name__ == "__main__":
+    run()
@@ -0,0 +1,59 @@
+# benchmarks/recurring_bonuses.py
+# Times the recurring bonus job over a large backlog of due bonuses. Notifications
+# are only queued in the outbox; delivering them is the dispatcher's job.
+#   python benchmarks/recurring_bonuses.py [--bonuses 100000] [--users 10000]
+import argparse
+import asyncio
+import datetime
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.chdir(tempfile.mkdtemp(prefix="bench-"))
+
+import main
+from database import Session
+from models import User, RecurringBonus, Recognition, OutboxMessage
+
+def seed(n_bonuses, n_users):
+    due = datetime.datetime.now() - datetime.timedelta(minutes=5)
+    session = Session()
+    session.add_all(User(telegram_id=str(i), username=f"user{i}", points_balance=1e9) for i in range(n_users))
+    session.add_all(
+        RecurringBonus(
+            giver_id=str(random.randrange(n_users)),
+            receiver_id=str(random.randrange(n_users)),
+            amount=1,
+            interval=random.choice(['daily', 'weekly', 'monthly']),
+            next_run=due
+        )
+        for _ in range(n_bonuses)
+    )
+    session.commit()
+    session.close()
+
+def run():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--bonuses", type=int, default=100000)
+    parser.add_argument("--users", type=int, default=10000)
+    args = parser.parse_args()
+
+    seed(args.bonuses, args.users)
+
+    started = time.perf_counter()
+    asyncio.run(main.process_recurring_bonuses())
+    elapsed = time.perf_counter() - started
+
+    session = Session()
+    paid = session.query(Recognition).count()
+    still_due = session.query(RecurringBonus).filter(RecurringBonus.next_run <= datetime.datetime.now()).count()
+    queued = session.query(OutboxMessage).count()
+    session.close()
+    print(f"Paid {paid}/{args.bonuses} due bonuses in {elapsed:.1f} s ({paid / elapsed:.0f}/s), {still_due} still due")
+    print(f"Queued {queued} notifications")
+
+if __name__ == "__main__":
+    run()
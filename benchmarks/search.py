@@ -0,0 +1,101 @@
+# benchmarks/search.py
+# Times /search's query on a large index: seeds recognitions with messages drawn
+# from a Zipf-like vocabulary (so some words are in most messages and others in
+# a handful) plus a comment on every tenth, then runs common, rare, multi-word
+# and prefix searches, unscoped and scoped to a few groups or one user, and
+# reports p50/p95 per kind of query.
+# Run from the repository root:
+#   python benchmarks/search.py [--recognitions 1000000] [--groups 200] [--users 50000] [--queries 50]
+import argparse
+import asyncio
+import itertools
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.chdir(tempfile.mkdtemp(prefix="bench-"))
+
+from sqlalchemy import insert
+from database import Session
+from models import Comment, Recognition
+from repository import recognitions
+
+VOCABULARY = [f"word{i}" for i in range(20000)]
+CUMULATIVE_WEIGHTS = list(itertools.accumulate(1 / (rank + 1) for rank in range(len(VOCABULARY))))
+BATCH = 20000
+
+def message():
+    return " ".join(random.choices(VOCABULARY, cum_weights=CUMULATIVE_WEIGHTS, k=random.randint(4, 16)))
+
+def seed(n_recognitions, n_groups, n_users):
+    session = Session()
+    for offset in range(0, n_recognitions, BATCH):
+        count = min(BATCH, n_recognitions - offset)
+        session.execute(insert(Recognition), [
+            {
+                "giver_id": str(random.randrange(n_users)),
+                "receiver_id": str(random.randrange(n_users)),
+                "points": 1,
+                "message": message(),
+                "group_id": str(-1000 - random.randrange(n_groups))
+            }
+            for _ in range(count)
+        ])
+        session.execute(insert(Comment), [
+            {"recognition_id": offset + i + 1, "user_id": str(random.randrange(n_users)), "text": message()}
+            for i in range(0, count, 10)
+        ])
+        session.commit()
+    session.close()
+
+def percentile(samples, p):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * p / 100))]
+
+async def bench(args):
+    groups = [str(-1000 - g) for g in range(5)]
+    cases = {
+        "common word": lambda: random.choice(VOCABULARY[:10]),
+        "rare word": lambda: random.choice(VOCABULARY[5000:]),
+        "two words": lambda: f"{random.choice(VOCABULARY[:50])} {random.choice(VOCABULARY[50:500])}",
+        "prefix": lambda: random.choice(VOCABULARY[100:1000])[:-1] + "*",
+    }
+    scopes = {
+        "everything": (None, None),
+        "5 groups": (groups, None),
+        "one user": ([], str(random.randrange(args.users))),
+    }
+    print(f"  {'query':<14}{'scope':<12}{'p50 ms':>9}{'p95 ms':>9}{'hits/page':>11}")
+    for label, terms in cases.items():
+        for scope, (group_ids, user_id) in scopes.items():
+            samples, hits = [], 0
+            for _ in range(args.queries):
+                started = time.perf_counter()
+                found, _, _ = await recognitions.search(terms(), group_ids, user_id)
+                samples.append(time.perf_counter() - started)
+                hits += len(found)
+            print(
+                f"  {label:<14}{scope:<12}{percentile(samples, 50) * 1000:>9.1f}"
+                f"{percentile(samples, 95) * 1000:>9.1f}{hits / args.queries:>11.1f}"
+            )
+
+def run():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--recognitions", type=int, default=1000000)
+    parser.add_argument("--groups", type=int, default=200)
+    parser.add_argument("--users", type=int, default=50000)
+    parser.add_argument("--queries", type=int, default=50, help="searches per kind of query and scope")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+    random.seed(args.seed)
+
+    started = time.perf_counter()
+    seed(args.recognitions, args.groups, args.users)
+    print(f"Indexed {args.recognitions} recognitions and {args.recognitions // 10} comments in {time.perf_counter() - started:.1f} s")
+    asyncio.run(bench(args))
+
+if __name__ == "__main__":
+    run()
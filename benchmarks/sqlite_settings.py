@@ -0,0 +1,66 @@
+# benchmarks/sqlite_settings.py
+# Compares /bonus write throughput under SQLite's default settings (rollback
+# journal, synchronous=FULL) and the tuned connect-time pragmas.
+#   python benchmarks/sqlite_settings.py [--transfers 2000]
+import argparse
+import asyncio
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+SETTINGS = {
+    "default": {"SQLITE_JOURNAL_MODE": "DELETE", "SQLITE_SYNCHRONOUS": "FULL", "SQLITE_MMAP_SIZE": "0", "SQLITE_CACHE_SIZE": "-2000"},
+    "tuned": {},
+}
+
+def child(n_transfers, n_users):
+    sys.path.insert(0, ROOT)
+    os.chdir(tempfile.mkdtemp(prefix="bench-"))
+    from database import Session
+    from fakes import FakeUpdate, FakeContext
+    from models import User
+    import main
+
+    session = Session()
+    session.add_all(User(telegram_id=str(i), username=f"user{i}", points_balance=1e9) for i in range(n_users))
+    session.commit()
+    session.close()
+
+    async def burst():
+        calls = []
+        for _ in range(n_transfers):
+            giver, receiver = random.sample(range(n_users), 2)
+            calls.append(main.give_bonus(FakeUpdate(giver, -1, 'group'), FakeContext([f"@user{receiver}", "1", "#bench", "thanks"])))
+        await asyncio.gather(*calls)
+
+    started = time.perf_counter()
+    asyncio.run(burst())
+    elapsed = time.perf_counter() - started
+    print(f"{n_transfers / elapsed:.0f}")
+
+def run():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--transfers", type=int, default=2000)
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--child", action="store_true")
+    args = parser.parse_args()
+
+    if args.child:
+        child(args.transfers, args.users)
+        return
+
+    for name, overrides in SETTINGS.items():
+        env = dict(os.environ, **overrides)
+        result = subprocess.run(
+            [sys.executable, __file__, "--child", "--transfers", str(args.transfers), "--users", str(args.users)],
+            env=env, capture_output=True, text=True, check=True
+        )
+        print(f"{name:>8}: {result.stdout.strip().splitlines()[-1]} /bonus per second")
+
+if __name__ == "__main__":
+    run()
@@ -0,0 +1,72 @@
+# benchmarks/transfer_stress.py
+# Runs thousands of concurrent /bonus transfers between a small set of users
+# and checks that no points were created or destroyed and no balance went
+# negative.
+#   python benchmarks/transfer_stress.py [--transfers 5000] [--users 20]
+import argparse
+import asyncio
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.chdir(tempfile.mkdtemp(prefix="bench-"))
+
+from sqlalchemy import func
+from database import Session
+from models import User, Recognition
+from repository import InsufficientPoints, recognitions
+
+def seed(n_users, balance):
+    session = Session()
+    session.add_all(User(telegram_id=str(i), username=f"user{i}", points_balance=balance) for i in range(n_users))
+    session.commit()
+    session.close()
+
+def totals():
+    session = Session()
+    total = session.query(func.sum(User.points_balance)).scalar()
+    lowest = session.query(func.min(User.points_balance)).scalar()
+    moved = session.query(func.coalesce(func.sum(Recognition.points), 0)).scalar()
+    session.close()
+    return total, lowest, moved
+
+async def transfer(n_users, outcomes):
+    giver, receiver = random.sample(range(n_users), 2)
+    try:
+        await recognitions.give(giver, f"user{giver}", f"user{receiver}", random.randint(1, 30), "stress")
+        outcomes["ok"] += 1
+    except InsufficientPoints:
+        outcomes["insufficient"] += 1
+    except Exception as e:
+        outcomes["error"] += 1
+        outcomes.setdefault("errors", set()).add(type(e).__name__)
+
+async def stress(n_transfers, n_users):
+    outcomes = {"ok": 0, "insufficient": 0, "error": 0}
+    await asyncio.gather(*(transfer(n_users, outcomes) for _ in range(n_transfers)))
+    return outcomes
+
+def run():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--transfers", type=int, default=5000)
+    parser.add_argument("--users", type=int, default=20)
+    parser.add_argument("--balance", type=float, default=100)
+    args = parser.parse_args()
+
+    seed(args.users, args.balance)
+    expected = args.users * args.balance
+    started = time.perf_counter()
+    outcomes = asyncio.run(stress(args.transfers, args.users))
+    elapsed = time.perf_counter() - started
+    total, lowest, moved = totals()
+
+    print(f"{args.transfers} concurrent transfers in {elapsed:.1f} s: {outcomes}")
+    print(f"Total points {total} (expected {expected}), lowest balance {lowest}, {moved} points moved")
+    if total != expected or lowest < 0:
+        sys.exit("FAILED: points were not conserved")
+
+if __name__ == "__main__":
+    run()
@@ -0,0 +1,137 @@
+# benchmarks/webhook_latency.py
+# Runs the real Application in webhook mode against a local fake Bot API, POSTs
+# recorded updates to it over HTTP and reports end-to-end latency per command
+# (POST sent -> handler's reply reaches the Bot API). Run from the repository root:
+#   python benchmarks/webhook_latency.py [--updates 300] [--connections 40]
+import argparse
+import asyncio
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.chdir(tempfile.mkdtemp(prefix="bench-"))
+
+import httpx
+import main
+from database import Session
+from fakes import FakeBotAPI
+from models import User
+
+SECRET = "bench-secret"
+PORT = 18443
+PATH = "telegram"
+COMMANDS = ["/balance", "/leaderboard", "/bonus"]
+
+def seed(n_users):
+    session = Session()
+    session.add_all(User(telegram_id=str(i), username=f"user{i}", points_balance=1e9) for i in range(n_users))
+    session.commit()
+    session.close()
+
+def percentile(samples, p):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * p / 100))]
+
+def recorded_update(update_id, user_id, text):
+    """Update JSON as Telegram posts it. Every update gets its own chat so replies can be matched."""
+    command = text.split()[0]
+    chat = {"id": user_id, "type": "private"} if command == "/balance" else {"id": -1 - update_id, "type": "group", "title": "bench"}
+    return {
+        "update_id": update_id,
+        "message": {
+            "message_id": update_id,
+            "date": int(time.time()),
+            "from": {"id": user_id, "is_bot": False, "first_name": f"user{user_id}", "username": f"user{user_id}"},
+            "chat": chat,
+            "text": text,
+            "entities": [{"type": "bot_command", "offset": 0, "length": len(command)}]
+        }
+    }
+
+def first_reply_times(api):
+    replies = {}
+    for name, params, at in api.calls:
+        if name == "sendMessage":
+            replies.setdefault(int(params["chat_id"]), at)
+    return replies
+
+async def post_updates(updates, connections):
+    url = f"http://127.0.0.1:{PORT}/{PATH}"
+    headers = {"X-Telegram-Bot-Api-Secret-Token": SECRET}
+    limit = asyncio.Semaphore(connections)  # Telegram's max_connections
+    posted = {}
+
+    async with httpx.AsyncClient() as client:
+        forged = await client.post(url, json=updates[0], headers={"X-Telegram-Bot-Api-Secret-Token": "wrong"})
+        assert forged.status_code == 403, forged.status_code
+
+        async def post(update):
+            async with limit:
+                posted[update["message"]["chat"]["id"]] = (update["message"]["text"].split()[0], time.monotonic())
+                response = await client.post(url, json=update, headers=headers)
+                response.raise_for_status()
+
+        started = time.perf_counter()
+        await asyncio.gather(*(post(update) for update in updates))
+    return posted, started
+
+async def bench(n_updates, n_users, connections):
+    api = FakeBotAPI()
+    app = main.build_application("123456:bench", request=api, get_updates_request=api)
+    main.app = app
+
+    updates = []
+    for i in range(n_updates):
+        # Distinct senders keep private chats (and so reply matching) unique
+        user_id = i % n_users
+        command = COMMANDS[i % len(COMMANDS)]
+        if command == "/bonus":
+            command = f"/bonus @user{random.randrange(n_users)} 1 #bench thanks"
+        updates.append(recorded_update(i + 1, user_id, command))
+
+    await app.initialize()
+    await app.updater.start_webhook(
+        listen="127.0.0.1",
+        port=PORT,
+        url_path=PATH,
+        webhook_url=f"https://example.invalid/{PATH}",
+        secret_token=SECRET
+    )
+    await app.start()
+    try:
+        posted, started = await post_updates(updates, connections)
+        deadline = time.monotonic() + 60
+        while len(first_reply_times(api).keys() & posted.keys()) < len(posted) and time.monotonic() < deadline:
+            await asyncio.sleep(0.01)
+        elapsed = time.perf_counter() - started
+    finally:
+        await app.updater.stop()
+        await app.stop()
+        await app.shutdown()
+
+    replies = first_reply_times(api)
+    latencies = {}
+    for chat_id, (command, sent_at) in posted.items():
+        if chat_id in replies:
+            latencies.setdefault(command, []).append(replies[chat_id] - sent_at)
+    return latencies, elapsed
+
+def run():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--updates", type=int, default=300)
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--connections", type=int, default=40)
+    args = parser.parse_args()
+
+    seed(args.users)
+    latencies, elapsed = asyncio.run(bench(args.updates, args.users, args.connections))
+    answered = sum(len(samples) for samples in latencies.values())
+    print(f"{answered}/{args.updates} updates answered in {elapsed * 1000:.1f} ms ({answered / elapsed:.0f}/s)")
+    for command, samples in sorted(latencies.items()):
+        print(f"  {command:<12} " + "  ".join(f"p{p}: {percentile(samples, p) * 1000:.1f} ms" for p in (50, 95, 99)))
+
+if __name__ == "__main__":
+    run()
@@ -0,0 +1,81 @@
+# broadcast.py
+import asyncio
+import time
+from telegram.error import BadRequest, Forbidden, NetworkError, RetryAfter
+from repository import broadcasts
+
+# Telegram allows about 30 messages per second per bot across all chats
+BROADCAST_RATE = 25
+BROADCAST_CONCURRENCY = 10
+BROADCAST_CHUNK_SIZE = 500
+MAX_SEND_ATTEMPTS = 5
+
+class RateLimiter:
+    """Spaces calls to acquire() at most `rate` per second across all callers."""
+
+    def __init__(self, rate):
+        self.interval = 1.0 / rate
+        self._next_slot = 0.0
+
+    async def acquire(self):
+        now = time.monotonic()
+        slot = max(now, self._next_slot)
+        self._next_slot = slot + self.interval
+        if slot > now:
+            await asyncio.sleep(slot - now)
+
+    def pause(self, seconds):
+        # A flood-wait applies to the whole bot, so every sender backs off
+        self._next_slot = max(self._next_slot, time.monotonic() + seconds)
+
+class Broadcaster:
+    def __init__(self, bot, rate=BROADCAST_RATE, concurrency=BROADCAST_CONCURRENCY, chunk_size=BROADCAST_CHUNK_SIZE):
+        self.bot = bot
+        self.limiter = RateLimiter(rate)
+        self.concurrency = asyncio.Semaphore(concurrency)
+        self.chunk_size = chunk_size
+
+    async def send(self, chat_id, text):
+        """Send one message within the rate budget. Returns False if it could not be delivered."""
+        async with self.concurrency:
+            for attempt in range(MAX_SEND_ATTEMPTS):
+                await self.limiter.acquire()
+                try:
+                    await self.bot.send_message(chat_id=chat_id, text=text)
+                    return True
+                except RetryAfter as e:
+                    self.limiter.pause(e.retry_after)
+                except (Forbidden, BadRequest):
+                    # Blocked the bot or chat no longer exists; retrying won't help
+                    return False
+                except NetworkError:
+                    await asyncio.sleep(2 ** attempt)
+            return False
+
+    async def run(self, broadcast, on_progress=None):
+        """Deliver a broadcast from its saved cursor, checkpointing after every chunk.
+
+        An interrupted run resumes from the last checkpoint, so at most one chunk
+        of recipients can receive the message twice.
+        """
+        cursor, sent, failed = broadcast.last_user_id, broadcast.sent, broadcast.failed
+        while True:
+            chunk = await broadcasts.recipients_after(cursor, self.chunk_size)
+            if not chunk:
+                break
+
+            results = await asyncio.gather(*(self.send(telegram_id, broadcast.text) for _, telegram_id, _ in chunk))
+            for (_, _, username), delivered in zip(chunk, results):
+                if delivered:
+                    sent += 1
+                else:
+                    failed += 1
+                    print(f"Failed to message {username}")
+
+            cursor = chunk[-1][0]
+            await broadcasts.checkpoint(broadcast.id, cursor, sent, failed)
+            if on_progress:
+                await on_progress(sent, failed)
+
+        await broadcasts.checkpoint(broadcast.id, cursor, sent, failed, status='done')
+        return sent, failed
@@ -0,0 +1,164 @@
+# cache.py
+import threading
+import time
+from collections import OrderedDict
+
+class LeaderboardCache:
+    """Rendered leaderboard text per scope ('global' or a group chat id) and view
+    (None for all-time, or a time window such as 'week').
+
+    Writers call invalidate() for the scopes whose balances they changed, which
+    drops every view of them; the TTL only bounds staleness from writes made
+    outside the bot.
+    """
+
+    def __init__(self, ttl=300):
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries = {}
+        # Bumped on every invalidation so a render that raced a write is not stored
+        self._generations = {}
+        self._epoch = 0
+
+    def get(self, scope, view=None):
+        entry = self._entries.get(scope, {}).get(view)
+        if entry and entry[1] > time.monotonic():
+            self.hits += 1
+            return entry[0]
+        self.misses += 1
+        return None
+
+    def generation(self, scope):
+        return self._epoch, self._generations.get(scope, 0)
+
+    def put(self, scope, text, generation, view=None):
+        if generation == self.generation(scope):
+            self._entries.setdefault(scope, {})[view] = (text, time.monotonic() + self.ttl)
+
+    def invalidate(self, *scopes):
+        for scope in scopes:
+            if scope is None:
+                continue
+            self._entries.pop(scope, None)
+            self._generations[scope] = self._generations.get(scope, 0) + 1
+
+    def clear(self):
+        self._entries.clear()
+        self._epoch += 1
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "entries": sum(len(views) for views in self._entries.values()),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0
+        }
+
+class UserCache:
+    """Bounded LRU of telegram_id -> detached User, so known users cost no DB work.
+
+    Invalidated from DB worker threads when a committed transaction changes a
+    balance, hence the lock. A load that raced an invalidation is not stored.
+    Entries expire after ttl seconds, which bounds how stale a user can be when
+    another process sharing the database changed it.
+    """
+
+    def __init__(self, maxsize=10000, ttl=10):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._generations = {}
+        self._lock = threading.Lock()
+
+    def get(self, telegram_id):
+        with self._lock:
+            entry = self._entries.get(telegram_id)
+            if entry is None or entry[1] <= time.monotonic():
+                self._entries.pop(telegram_id, None)
+                self.misses += 1
+                return None
+            self._entries.move_to_end(telegram_id)
+            self.hits += 1
+            return entry[0]
+
+    def generation(self, telegram_id):
+        with self._lock:
+            return self._generations.get(telegram_id, 0)
+
+    def put(self, telegram_id, user, generation):
+        with self._lock:
+            if generation != self._generations.get(telegram_id, 0):
+                return
+            self._entries[telegram_id] = (user, time.monotonic() + self.ttl)
+            self._entries.move_to_end(telegram_id)
+            if len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, *telegram_ids):
+        with self._lock:
+            for telegram_id in telegram_ids:
+                self._entries.pop(telegram_id, None)
+                self._generations[telegram_id] = self._generations.get(telegram_id, 0) + 1
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0
+            }
+
+class GroupDirectory:
+    """Which organization each linked group chat belongs to, kept in memory.
+
+    Loaded at startup and updated from DB worker threads after commits that link groups.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._org_of = {}   # telegram group id -> org_id
+        self._groups = {}   # org_id -> {telegram group id}
+        self._replay = None  # links made while a reload reads the database
+
+    def start_reload(self):
+        """Call before reading the links for load(); links from then on are re-applied on top of them."""
+        with self._lock:
+            self._replay = []
+
+    def load(self, links):
+        """Replace the directory with (telegram group id, org_id) links."""
+        with self._lock:
+            self._org_of = {}
+            self._groups = {}
+            for chat_id, org_id in links:
+                self._link(str(chat_id), org_id)
+            for chat_id, org_id in self._replay or ():
+                self._link(chat_id, org_id)
+            self._replay = None
+
+    def link(self, chat_id, org_id):
+        with self._lock:
+            self._link(str(chat_id), org_id)
+            if self._replay is not None:
+                self._replay.append((str(chat_id), org_id))
+
+    def org_of(self, chat_id):
+        with self._lock:
+            return self._org_of.get(str(chat_id))
+
+    def groups(self, org_id):
+        with self._lock:
+            return sorted(self._groups.get(org_id, ()))
+
+    def _link(self, chat_id, org_id):
+        previous = self._org_of.get(chat_id)
+        if previous is not None:
+            self._groups[previous].discard(chat_id)
+        self._org_of[chat_id] = org_id
+        self._groups.setdefault(org_id, set()).add(chat_id)
@@ -0,0 +1,78 @@
+# config.py
+import os
+from dotenv import load_dotenv
+
+load_dotenv()
+
+BOT_TOKEN = os.getenv("BOT_TOKEN")
+ADMIN_IDS = os.getenv("ADMIN_IDS", "").split(",")
+
+# --- Storage ---
+# Any SQLAlchemy URL, e.g. postgresql+psycopg2://bot:secret@db/rahmat (install the driver separately)
+DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///bonusly.db")
+# Threads running blocking DB work; also the number of pooled connections kept open
+DB_WORKERS = int(os.getenv("DB_WORKERS", "4"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "4"))
+DB_POOL_TIMEOUT = int(os.getenv("DB_POOL_TIMEOUT", "30"))
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+
+# SQLite file attached as "archive" that old recognitions and comments are moved
+# into; unset keeps everything in the main database
+ARCHIVE_DATABASE = os.getenv("ARCHIVE_DATABASE")
+# Whole months older than this many days are archived by a daily job
+ARCHIVE_AFTER_DAYS = int(os.getenv("ARCHIVE_AFTER_DAYS", "365"))
+
+# Applied to every new SQLite connection
+SQLITE_JOURNAL_MODE = os.getenv("SQLITE_JOURNAL_MODE", "WAL")
+SQLITE_SYNCHRONOUS = os.getenv("SQLITE_SYNCHRONOUS", "NORMAL")
+SQLITE_MMAP_SIZE = int(os.getenv("SQLITE_MMAP_SIZE", str(256 * 1024 * 1024)))
+SQLITE_BUSY_TIMEOUT = int(os.getenv("SQLITE_BUSY_TIMEOUT", "5000"))  # milliseconds
+SQLITE_CACHE_SIZE = int(os.getenv("SQLITE_CACHE_SIZE", "-65536"))  # negative = KiB
+
+# --- Updates ---
+# "polling" or "webhook"
+BOT_MODE = os.getenv("BOT_MODE", "polling").lower()
+# Public HTTPS URL Telegram posts to; TLS is expected to terminate at a reverse proxy
+WEBHOOK_URL = os.getenv("WEBHOOK_URL")
+WEBHOOK_LISTEN = os.getenv("WEBHOOK_LISTEN", "127.0.0.1")
+WEBHOOK_PORT = int(os.getenv("WEBHOOK_PORT", "8080"))
+WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "telegram")
+# 1-256 characters from A-Z, a-z, 0-9, _ and -
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET")
+# Simultaneous HTTPS connections Telegram may open to the webhook
+WEBHOOK_MAX_CONNECTIONS = int(os.getenv("WEBHOOK_MAX_CONNECTIONS", "40"))
+
+# --- Conversation state ---
+# Seconds between writes of conversation/user_data changes. Workers sharing the
+# database see each other's changes after at most this long.
+PERSISTENCE_FLUSH_INTERVAL = float(os.getenv("PERSISTENCE_FLUSH_INTERVAL", "2"))
+# Seconds a cached user (balance, username) is served before it is read again, so
+# changes committed by other workers show up; a worker's own commits drop it at once
+USER_CACHE_TTL = float(os.getenv("USER_CACHE_TTL", "10"))
+# Seconds between full reloads of the in-memory username and group indexes, which pick
+# up users and groups other workers added; 0 disables (a worker's own commits update
+# them as they happen)
+INDEX_REFRESH_INTERVAL = float(os.getenv("INDEX_REFRESH_INTERVAL", "900"))
+
+# --- Notifications ---
+# Seconds a notification waits so later ones to the same chat merge into one digest; 0 sends at once
+DIGEST_WINDOW = float(os.getenv("DIGEST_WINDOW", "60"))
+# Notification kinds that skip the digest window
+URGENT_NOTIFICATIONS = set(
+    os.getenv("URGENT_NOTIFICATIONS", "redemption_request,redemption_approved,points_reset").split(",")
+)
+
+# --- Metrics ---
+# Port serving Prometheus text at /metrics on METRICS_LISTEN; unset disables it
+METRICS_PORT = int(os.getenv("METRICS_PORT")) if os.getenv("METRICS_PORT") else None
+METRICS_LISTEN = os.getenv("METRICS_LISTEN", "127.0.0.1")
+# File rewritten every METRICS_FILE_INTERVAL seconds, e.g. for node_exporter's textfile collector
+METRICS_FILE = os.getenv("METRICS_FILE")
+METRICS_FILE_INTERVAL = int(os.getenv("METRICS_FILE_INTERVAL", "15"))
+
+# --- Query diagnostics ---
+# Statements slower than this are logged with their query plan; 0 disables
+SLOW_QUERY_MS = float(os.getenv("SLOW_QUERY_MS", "250"))
+# Report a query shape run this many times while handling one update (an N+1 pattern);
+# 0 disables. Normalizes every statement, so meant for development and staging.
+N_PLUS_ONE_THRESHOLD = int(os.getenv("N_PLUS_ONE_THRESHOLD", "0"))
@@ -0,0 +1,74 @@
+# database.py
+import asyncio
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import sessionmaker
+from archive import attach_archive, create_archive, has_archive
+from migrations import upgrade
+from config import (
+    ARCHIVE_DATABASE,
+    DATABASE_URL,
+    DB_WORKERS,
+    DB_MAX_OVERFLOW,
+    DB_POOL_TIMEOUT,
+    DB_POOL_RECYCLE,
+    SQLITE_JOURNAL_MODE,
+    SQLITE_SYNCHRONOUS,
+    SQLITE_MMAP_SIZE,
+    SQLITE_BUSY_TIMEOUT,
+    SQLITE_CACHE_SIZE
+)
+
+def _apply_sqlite_pragmas(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    cursor.execute(f"PRAGMA journal_mode={SQLITE_JOURNAL_MODE}")
+    cursor.execute(f"PRAGMA synchronous={SQLITE_SYNCHRONOUS}")
+    cursor.execute(f"PRAGMA mmap_size={SQLITE_MMAP_SIZE}")
+    cursor.execute(f"PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT}")
+    cursor.execute(f"PRAGMA cache_size={SQLITE_CACHE_SIZE}")
+    if ARCHIVE_DATABASE:
+        attach_archive(cursor, SQLITE_JOURNAL_MODE, SQLITE_SYNCHRONOUS)
+    cursor.close()
+
+def create_db_engine(url=DATABASE_URL):
+    # One pooled connection per DB worker thread, with a little headroom
+    engine = create_engine(
+        url,
+        pool_size=DB_WORKERS,
+        max_overflow=DB_MAX_OVERFLOW,
+        pool_timeout=DB_POOL_TIMEOUT,
+        pool_recycle=DB_POOL_RECYCLE,
+        pool_pre_ping=not url.startswith("sqlite")
+    )
+    if engine.dialect.name == "sqlite":
+        event.listen(engine, "connect", _apply_sqlite_pragmas)
+    return engine
+
+engine = create_db_engine()
+upgrade(engine)
+if has_archive(engine):
+    create_archive(engine)
+# Objects outlive their session (they are handed back to async handlers)
+Session = sessionmaker(bind=engine, expire_on_commit=False)
+
+executor = ThreadPoolExecutor(max_workers=DB_WORKERS, thread_name_prefix="db")
+
+def _run_in_session(fn, args, kwargs):
+    session = Session()
+    try:
+        result = fn(session, *args, **kwargs)
+        session.commit()
+        return result
+    except Exception:
+        session.rollback()
+        raise
+    finally:
+        session.close()
+
+async def run_in_session(fn, *args, **kwargs):
+    """Run fn(session, *args, **kwargs) in one transaction on the DB thread pool."""
+    loop = asyncio.get_running_loop()
+    # Carry the caller's context into the worker thread so per-update metrics see its queries
+    context = contextvars.copy_context()
+    return await loop.run_in_executor(executor, context.run, _run_in_session, fn, args, kwargs)
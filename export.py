@@ -0,0 +1,83 @@
+# export.py
+import csv
+import datetime
+import gzip
+import os
+import tempfile
+from sqlalchemy import select
+from archive import recognition_tables
+from database import run_in_session
+from models import Group
+
+EXPORT_BATCH_SIZE = 1000
+EXPORT_HEADER = ["ID", "Created At", "Giver", "Receiver", "Points", "Message", "Tags", "Group"]
+
+def parse_export_args(args):
+    """Parse /export arguments: from=YYYY-MM-DD to=YYYY-MM-DD group=<chat_id> org=<org_id> gz"""
+    filters = {"compress": False}
+    for arg in args:
+        if arg.lower() in ("gz", "gzip"):
+            filters["compress"] = True
+            continue
+        key, _, value = arg.partition("=")
+        if key == "from":
+            filters["since"] = datetime.datetime.strptime(value, "%Y-%m-%d")
+        elif key == "to":
+            # Inclusive of the whole end day
+            filters["until"] = datetime.datetime.strptime(value, "%Y-%m-%d") + datetime.timedelta(days=1)
+        elif key == "group":
+            filters["group_id"] = value
+        elif key == "org":
+            filters["org_id"] = int(value)
+        else:
+            raise ValueError(f"Unknown export option: {arg}")
+    return filters
+
+def _export_query(table, since=None, until=None, group_id=None, org_id=None):
+    query = select(
+        table.c.id,
+        table.c.created_at,
+        table.c.giver_id,
+        table.c.receiver_id,
+        table.c.points,
+        table.c.message,
+        table.c.tags,
+        table.c.group_id
+    ).order_by(table.c.id)
+    if since:
+        query = query.where(table.c.created_at >= since)
+    if until:
+        query = query.where(table.c.created_at < until)
+    if group_id:
+        query = query.where(table.c.group_id == group_id)
+    if org_id:
+        org_groups = select(Group.telegram_group_id).where(Group.org_id == org_id)
+        query = query.where(table.c.group_id.in_(org_groups))
+    return query
+
+def _write_export(session, path, compress=False, **filters):
+    opener = gzip.open if compress else open
+    rows = 0
+    with opener(path, "wt", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        writer.writerow(EXPORT_HEADER)
+        # Archived recognitions first, then the main table's, so ids stay in order.
+        # Rows are fetched and written in batches, so memory stays flat
+        for table in recognition_tables(session.get_bind()):
+            query = _export_query(table, **filters)
+            for row in session.execute(query.execution_options(yield_per=EXPORT_BATCH_SIZE)):
+                writer.writerow(row)
+                rows += 1
+    return rows
+
+async def export_recognitions(**filters):
+    """Write matching recognitions to a fresh temp file; the caller deletes it. Returns (path, rows)."""
+    suffix = ".csv.gz" if filters.get("compress") else ".csv"
+    fd, path = tempfile.mkstemp(prefix="recognitions-", suffix=suffix)
+    os.close(fd)
+    try:
+        rows = await run_in_session(_write_export, path, **filters)
+    except Exception:
+        os.remove(path)
+        raise
+    return path, rows
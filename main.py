@@ -1,7 +1,16 @@
 # main.py
+import hashlib
+import math
 import os
+import time
 import datetime
-from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
+from telegram import (
+    Update,
+    InlineKeyboardButton,
+    InlineKeyboardMarkup,
+    InlineQueryResultArticle,
+    InputTextMessageContent
+)
 from telegram.ext import (
     Application,
     CommandHandler,
@@ -9,97 +18,88 @@ from telegram.ext import (
     filters,
     ConversationHandler,
     CallbackQueryHandler, 
-    MessageHandler
+    InlineQueryHandler,
+    MessageHandler,
+    TypeHandler
 )
-from sqlalchemy import create_engine, Column, Integer, String, Float, Boolean, DateTime
-from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
-from dotenv import load_dotenv
+from telegram.request import HTTPXRequest
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
+from broadcast import Broadcaster
+from outbox import OutboxDispatcher
+from metrics import metrics, InstrumentedRequest
+from config import (
+    BOT_TOKEN,
+    ADMIN_IDS,
+    BOT_MODE,
+    WEBHOOK_URL,
+    WEBHOOK_LISTEN,
+    WEBHOOK_PORT,
+    WEBHOOK_PATH,
+    WEBHOOK_SECRET,
+    WEBHOOK_MAX_CONNECTIONS,
+    PERSISTENCE_FLUSH_INTERVAL,
+    INDEX_REFRESH_INTERVAL,
+    METRICS_PORT,
+    METRICS_LISTEN,
+    METRICS_FILE,
+    METRICS_FILE_INTERVAL,
+    ARCHIVE_DATABASE,
+    ARCHIVE_AFTER_DAYS
+)
+from cache import LeaderboardCache
+from persistence import DatabasePersistence, SharedConversationHandler
+from export import parse_export_args, export_recognitions
+from roster import ROSTER_MAX_BYTES, parse_roster
+from models import Tag
+from repository import (
+    NotFound,
+    IMPORT_CHUNK_SIZE,
+    InsufficientPoints,
+    next_run_after,
+    users,
+    recognitions,
+    rewards,
+    redemptions,
+    recurring_bonuses,
+    organizations,
+    broadcasts,
+    ledger,
+    outbox,
+    from_minor,
+    username_index,
+    group_directory,
+    user_cache,
+    warm_username_index
+)
 
 # --- Configuration ---
-load_dotenv()
-BOT_TOKEN = os.getenv("BOT_TOKEN")
-ADMIN_IDS = os.getenv("ADMIN_IDS", "").split(",")
-
-# --- Database Setup ---
-Base = declarative_base()
-class Organization(Base):
-    __tablename__ = 'organizations'
-    id = Column(Integer, primary_key=True)
-    name = Column(String)
-    admin_id = Column(String)  # Telegram ID of org admin
-    created_at = Column(DateTime, default=datetime.datetime.now)
-
-class UserOrganization(Base):
-    __tablename__ = 'user_organizations'
-    id = Column(Integer, primary_key=True)
-    user_id = Column(String)
-    org_id = Column(Integer)
-
-class User(Base):
-    __tablename__ = 'users'
-    id = Column(Integer, primary_key=True)
-    telegram_id = Column(String, unique=True)
-    username = Column(String)
-    points_balance = Column(Float, default=100.0)
-
-class Recognition(Base):
-    __tablename__ = 'recognitions'
-    id = Column(Integer, primary_key=True)
-    giver_id = Column(String)
-    receiver_id = Column(String)
-    points = Column(Float)
-    message = Column(String)
-    tags = Column(String)
-    group_id = Column(String)
-    created_at = Column(DateTime, default=datetime.datetime.now)
-
-class Reward(Base):
-    __tablename__ = 'rewards'
-    id = Column(Integer, primary_key=True)
-    name = Column(String)
-    description = Column(String)
-    points_required = Column(Float)
-    requires_approval = Column(Boolean, default=True)
-
-class RedemptionRequest(Base):
-    __tablename__ = 'redemption_requests'
-    id = Column(Integer, primary_key=True)
-    user_id = Column(String)
-    reward_id = Column(Integer)
-    status = Column(String, default='pending')
-    created_at = Column(DateTime, default=datetime.datetime.now)
-
-class RecurringBonus(Base):
-    __tablename__ = 'recurring_bonuses'
-    id = Column(Integer, primary_key=True)
-    giver_id = Column(String)
-    receiver_id = Column(String)
-    amount = Column(Float)
-    interval = Column(String)
-    next_run = Column(DateTime)
-    is_active = Column(Boolean, default=True)
-
-class Group(Base):
-    __tablename__ = 'groups'
-    id = Column(Integer, primary_key=True)
-    org_id = Column(Integer)
-    group_name = Column(String)
-    telegram_group_id = Column(String)
-    is_public = Column(Boolean, default=True)
-
-class Comment(Base):
-    __tablename__ = 'comments'
-    id = Column(Integer, primary_key=True)
-    recognition_id = Column(Integer)
-    user_id = Column(String)
-    text = Column(String)
-    created_at = Column(DateTime, default=datetime.datetime.now)
-
-engine = create_engine('sqlite:///bonusly.db')
-Base.metadata.create_all(engine)
-Session = sessionmaker(bind=engine)
+# Updates handled at once; DB work is bounded separately by the repository thread pool
+CONCURRENT_UPDATES = 64
+LEADERBOARD_CACHE_TTL = 300  # seconds
+BROADCAST_PROGRESS_INTERVAL = 10  # seconds between progress edits
+HISTORY_PAGE_SIZE = 10
+SEARCH_PAGE_SIZE = 5
+SEARCHES_KEPT = 20  # per chat, for the paging buttons of recent /search results
+INLINE_RESULTS = 10
+PERF_TOP_HANDLERS = 10
+BOT_API_POOL_SIZE = 256  # python-telegram-bot's default for the main request
+SNAPSHOT_INTERVAL_HOURS = 24
+# Daily rollups older than this are folded into monthly ones; windows shorter than
+# a calendar month must fit inside it
+ROLLUP_DAILY_DAYS = 62
+
+LEDGER_LABELS = {
+    'opening': "Opening balance",
+    'transfer': "Recognition",
+    'grant': "Admin grant",
+    'reset': "Reset by admin",
+    'redemption': "Reward redemption",
+    'recurring': "Recurring bonus"
+}
+
+GLOBAL_SCOPE = 'global'
+leaderboard_cache = LeaderboardCache(ttl=LEADERBOARD_CACHE_TTL)
+notifier = OutboxDispatcher()
 
 # --- Scheduler Setup ---
 scheduler = AsyncIOScheduler()
@@ -110,174 +110,312 @@ ORG_NAME, ORG_PASSWORD, GROUP_INFO, CONFIRM_GROUP = range(4)
 ADD_USER_ORG, ADD_USER_DETAILS = range(2)
 
 # --- Helper Functions ---
-def get_or_create_user(telegram_id, username):
-    session = Session()
-    user = session.query(User).filter_by(telegram_id=str(telegram_id)).first()
-    if not user:
-        user = User(telegram_id=str(telegram_id), username=username)
-        session.add(user)
-        session.commit()
-    session.close()
-    return user
+def org_scope(org_id):
+    return f"org:{org_id}"
+
+def invalidate_leaderboards(group_id=None):
+    """Drop cached global boards, plus those of a group and its organization when given."""
+    org_id = group_directory.org_of(group_id) if group_id else None
+    leaderboard_cache.invalidate(GLOBAL_SCOPE, group_id, org_scope(org_id) if org_id else None)
+
+def chosen_org(update, args):
+    """Organization an org view is about: org=<id> if given, else the group's, else the caller's only one."""
+    for arg in args:
+        if arg.startswith("org="):
+            return int(arg[4:]) if arg[4:].isdigit() else None
+    org_id = group_directory.org_of(update.effective_chat.id)
+    if org_id is not None:
+        return org_id
+    orgs = username_index.orgs_of(update.effective_user.id)
+    return next(iter(orgs)) if len(orgs) == 1 else None
+
+def split_view_args(args):
+    """(org view requested, tag names, window names) from /leaderboard, /orgstats and /trending arguments."""
+    args = [arg.lower() for arg in args or []]
+    org_args = [arg for arg in args if arg == 'org' or arg.startswith('org=')]
+    tags = [arg for arg in args if arg.startswith('#')]
+    return bool(org_args), Tag.names(tags), [arg for arg in args if arg not in org_args and arg not in tags]
+
+def ranking_text(heading, top):
+    lines = [f"{idx}. @{username or 'Unknown'}: {round(total, 2)} points" for idx, (username, total) in enumerate(top, 1)]
+    return "\n".join([heading] + (lines or ["No recognitions in this period"])) + "\n"
 
 def is_admin(user_id: str) -> bool:
     return str(user_id) in ADMIN_IDS
 
-def get_org_groups(org_id):
-    session = Session()
-    groups = session.query(Group).filter_by(org_id=org_id).all()
-    session.close()
-    return groups
-
-def get_user_organizations(user_id):
-    session = Session()
-    orgs = session.query(Organization).filter_by(admin_id=str(user_id)).all()
-    session.close()
-    return orgs
+def user_not_found_text(error):
+    text = "❌ User not found"
+    suggestions = getattr(error, 'suggestions', None)
+    if suggestions:
+        text += "\n🤔 Did you mean " + ", ".join(f"@{name}" for name in suggestions) + "?"
+    return text
+
+# --- Notifications ---
+# Each returns (chat_id, kind, text, details) tuples; repositories queue them in the
+# outbox within the transaction that changed the balances they describe. details
+# feeds the digest that merges notifications arriving close together.
+def bonus_notifications(giver, receiver, recognition):
+    return [
+        (receiver.telegram_id, 'bonus_received',
+         f"🎉 You received {recognition.points} points from @{giver.username}!\n"
+         f"Message: {recognition.message}\n"
+         f"Your new balance: {receiver.points_balance}",
+         {"points": recognition.points, "from": giver.username, "message": recognition.message,
+          "balance": receiver.points_balance}),
+        (giver.telegram_id, 'bonus_sent',
+         f"✅ You gave {recognition.points} points to @{receiver.username}!\n"
+         f"Your new balance: {giver.points_balance}",
+         None)
+    ]
+
+def recurring_notifications(giver, receiver, bonus):
+    return [
+        (giver.telegram_id, 'recurring_sent', f"♻️ Sent recurring {bonus.amount} points to @{receiver.username}", None),
+        (receiver.telegram_id, 'recurring_received', f"♻️ Received {bonus.amount} points from @{giver.username}",
+         {"points": bonus.amount, "from": giver.username, "message": f"Recurring bonus ({bonus.interval})"})
+    ]
+
+def redemption_request_notifications(user, reward, request):
+    if request.status != 'pending':
+        return []
+    return [
+        (admin_id, 'redemption_request', f"🆕 Redemption request #{request.id} from @{user.username}", None)
+        for admin_id in ADMIN_IDS if admin_id
+    ]
+
+def redemption_approved_notifications(user, reward, request):
+    return [(user.telegram_id, 'redemption_approved', f"🎉 Your {reward.name} redemption was approved!", None)]
+
+def points_added_notifications(user, amount):
+    return [(user.telegram_id, 'points_added', f"🎁 Admin added {amount} points to your account!\nNew balance: {user.points_balance}", None)]
+
+def points_reset_notifications(user):
+    return [(user.telegram_id, 'points_reset', "🔄 Your points have been reset to 0 by admin", None)]
+
+# --- Lifecycle ---
+metrics_server = None
+
+async def start_background(application):
+    global metrics_server
+    notifier.start(application.bot)
+    if METRICS_PORT:
+        metrics_server = await metrics.serve(METRICS_LISTEN, METRICS_PORT)
+
+async def stop_background(application):
+    await notifier.stop()
+    if metrics_server:
+        metrics_server.close()
+        await metrics_server.wait_closed()
+
+def write_metrics_file():
+    metrics.write_file(METRICS_FILE)
+
+async def snapshot_balances():
+    written = await ledger.snapshot()
+    print(f"Snapshotted {written} balances")
+
+async def compact_rollups():
+    before = (datetime.date.today() - datetime.timedelta(days=ROLLUP_DAILY_DAYS)).replace(day=1)
+    while True:
+        compacted = await recognitions.compact_rollups(before)
+        if compacted is None:
+            break
+        month, rows = compacted
+        print(f"Compacted {rows} daily rollups of {month:%Y-%m}")
+
+async def archive_recognitions():
+    before = datetime.date.today() - datetime.timedelta(days=ARCHIVE_AFTER_DAYS)
+    while True:
+        archived = await recognitions.archive_month(before)
+        if archived is None:
+            break
+        month, moved, comments = archived
+        print(f"Archived {moved} recognitions and {comments} comments of {month:%Y-%m}")
 
 async def process_recurring_bonuses():
-    session = Session()
     now = datetime.datetime.now()
-    try:
-        bonuses = session.query(RecurringBonus).filter(
-            RecurringBonus.next_run <= now,
-            RecurringBonus.is_active == True
-        ).all()
-        for bonus in bonuses:
-            giver = session.query(User).filter_by(telegram_id=bonus.giver_id).first()
-            receiver = session.query(User).filter_by(telegram_id=bonus.receiver_id).first()
-            if not giver or not receiver:
-                continue
-            if giver.points_balance < bonus.amount:
-                continue
-            
-            giver.points_balance -= bonus.amount
-            receiver.points_balance += bonus.amount
-            
-            session.add(Recognition(
-                giver_id=bonus.giver_id,
-                receiver_id=bonus.receiver_id,
-                points=bonus.amount,
-                message=f"Recurring bonus ({bonus.interval})",
-                group_id=None
-            ))
-            
-            if bonus.interval == 'daily':
-                bonus.next_run = now + datetime.timedelta(days=1)
-            elif bonus.interval == 'weekly':
-                bonus.next_run = now + datetime.timedelta(weeks=1)
-            elif bonus.interval == 'monthly':
-                bonus.next_run = now.replace(month=now.month + 1)
-            
-            session.commit()
-            
-            await app.bot.send_message(
-                chat_id=giver.telegram_id,
-                text=f"♻️ Sent recurring {bonus.amount} points to @{receiver.username}"
-            )
-            await app.bot.send_message(
-                chat_id=receiver.telegram_id,
-                text=f"♻️ Received {bonus.amount} points from @{giver.username}"
-            )
-    finally:
-        session.close()
+    after_id = 0
+    while True:
+        after_id, paid = await recurring_bonuses.process_due_batch(now, after_id, notify=recurring_notifications)
+        if after_id is None:
+            break
+        if paid:
+            leaderboard_cache.invalidate(GLOBAL_SCOPE)
+            notifier.wake()
+
+async def run_broadcast(bot, broadcast, status):
+    last_report = 0.0
+
+    async def report_progress(sent, failed):
+        nonlocal last_report
+        if time.monotonic() - last_report < BROADCAST_PROGRESS_INTERVAL:
+            return
+        last_report = time.monotonic()
+        try:
+            await status.edit_text(f"📢 Broadcast #{broadcast.id}: {sent + failed}/{broadcast.total} processed, {failed} failed")
+        except Exception as e:
+            print(f"Could not update broadcast progress: {e}")
+
+    sent, failed = await Broadcaster(bot).run(broadcast, report_progress)
+    await status.edit_text(f"✅ Announcement sent to {sent} users ({failed} failed)")
+
+async def resume_broadcasts(context: ContextTypes.DEFAULT_TYPE):
+    for broadcast in await broadcasts.unfinished():
+        status = await context.bot.send_message(
+            chat_id=broadcast.admin_id,
+            text=f"📢 Resuming broadcast #{broadcast.id} after restart"
+        )
+        context.application.create_task(run_broadcast(context.bot, broadcast, status))
 
 # --- Bot Commands ---
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    session = Session()
-    try:
-        user = get_or_create_user(update.effective_user.id, update.effective_user.username)
-        # Refresh the user in a new session context
-        user = session.merge(user)
-        help_text = (
-            f"🌟 Welcome {user.username}! Balance: {user.points_balance} points\n\n"
-            "Commands:\n"
-            "/bonus @user <amount> #tag <message> - Give points\n"
-            "/recognize - Post recognition to a group\n"
-            "/balance - Check balance\n"
-            "/leaderboard - Group/Global leaderboard\n"
-            "/rewards - Available rewards\n"
-            "/redeem <reward_id> - Redeem points\n"
-            "/recurring @user <amount> <interval> - Set recurring bonus"
-        )
-        
-        if is_admin(str(update.effective_user.id)):
-            help_text += (
-        "\n\n🔒 Admin Commands:\n"
-        "/addpoints @user <amount>\n"
-        "/reset @user\n"
-        "/announce <message>\n"
-        "/userinfo @user\n"
-        "/export\n"
-        "/adduser <telegram_id> @username\n"
-        "/approve <request_id>\n"
-        "/addorg - Create new organization\n"
-        "/org_adduser - Add user to organization\n"
-        "/list_orgs - Show all organizations\n"
-        "/org_manage - Manage organization settings"
+    user = await users.get_or_create(update.effective_user.id, update.effective_user.username)
+    help_text = (
+        f"🌟 Welcome {user.username}! Balance: {user.points_balance} points\n\n"
+        "Commands:\n"
+        "/bonus @user <amount> #tag <message> - Give points\n"
+        "/recognize - Post recognition to a group\n"
+        "/balance [YYYY-MM-DD] - Check balance, now or at a past date\n"
+        "/history - Points history\n"
+        "/leaderboard [#tag] [org] [week|month|YYYY-MM] - Group, organization or global leaderboard\n"
+        "/orgstats [week|month|YYYY-MM] - Your organization's activity\n"
+        "/trending [org] [week|month|YYYY-MM] - Most used tags\n"
+        "/tags [@user] - Tags someone is recognized for\n"
+        "/search <words> - Find recognitions and comments; end a word with * to match its prefix\n"
+        "/rewards - Available rewards\n"
+        "/redeem <reward_id> - Redeem points\n"
+        "/recurring @user <amount> <interval> - Set recurring bonus"
     )
-        await update.message.reply_text(help_text)
-    finally:
-        session.close()
 
-async def give_bonus(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    args = context.args
-    if len(args) < 4:
-        await update.message.reply_text("❌ Format: /bonus @user <amount> #tag <message>")
-        return
+    if is_admin(str(update.effective_user.id)):
+        help_text += (
+    "\n\n🔒 Admin Commands:\n"
+    "/addpoints @user <amount>\n"
+    "/reset @user\n"
+    "/announce <message>\n"
+    "/userinfo @user\n"
+    "/export [from=YYYY-MM-DD] [to=YYYY-MM-DD] [group=<chat_id>] [org=<org_id>] [gz]\n"
+    "/rebuild_leaderboards - Recompute group leaderboards\n"
+    "/outbox - Notification delivery status\n"
+    "/perf - Handler latency, DB and Bot API usage\n"
+    "/adduser <telegram_id> @username\n"
+    "/approve <request_id>\n"
+    "/addorg - Create new organization\n"
+    "/import <org_id> - Caption of a CSV/JSON roster to enroll its members\n"
+    "/linkgroup <org_id> - Count this group towards an organization\n"
+    "/org_adduser - Add user to organization\n"
+    "/list_orgs - Show all organizations\n"
+    "/org_manage - Manage organization settings"
+)
+    await update.message.reply_text(help_text)
 
-    receiver_username = args[0].lstrip("@")
-    amount = float(args[1])
-    tags = [arg for arg in args[2:] if arg.startswith("#")]
-    message = " ".join([arg for arg in args[2:] if not arg.startswith("#")])
-    group_id = str(update.effective_chat.id) if update.effective_chat.type in ['group', 'supergroup'] else None
+async def balance(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    user = await users.get_or_create(update.effective_user.id, update.effective_user.username)
+    if not context.args:
+        await update.message.reply_text(f"💰 Balance: {user.points_balance}")
+        return
 
-    session = Session()
     try:
-        giver = get_or_create_user(update.effective_user.id, update.effective_user.username)
-        receiver = session.query(User).filter_by(username=receiver_username).first()
-
-        if not receiver:
-            await update.message.reply_text("❌ User not found")
-            return
-        if giver.points_balance < amount:
-            await update.message.reply_text("❌ Insufficient points")
-            return
-
-        giver.points_balance -= amount
-        receiver.points_balance += amount
-        
-        recognition = Recognition(
-            giver_id=str(giver.telegram_id),
-            receiver_id=str(receiver.telegram_id),
-            points=amount,
-            message=message,
-            tags=",".join(tags),
-            group_id=group_id
-        )
-        session.add(recognition)
-        session.commit()
-        
-        response = f"🎉 Gave {amount} points to @{receiver_username}"
-        if tags:
-            response += f"\n🏷 Tags: {', '.join(tags)}"
-        response += f"\n📝 Message: {message}"
-        
-        await update.message.reply_text(response)
-        await context.bot.send_message(
-            chat_id=receiver.telegram_id,
-            text=f"🎉 Received {amount} points from @{giver.username}\n📝 {message}"
-        )
-    finally:
-        session.close()
+        day = datetime.datetime.strptime(context.args[0], "%Y-%m-%d")
+    except ValueError:
+        await update.message.reply_text("❌ Usage: /balance [YYYY-MM-DD]")
+        return
+    points = await ledger.balance_at(user.telegram_id, day + datetime.timedelta(days=1))
+    await update.message.reply_text(f"💰 Balance at end of {context.args[0]}: {points}")
+
+async def render_history(user_id, before_id=None):
+    entries = await ledger.history(user_id, before_id, limit=HISTORY_PAGE_SIZE)
+    if not entries:
+        return "📜 No more history" if before_id else "📜 No points history yet", None
+
+    response = "📜 Points history:\n"
+    for entry, counterparty in entries:
+        line = f"{entry.created_at:%Y-%m-%d %H:%M} {from_minor(entry.amount):+} {LEDGER_LABELS.get(entry.kind, entry.kind)}"
+        if counterparty:
+            line += f" @{counterparty}"
+        response += line + "\n"
+
+    markup = None
+    if len(entries) == HISTORY_PAGE_SIZE:
+        markup = InlineKeyboardMarkup([[InlineKeyboardButton("⬅️ Older", callback_data=f"history_{entries[-1][0].id}")]])
+    return response, markup
+
+async def history(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    user = await users.get_or_create(update.effective_user.id, update.effective_user.username)
+    response, markup = await render_history(user.telegram_id)
+    await update.message.reply_text(response, reply_markup=markup)
+
+def search_scope(user_id, chat):
+    """(group ids, user id) a search may look in; (None, None) is everything.
+
+    In a group only that group's recognitions are searched, since results are
+    posted there. In private it is the caller's organizations' groups and
+    whatever they took part in, or everything for bot admins.
+    """
+    if chat.type in ['group', 'supergroup']:
+        return [str(chat.id)], None
+    if is_admin(user_id):
+        return None, None
+    group_ids = [g for org_id in username_index.orgs_of(user_id) for g in group_directory.groups(org_id)]
+    return group_ids, user_id
+
+def remember_search(chat_data, terms):
+    """A short id for terms, kept in the chat's data so anyone paging its results finds them."""
+    search_id = hashlib.sha1(terms.encode()).hexdigest()[:12]
+    searches = chat_data.setdefault('searches', {})
+    searches.pop(search_id, None)
+    searches[search_id] = terms
+    while len(searches) > SEARCHES_KEPT:
+        searches.pop(next(iter(searches)))
+    return search_id
+
+async def render_search(user_id, chat, terms, search_id, offset=0):
+    group_ids, member_id = search_scope(user_id, chat)
+    found = await recognitions.search(terms, group_ids, member_id, offset, SEARCH_PAGE_SIZE)
+    if found is None:
+        return "❌ Search isn't available on this database", None
+    hits, usernames, more = found
+    if not hits:
+        return "🔍 No more results" if offset else f"🔍 Nothing found for: {terms}", None
+
+    def name(telegram_id):
+        return f"@{usernames.get(telegram_id) or 'Unknown'}"
+
+    lines = [f"🔍 Results for: {terms}"]
+    for idx, (recognition, comment, snippet) in enumerate(hits, offset + 1):
+        if recognition:
+            about = f"{name(recognition.giver_id)} → {name(recognition.receiver_id)}, {round(recognition.points, 2)} points"
+        if comment:
+            heading = f"💬 {name(comment.user_id)} on {about}" if recognition else f"💬 {name(comment.user_id)}"
+            when = comment.created_at
+        else:
+            heading, when = about, recognition.created_at
+        lines.append(f"{idx}. {heading} ({when:%Y-%m-%d})\n   {snippet}")
+
+    buttons = []
+    if offset:
+        buttons.append(InlineKeyboardButton("⬅️ Previous", callback_data=f"search_{search_id}_{max(0, offset - SEARCH_PAGE_SIZE)}"))
+    if more:
+        buttons.append(InlineKeyboardButton("More ➡️", callback_data=f"search_{search_id}_{offset + SEARCH_PAGE_SIZE}"))
+    return "\n".join(lines), InlineKeyboardMarkup([buttons]) if buttons else None
+
+async def search(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    terms = " ".join(context.args)
+    if not terms:
+        await update.message.reply_text("❌ Usage: /search <words>, e.g. /search release migr*")
+        return
+    # Callback data is capped at 64 bytes, so the paging buttons carry an id for the terms
+    search_id = remember_search(context.chat_data, terms)
+    response, markup = await render_search(update.effective_user.id, update.effective_chat, terms, search_id)
+    await update.message.reply_text(response, reply_markup=markup)
 
 # --- Cross-Group Recognition Flow ---
 async def start_cross_group_bonus(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    user_orgs = get_user_organizations(update.effective_user.id)
+    user_orgs = await organizations.administered_by(update.effective_user.id)
     if not user_orgs:
         await update.message.reply_text("❌ You don't belong to any organizations")
         return ConversationHandler.END
-    
+
     buttons = [[InlineKeyboardButton(org.name, callback_data=f"org_{org.id}")] for org in user_orgs]
     await update.message.reply_text(
         "🏢 Select your organization:",
@@ -289,8 +427,8 @@ async def org_chosen(update: Update, context: ContextTypes.DEFAULT_TYPE):
     query = update.callback_query
     org_id = int(query.data.split("_")[1])
     context.user_data['org_id'] = org_id
-    
-    groups = get_org_groups(org_id)
+
+    groups = await organizations.groups(org_id)
     buttons = [[InlineKeyboardButton(group.group_name, callback_data=f"group_{group.id}")] for group in groups]
     await query.edit_message_text(
         "📚 Select a group:",
@@ -302,22 +440,25 @@ async def group_chosen(update: Update, context: ContextTypes.DEFAULT_TYPE):
     query = update.callback_query
     group_id = int(query.data.split("_")[1])
     context.user_data['group_id'] = group_id
-    
+
     await query.edit_message_text("👤 Please mention or enter the username of the person you want to recognize:")
     return RECEIVER_CHOOSE
 
 async def receiver_chosen(update: Update, context: ContextTypes.DEFAULT_TYPE):
     receiver_username = update.message.text.lstrip("@")
     context.user_data['receiver'] = receiver_username
-    
+
     await update.message.reply_text("💰 Enter the amount of points to give:")
     return AMOUNT_INPUT
 
 async def amount_received(update: Update, context: ContextTypes.DEFAULT_TYPE):
     try:
         amount = float(update.message.text)
+        if not (math.isfinite(amount) and amount > 0):
+            await update.message.reply_text("❌ Amount must be a positive number. Please try again:")
+            return AMOUNT_INPUT
         context.user_data['amount'] = amount
-        
+
         await update.message.reply_text("📝 Write your recognition message:")
         return MESSAGE_INPUT
     except ValueError:
@@ -327,53 +468,47 @@ async def amount_received(update: Update, context: ContextTypes.DEFAULT_TYPE):
 async def message_received(update: Update, context: ContextTypes.DEFAULT_TYPE):
     message = update.message.text
     context.user_data['message'] = message
-    
-    session = Session()
-    try:
-        user_data = context.user_data
-        giver = get_or_create_user(update.effective_user.id, update.effective_user.username)
-        receiver = session.query(User).filter_by(username=user_data['receiver']).first()
-        group = session.query(Group).get(user_data['group_id'])
-
-        if not receiver or not group:
-            await update.message.reply_text("❌ Error: User or group not found")
-            return ConversationHandler.END
-
-        if giver.points_balance < user_data['amount']:
-            await update.message.reply_text("❌ Insufficient points")
-            return ConversationHandler.END
+    user_data = context.user_data
 
-        giver.points_balance -= user_data['amount']
-        receiver.points_balance += user_data['amount']
+    group = await organizations.get_group(user_data['group_id'])
+    if not group:
+        await update.message.reply_text("❌ Error: User or group not found")
+        return ConversationHandler.END
 
-        recognition = Recognition(
-            giver_id=str(giver.telegram_id),
-            receiver_id=str(receiver.telegram_id),
-            points=user_data['amount'],
-            message=message,
-            group_id=group.telegram_group_id
+    try:
+        giver, receiver, recognition = await recognitions.give(
+            update.effective_user.id,
+            update.effective_user.username,
+            user_data['receiver'],
+            user_data['amount'],
+            message,
+            group_id=group.telegram_group_id,
+            notify=bonus_notifications
         )
-        session.add(recognition)
-        session.commit()
-
-        keyboard = [
-            [
-                InlineKeyboardButton("👍", callback_data=f"react_{recognition.id}_like"),
-                InlineKeyboardButton("💬 Comment", callback_data=f"comment_{recognition.id}")
-            ]
+    except NotFound as e:
+        await update.message.reply_text(user_not_found_text(e))
+        return ConversationHandler.END
+    except InsufficientPoints:
+        await update.message.reply_text("❌ Insufficient points")
+        return ConversationHandler.END
+    invalidate_leaderboards(group.telegram_group_id)
+    notifier.wake()
+
+    keyboard = [
+        [
+            InlineKeyboardButton("👍", callback_data=f"react_{recognition.id}_like"),
+            InlineKeyboardButton("💬 Comment", callback_data=f"comment_{recognition.id}")
         ]
+    ]
 
-        msg_text = f"🎉 Recognition in {group.group_name}!\nFrom: @{giver.username}\nTo: @{receiver.username}\nAmount: {user_data['amount']}\nMessage: {message}"
-        await context.bot.send_message(
-            chat_id=group.telegram_group_id,
-            text=msg_text,
-            reply_markup=InlineKeyboardMarkup(keyboard)
-        )
+    msg_text = f"🎉 Recognition in {group.group_name}!\nFrom: @{giver.username}\nTo: @{receiver.username}\nAmount: {user_data['amount']}\nMessage: {message}"
+    await context.bot.send_message(
+        chat_id=group.telegram_group_id,
+        text=msg_text,
+        reply_markup=InlineKeyboardMarkup(keyboard)
+    )
 
-        await update.message.reply_text("✅ Recognition posted successfully!")
-        
-    finally:
-        session.close()
+    await update.message.reply_text("✅ Recognition posted successfully!")
     return ConversationHandler.END
 
 # --- Interactive Features ---
@@ -381,22 +516,18 @@ async def button_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
     query = update.callback_query
     await query.answer()
     data = query.data.split("_")
-    
+
     if data[0] == "react":
         recognition_id = data[1]
         reaction_type = data[2]
-        user = get_or_create_user(query.from_user.id, query.from_user.username)
-        
-        session = Session()
-        try:
-            recognition = session.query(Recognition).get(recognition_id)
-            if recognition:
-                await query.edit_message_reply_markup(reply_markup=InlineKeyboardMarkup([[
-                    InlineKeyboardButton(f"👍 {reaction_type}", callback_data="dummy"),
-                    InlineKeyboardButton("💬 Comment", callback_data=f"comment_{recognition_id}")
-                ]]))
-        finally:
-            session.close()
+        await users.get_or_create(query.from_user.id, query.from_user.username)
+
+        recognition = await recognitions.get(recognition_id)
+        if recognition:
+            await query.edit_message_reply_markup(reply_markup=InlineKeyboardMarkup([[
+                InlineKeyboardButton(f"👍 {reaction_type}", callback_data="dummy"),
+                InlineKeyboardButton("💬 Comment", callback_data=f"comment_{recognition_id}")
+            ]]))
 
     elif data[0] == "comment":
         recognition_id = data[1]
@@ -406,165 +537,291 @@ async def button_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
             text="💬 Enter your comment:"
         )
 
+    elif data[0] == "history":
+        response, markup = await render_history(query.from_user.id, int(data[1]))
+        await query.edit_message_text(response, reply_markup=markup)
+
+    elif data[0] == "search":
+        terms = context.chat_data.get('searches', {}).get(data[1]) if len(data) == 3 else None
+        if not terms:
+            await query.edit_message_text("🔍 This search has expired; run /search again")
+            return
+        response, markup = await render_search(query.from_user.id, query.message.chat, terms, data[1], int(data[2]))
+        await query.edit_message_text(response, reply_markup=markup)
+
 async def handle_comment(update: Update, context: ContextTypes.DEFAULT_TYPE):
     recognition_id = context.user_data.get('comment_recognition')
-    user = get_or_create_user(update.effective_user.id, update.effective_user.username)
-    
-    session = Session()
-    try:
-        comment = Comment(
-            recognition_id=recognition_id,
-            user_id=str(user.telegram_id),
-            text=update.message.text
+    user, recognition = await recognitions.add_comment(
+        recognition_id,
+        update.effective_user.id,
+        update.effective_user.username,
+        update.message.text
+    )
+
+    if recognition and recognition.group_id:
+        await context.bot.send_message(
+            chat_id=recognition.group_id,
+            text=f"💬 @{user.username}: {update.message.text}",
+            reply_to_message_id=recognition.id
         )
-        session.add(comment)
-        session.commit()
-
-        recognition = session.query(Recognition).get(recognition_id)
-        if recognition and recognition.group_id:
-            await context.bot.send_message(
-                chat_id=recognition.group_id,
-                text=f"💬 @{user.username}: {update.message.text}",
-                reply_to_message_id=recognition.id
-            )
-        
-        await update.message.reply_text("💬 Comment posted!")
-    finally:
-        session.close()
+
+    await update.message.reply_text("💬 Comment posted!")
+
+async def inline_user_search(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    query = update.inline_query
+    prefix = query.query.strip().lstrip("@")
+    # Suggest colleagues from the caller's organizations, or everyone if they have none
+    org_ids = username_index.orgs_of(query.from_user.id)
+    results = [
+        InlineQueryResultArticle(
+            id=username,
+            title=f"@{username}",
+            input_message_content=InputTextMessageContent(f"@{username}")
+        )
+        for username in username_index.complete(prefix, org_ids, limit=INLINE_RESULTS)
+    ]
+    await query.answer(results, cache_time=5, is_personal=True)
+
+def leaderboard_window(name, today):
+    """(start, end, title) of a /leaderboard window: week, month or YYYY-MM. Raises ValueError."""
+    if name == 'week':
+        return today - datetime.timedelta(days=6), today + datetime.timedelta(days=1), "last 7 days"
+    if name == 'month':
+        return today.replace(day=1), today + datetime.timedelta(days=1), today.strftime("%B %Y")
+    start = datetime.datetime.strptime(name, "%Y-%m").date()
+    return start, (start + datetime.timedelta(days=32)).replace(day=1), start.strftime("%B %Y")
+
 async def leaderboard(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    session = Session()
+    chat_id = str(update.effective_chat.id)
+    is_group = update.effective_chat.type in ['group', 'supergroup']
+    scope = chat_id if is_group else GLOBAL_SCOPE
+    org_view, tags, windows = split_view_args(context.args)
+    view = windows[0] if windows else None
     try:
-        chat_id = str(update.effective_chat.id)
-        is_group = update.effective_chat.type in ['group', 'supergroup']
-        
-        if is_group:
-            recognitions = session.query(Recognition).filter_by(group_id=chat_id).all()
-            points = {}
-            for rec in recognitions:
-                points[rec.receiver_id] = points.get(rec.receiver_id, 0.0) + rec.points
-            sorted_users = sorted(points.items(), key=lambda x: x[1], reverse=True)[:10]
+        if len(windows) > 1 or len(tags) > 1:
+            raise ValueError(windows)
+        if view:
+            start, end, title = leaderboard_window(view, datetime.date.today())
+    except ValueError:
+        await update.message.reply_text("❌ Usage: /leaderboard [#tag] [org|org=<id>] [week|month|YYYY-MM]")
+        return
+    org_id = None
+    if org_view:
+        org_id = chosen_org(update, context.args)
+        if org_id is None:
+            await update.message.reply_text("❌ Which organization? Use /leaderboard org=<id>")
+            return
+        scope = org_scope(org_id)
+    tag = tags[0] if tags else None
+    cache_view = f"#{tag} {view}" if tag else view
+
+    response = leaderboard_cache.get(scope, cache_view)
+    if response is None:
+        generation = leaderboard_cache.generation(scope)
+        if tag:
+            response = await tag_leaderboard_text(
+                tag, org_id, chat_id if is_group else None, (start, end, title) if view else None
+            )
+            if response is None:
+                await update.message.reply_text("❌ Organization not found")
+                return
+        elif org_id is not None:
+            org = await organizations.get(org_id)
+            if not org:
+                await update.message.reply_text("❌ Organization not found")
+                return
+            # Every linked group ranked in one aggregate query, counting only the org's members
+            group_ids = group_directory.groups(org_id)
+            members = username_index.members(org_id)
+            if not group_ids:
+                top = []
+            elif view:
+                top = await recognitions.window_leaderboard(start, end, group_ids, members)
+            else:
+                top = await recognitions.org_leaderboard(group_ids, members)
+            response = ranking_text(f"🏆 {org.name} Leaderboard{', ' + title if view else ''}:", top)
+        elif view:
+            top = await recognitions.window_leaderboard(start, end, [chat_id] if is_group else None)
+            response = ranking_text(f"🏆 {'Group' if is_group else 'Global'} Leaderboard, {title}:", top)
+        elif is_group:
+            top = await recognitions.group_leaderboard(chat_id)
             response = "🏆 Group Leaderboard:\n"
-            for idx, (user_id, total) in enumerate(sorted_users, 1):
-                user = session.query(User).filter_by(telegram_id=user_id).first()
-                response += f"{idx}. @{user.username if user else 'Unknown'}: {total} points\n"
+            for idx, (username, total) in enumerate(top, 1):
+                response += f"{idx}. @{username or 'Unknown'}: {total} points\n"
         else:
-            top_users = session.query(User).order_by(User.points_balance.desc()).limit(10).all()
+            top_users = await users.top_by_balance()
             response = "🏆 Global Leaderboard:\n"
             for idx, user in enumerate(top_users, 1):
                 response += f"{idx}. @{user.username}: {user.points_balance} points\n"
-        
-        await update.message.reply_text(response)
-    finally:
-        session.close()
+        leaderboard_cache.put(scope, response, generation, cache_view)
+
+    await update.message.reply_text(response)
+
+async def tag_leaderboard_text(tag, org_id, chat_id, window):
+    """Ranking by points received with #tag in an organization, a group or everywhere; None if the org doesn't exist."""
+    start, end, title = window or (None, None, None)
+    if window:
+        start, end = datetime.datetime.combine(start, datetime.time()), datetime.datetime.combine(end, datetime.time())
+    if org_id is not None:
+        org = await organizations.get(org_id)
+        if not org:
+            return None
+        group_ids = group_directory.groups(org_id)
+        top = await recognitions.tag_leaderboard(tag, start, end, group_ids, username_index.members(org_id)) if group_ids else []
+        where = org.name
+    else:
+        top = await recognitions.tag_leaderboard(tag, start, end, [chat_id] if chat_id else None)
+        where = 'Group' if chat_id else 'Global'
+    return ranking_text(f"🏆 {where} Leaderboard for #{tag}{', ' + title if title else ''}:", top)
 
-async def list_rewards(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    session = Session()
+async def trending(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    org_view, _, windows = split_view_args(context.args)
     try:
-        rewards = session.query(Reward).all()
-        response = "🎁 Available Rewards:\n" if rewards else "No rewards available"
-        for reward in rewards:
-            response += f"\n🆔 {reward.id} {reward.name} ({reward.points_required} points)\n📝 {reward.description}\n"
-        await update.message.reply_text(response)
-    finally:
-        session.close()
+        if len(windows) > 1:
+            raise ValueError(windows)
+        start, end, title = leaderboard_window(windows[0] if windows else 'week', datetime.date.today())
+    except ValueError:
+        await update.message.reply_text("❌ Usage: /trending [org|org=<id>] [week|month|YYYY-MM]")
+        return
+    is_group = update.effective_chat.type in ['group', 'supergroup']
+    if org_view:
+        org_id = chosen_org(update, context.args)
+        org = await organizations.get(org_id) if org_id is not None else None
+        if not org:
+            await update.message.reply_text("❌ Which organization? Use /trending org=<id>")
+            return
+        group_ids, where = group_directory.groups(org_id), org.name
+    elif is_group:
+        group_ids, where = [str(update.effective_chat.id)], "this group"
+    else:
+        group_ids, where = None, "all groups"
+
+    top = await recognitions.trending_tags(
+        datetime.datetime.combine(start, datetime.time()), datetime.datetime.combine(end, datetime.time()), group_ids
+    ) if group_ids != [] else []
+    lines = [f"🔥 Trending tags in {where}, {title}:"]
+    lines += [f"{idx}. #{name}: {uses} recognitions, {round(points, 2)} points" for idx, (name, uses, points) in enumerate(top, 1)]
+    if not top:
+        lines.append("No tagged recognitions in this period")
+    await update.message.reply_text("\n".join(lines))
+
+async def tag_profile(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    username = context.args[0].lstrip("@") if context.args else update.effective_user.username
+    if not username:
+        await update.message.reply_text("❌ Usage: /tags [@user]")
+        return
+    try:
+        user, tags = await recognitions.tag_profile(username)
+    except NotFound as e:
+        await update.message.reply_text(user_not_found_text(e))
+        return
+    lines = [f"🏷 @{user.username} is recognized for:"]
+    lines += [f"#{name}: {uses} times, {round(points, 2)} points" for name, uses, points in tags]
+    if not tags:
+        lines.append("No tagged recognitions yet")
+    await update.message.reply_text("\n".join(lines))
+
+async def org_stats(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    _, _, windows = split_view_args(context.args)
+    try:
+        if len(windows) > 1:
+            raise ValueError(windows)
+        start, end, title = leaderboard_window(windows[0], datetime.date.today()) if windows else (None, None, "all time")
+    except ValueError:
+        await update.message.reply_text("❌ Usage: /orgstats [org=<id>] [week|month|YYYY-MM]")
+        return
+    org_id = chosen_org(update, context.args)
+    org = await organizations.get(org_id) if org_id is not None else None
+    if not org:
+        await update.message.reply_text("❌ Which organization? Use /orgstats org=<id>")
+        return
+
+    group_ids = group_directory.groups(org_id)
+    points, givers, receivers, by_group = (
+        await recognitions.group_stats(group_ids, start, end, org_id) if group_ids else (0, 0, 0, [])
+    )
+    names = {group.telegram_group_id: group.group_name for group in await organizations.groups(org_id)}
+    lines = [
+        f"📈 {org.name}, {title}",
+        f"Members: {len(username_index.members(org_id))} · Groups: {len(group_ids)}",
+        f"Points recognized: {round(points or 0, 2)}",
+        f"Givers: {givers} · Receivers: {receivers}"
+    ]
+    if by_group:
+        lines.append("Busiest groups:")
+        lines += [f"• {names.get(group_id) or group_id}: {round(total, 2)} points" for group_id, total in by_group[:5]]
+    await update.message.reply_text("\n".join(lines))
+
+async def link_group(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    if update.effective_chat.type not in ['group', 'supergroup'] or len(context.args) != 1 or not context.args[0].isdigit():
+        await update.message.reply_text("❌ Usage: /linkgroup <org_id>, sent in the group to link")
+        return
+    org_id = int(context.args[0])
+    user_id = str(update.effective_user.id)
+    org = await organizations.get(org_id)
+    if not org:
+        await update.message.reply_text("❌ Organization not found")
+        return
+    if not (is_admin(user_id) or org.admin_id == user_id):
+        await update.message.reply_text("❌ Only the organization's admin can link groups")
+        return
+
+    previous = group_directory.org_of(update.effective_chat.id)
+    await organizations.link_group(org_id, update.effective_chat.id, update.effective_chat.title)
+    leaderboard_cache.invalidate(org_scope(org_id), org_scope(previous) if previous else None)
+    await update.message.reply_text(f"✅ This group now counts towards '{org.name}'")
+
+async def list_rewards(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    all_rewards = await rewards.all()
+    response = "🎁 Available Rewards:\n" if all_rewards else "No rewards available"
+    for reward in all_rewards:
+        response += f"\n🆔 {reward.id} {reward.name} ({reward.points_required} points)\n📝 {reward.description}\n"
+    await update.message.reply_text(response)
 
 async def set_recurring_bonus(update: Update, context: ContextTypes.DEFAULT_TYPE):
     args = context.args
     if len(args) < 3:
         await update.message.reply_text("❌ Usage: /recurring @user <amount> <daily|weekly|monthly>")
         return
-    
+
     receiver_username = args[0].lstrip("@")
-    amount = float(args[1])
-    interval = args[2].lower()
-    
-    session = Session()
     try:
-        giver = get_or_create_user(update.effective_user.id, update.effective_user.username)
-        receiver = session.query(User).filter_by(username=receiver_username).first()
-        
-        if not receiver:
-            await update.message.reply_text("❌ User not found")
-            return
-            
-        if giver.points_balance < amount:
-            await update.message.reply_text("❌ Insufficient points")
-            return
-            
-        next_run = datetime.datetime.now()
-        if interval == 'daily':
-            next_run += datetime.timedelta(days=1)
-        elif interval == 'weekly':
-            next_run += datetime.timedelta(weeks=1)
-        elif interval == 'monthly':
-            next_run = next_run.replace(month=next_run.month + 1)
-        else:
-            await update.message.reply_text("❌ Invalid interval")
-            return
-            
-        recurring_bonus = RecurringBonus(
-            giver_id=str(giver.telegram_id),
-            receiver_id=str(receiver.telegram_id),
-            amount=amount,
-            interval=interval,
-            next_run=next_run
-        )
-        session.add(recurring_bonus)
-        session.commit()
-        
-        await update.message.reply_text(
-            f"✅ Set {interval} recurring bonus of {amount} points for @{receiver_username}"
-        )
-    finally:
-        session.close()
-
-async def add_points(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    if not is_admin(str(update.effective_user.id)):
-        await update.message.reply_text("❌ Admin only")
+        amount = float(args[1])
+    except ValueError:
+        await update.message.reply_text("❌ Invalid amount format")
         return
-
-    args = context.args
-    if len(args) < 2:
-        await update.message.reply_text("❌ Usage: /addpoints @user <amount>")
+    if not (math.isfinite(amount) and amount > 0):
+        await update.message.reply_text("❌ Amount must be a positive number")
         return
+    interval = args[2].lower()
 
-    username = args[0].lstrip("@")
-    amount = float(args[1])
-    
-    session = Session()
+    now = datetime.datetime.now()
     try:
-        user = session.query(User).filter_by(username=username).first()
-        if not user:
-            await update.message.reply_text("❌ User not found")
-            return
-        user.points_balance += amount
-        session.commit()
-        await update.message.reply_text(f"✅ Added {amount} points to @{username}")
-    finally:
-        session.close()
-
-async def reset_user(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    if not is_admin(str(update.effective_user.id)):
-        await update.message.reply_text("❌ Admin only")
+        next_run = next_run_after(interval, now)
+    except ValueError:
+        await update.message.reply_text("❌ Invalid interval")
         return
 
-    args = context.args
-    if not args:
-        await update.message.reply_text("❌ Usage: /reset @user")
+    try:
+        await recurring_bonuses.create(
+            update.effective_user.id,
+            update.effective_user.username,
+            receiver_username,
+            amount,
+            interval,
+            next_run,
+            anchor_day=now.day
+        )
+    except NotFound as e:
+        await update.message.reply_text(user_not_found_text(e))
+        return
+    except InsufficientPoints:
+        await update.message.reply_text("❌ Insufficient points")
         return
 
-    username = args[0].lstrip("@")
-    session = Session()
-    try:
-        user = session.query(User).filter_by(username=username).first()
-        if not user:
-            await update.message.reply_text("❌ User not found")
-            return
-        user.points_balance = 0
-        session.commit()
-        await update.message.reply_text(f"✅ Reset @{username}'s points to 0")
-    finally:
-        session.close()
+    await update.message.reply_text(
+        f"✅ Set {interval} recurring bonus of {amount} points for @{receiver_username}"
+    )
 
 async def announce(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if not is_admin(str(update.effective_user.id)):
@@ -576,72 +833,101 @@ async def announce(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await update.message.reply_text("❌ Usage: /announce <message>")
         return
 
-    session = Session()
-    try:
-        users = session.query(User).all()
-        for user in users:
-            try:
-                await context.bot.send_message(
-                    chat_id=user.telegram_id,
-                    text=f"📢 Admin Announcement: {message}"
-                )
-            except Exception as e:
-                print(f"Failed to message {user.username}: {e}")
-        await update.message.reply_text("✅ Announcement sent to all users")
-    finally:
-        session.close()
+    broadcast = await broadcasts.create(update.effective_user.id, f"📢 Admin Announcement: {message}")
+    status = await update.message.reply_text(f"📢 Broadcast #{broadcast.id} started for {broadcast.total} users")
+    context.application.create_task(run_broadcast(context.bot, broadcast, status))
 
-async def user_info(update: Update, context: ContextTypes.DEFAULT_TYPE):
+async def export_data(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if not is_admin(str(update.effective_user.id)):
         await update.message.reply_text("❌ Admin only")
         return
 
-    args = context.args
-    if not args:
-        await update.message.reply_text("❌ Usage: /userinfo @user")
+    try:
+        options = parse_export_args(context.args)
+    except ValueError:
+        await update.message.reply_text("❌ Usage: /export [from=YYYY-MM-DD] [to=YYYY-MM-DD] [group=<chat_id>] [org=<org_id>] [gz]")
         return
 
-    username = args[0].lstrip("@")
-    session = Session()
+    path, rows = await export_recognitions(**options)
     try:
-        user = session.query(User).filter_by(username=username).first()
-        if not user:
-            await update.message.reply_text("❌ User not found")
-            return
-        await update.message.reply_text(
-            f"👤 @{user.username}\n🆔 {user.telegram_id}\n💰 {user.points_balance} points"
-        )
+        with open(path, "rb") as f:
+            await update.message.reply_document(
+                document=f,
+                filename=os.path.basename(path),
+                caption=f"📊 Recognition Data Export ({rows} rows)"
+            )
     finally:
-        session.close()
+        os.remove(path)
 
-async def export_data(update: Update, context: ContextTypes.DEFAULT_TYPE):
+async def rebuild_leaderboards(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if not is_admin(str(update.effective_user.id)):
         await update.message.reply_text("❌ Admin only")
         return
 
-    session = Session()
-    try:
-        recognitions = session.query(Recognition).all()
-        csv_data = "Giver,Receiver,Points,Message\n"
-        for rec in recognitions:
-            csv_data += f"{rec.giver_id},{rec.receiver_id},{rec.points},{rec.message}\n"
-        
-        with open("recognitions.csv", "w") as f:
-            f.write(csv_data)
-        
-        await update.message.reply_document(
-            document="recognitions.csv",
-            caption="📊 Recognition Data Export"
+    rows = await recognitions.rebuild_group_points()
+    leaderboard_cache.clear()
+    await update.message.reply_text(f"✅ Rebuilt group leaderboards ({rows} entries)")
+
+async def outbox_status(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    if not is_admin(str(update.effective_user.id)):
+        await update.message.reply_text("❌ Admin only")
+        return
+
+    counts = await outbox.counts()
+    stats = notifier.stats()
+    await update.message.reply_text(
+        f"📬 Outbox: {counts.get('pending', 0)} pending, {counts.get('dead', 0)} dead-lettered\n"
+        f"This worker: {stats['sent']} sent, {stats['retried']} retried, {stats['dead']} dead-lettered\n"
+        f"Digests: {stats['digests']} sent, {stats['saved_calls']} API calls saved"
+    )
+
+async def perf(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    if not is_admin(str(update.effective_user.id)):
+        await update.message.reply_text("❌ Admin only")
+        return
+
+    uptime = int(time.time() - metrics.started)
+    lines = [f"📊 Performance over the last {uptime // 3600}h {uptime % 3600 // 60}m"]
+    for kind, title in (('handler', "Handlers"), ('job', "Jobs")):
+        seconds = metrics.histograms(f"rahmat_{kind}_seconds")
+        if not seconds:
+            continue
+        statements = metrics.histograms(f"rahmat_{kind}_sql_statements")
+        db_seconds = metrics.histograms(f"rahmat_{kind}_db_seconds")
+        lines.append(f"\n{title} (runs · p95 · errors · SQL/run · DB ms/run):")
+        for name, h in sorted(seconds.items(), key=lambda item: -item[1].count)[:PERF_TOP_HANDLERS]:
+            errors = metrics.counter(f"rahmat_{kind}_errors_total", **{kind: name})
+            lines.append(
+                f"{name}: {h.count} · ≤{h.quantile(0.95) * 1000:g} ms · {errors:g} · "
+                f"{statements[name].sum / h.count:.1f} · {db_seconds[name].sum / h.count * 1000:.1f}"
+            )
+    api = metrics.histograms("rahmat_bot_api_seconds")
+    if api:
+        calls = sum(h.count for h in api.values())
+        average = sum(h.sum for h in api.values()) / calls * 1000
+        lines.append(f"\nBot API: {calls} calls, {average:.0f} ms average")
+        lines += [
+            f"{method}: {h.count} · ≤{h.quantile(0.95) * 1000:g} ms p95"
+            for method, h in sorted(api.items(), key=lambda item: -item[1].count)[:PERF_TOP_HANDLERS]
+        ]
+    lines.append(
+        f"\nSQL: {metrics.counter('rahmat_sql_statements_total'):g} statements, "
+        f"{metrics.counter('rahmat_sql_seconds_total'):.1f} s"
+    )
+    for name, cache in (("Leaderboard cache", leaderboard_cache), ("User cache", user_cache)):
+        stats = cache.stats()
+        lines.append(
+            f"{name}: {stats['hit_rate']:.0%} hit rate "
+            f"({stats['hits']} hits, {stats['misses']} misses, {stats['entries']} entries)"
         )
-    finally:
-        session.close()
+    await update.message.reply_text("\n".join(lines))
 
 # --- Admin Commands ---
 async def add_org(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if not is_admin(update.effective_user.id):
         await update.message.reply_text("❌ Admin only command")
         return ConversationHandler.END
-    
+
     await update.message.reply_text("🏢 Enter organization name:")
     return ORG_NAME
 
@@ -654,7 +940,7 @@ async def org_password_received(update: Update, context: ContextTypes.DEFAULT_TY
     if update.message.text != os.getenv("ORG_ADMIN_PASSWORD"):
         await update.message.reply_text("❌ Invalid admin password")
         return ConversationHandler.END
-    
+
     await update.message.reply_text(
         "👥 Please add the bot to your group and send the group username/ID here\n"
         "(Make sure bot is admin in the group):"
@@ -665,16 +951,17 @@ async def group_info_received(update: Update, context: ContextTypes.DEFAULT_TYPE
     try:
         group_id = str(update.message.text)
         chat = await context.bot.get_chat(group_id)
-        
+
         # Verify bot is admin in the group
         admins = await context.bot.get_chat_administrators(group_id)
         bot_member = next((a for a in admins if a.user.id == context.bot.id), None)
-        
+
         if not bot_member or not bot_member.can_invite_users:
             await update.message.reply_text("❌ Bot needs admin privileges in the group")
             return ConversationHandler.END
-        
-        context.user_data['group_id'] = group_id
+
+        context.user_data['group_id'] = str(chat.id)
+        context.user_data['group_title'] = chat.title
         await update.message.reply_text(
             f"✅ Group verified: {chat.title}\n"
             "Should I import existing members? (Yes/No)"
@@ -687,54 +974,100 @@ async def group_info_received(update: Update, context: ContextTypes.DEFAULT_TYPE
 async def confirm_group_import(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if update.message.text.lower() == 'yes':
         try:
-            session = Session()
-            org = Organization(
-                name=context.user_data['org_name'],
-                admin_id=str(update.effective_user.id)
-            )
-            session.add(org)
-            session.commit()
-            
-            # Import group members
-            members = await context.bot.get_chat_members(context.user_data['group_id'])
-            imported = 0
-            
-            for member in members:
-                user = get_or_create_user(member.user.id, member.user.username)
-                session.add(UserOrganization(
-                    user_id=str(user.telegram_id),
-                    org_id=org.id
-                ))
-                imported += 1
-            
-            session.commit()
+            org = await organizations.create(context.user_data['org_name'], update.effective_user.id)
+            await organizations.link_group(org.id, context.user_data['group_id'], context.user_data.get('group_title'))
+            created, joined = await import_group_members(context.bot, org.id, context.user_data['group_id'])
             await update.message.reply_text(
-                f"✅ Organization '{org.name}' created\n"
-                f"Imported {imported} members from group"
+                f"✅ Organization '{org.name}' created (ID {org.id})\n"
+                f"Imported {joined} members from group ({created} new users)\n"
+                f"Telegram doesn't let bots list every group member; send a CSV or JSON roster "
+                f"with the caption /import {org.id} to add the rest"
             )
         except Exception as e:
             await update.message.reply_text(f"❌ Error: {str(e)}")
-        finally:
-            session.close()
     else:
         await update.message.reply_text("❌ Organization creation canceled")
-    
+
     return ConversationHandler.END
 
+async def import_in_chunks(org_id, members):
+    """Enroll (telegram_id, username) pairs IMPORT_CHUNK_SIZE per transaction; returns (new users, new memberships)."""
+    created = joined = 0
+    for start in range(0, len(members), IMPORT_CHUNK_SIZE):
+        chunk_created, chunk_joined = await organizations.import_members(org_id, members[start:start + IMPORT_CHUNK_SIZE])
+        created += chunk_created
+        joined += chunk_joined
+    return created, joined
+
+async def import_group_members(bot, org_id, chat_id):
+    """Enroll a group's administrators and everyone seen giving or receiving points there.
+
+    Those are all the members the Bot API lets a bot discover; the rest come from a roster upload.
+    """
+    admins = await bot.get_chat_administrators(chat_id)
+    created, joined = await import_in_chunks(org_id, [(a.user.id, a.user.username) for a in admins if not a.user.is_bot])
+    after = None
+    while True:
+        page = await recognitions.participants(chat_id, after)
+        if not page:
+            break
+        page_created, page_joined = await organizations.import_members(org_id, page)
+        created += page_created
+        joined += page_joined
+        after = page[-1][0]
+    return created, joined
+
+async def import_roster(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """/import <org_id> as the caption of a CSV/JSON roster, or as a reply to one."""
+    message = update.message
+    document = message.document or (message.reply_to_message.document if message.reply_to_message else None)
+    args = (message.caption or message.text or "").split()[1:]
+    if not document or len(args) != 1 or not args[0].isdigit():
+        await message.reply_text(
+            "❌ Usage: send a CSV or JSON roster with the caption /import <org_id>, or reply /import <org_id> to one\n"
+            "CSV columns: telegram_id,username"
+        )
+        return
+
+    org_id = int(args[0])
+    user_id = str(update.effective_user.id)
+    org = await organizations.get(org_id)
+    if not org:
+        await message.reply_text("❌ Organization not found")
+        return
+    if not (is_admin(user_id) or org.admin_id == user_id):
+        await message.reply_text("❌ Only the organization's admin can import members")
+        return
+    if document.file_size and document.file_size > ROSTER_MAX_BYTES:
+        await message.reply_text("❌ Roster too large (20 MB max)")
+        return
+
+    file = await context.bot.get_file(document.file_id)
+    try:
+        members = parse_roster(document.file_name or "", bytes(await file.download_as_bytearray()))
+    except ValueError as e:
+        await message.reply_text(f"❌ Could not read roster: {e}")
+        return
+
+    created, joined = await import_in_chunks(org_id, members)
+    leaderboard_cache.invalidate(org_scope(org_id))
+    await message.reply_text(
+        f"✅ Imported {len(members)} members into '{org.name}'\n"
+        f"{joined} newly enrolled ({created} new users), {len(members) - joined} already members"
+    )
+
 # Add User Conversation
 async def add_user(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if not is_admin(update.effective_user.id):
         await update.message.reply_text("❌ Admin only command")
         return ConversationHandler.END
-    
-    session = Session()
-    orgs = session.query(Organization).all()
-    session.close()
-    
+
+    orgs = await organizations.all()
+
     if not orgs:
         await update.message.reply_text("❌ No organizations exist yet")
         return ConversationHandler.END
-    
+
     buttons = [[InlineKeyboardButton(org.name, callback_data=f"org_{org.id}")] for org in orgs]
     await update.message.reply_text(
         "🏢 Select organization for the user:",
@@ -747,41 +1080,23 @@ async def org_selected(update: Update, context: ContextTypes.DEFAULT_TYPE):
     await query.answer()
     org_id = int(query.data.split("_")[1])
     context.user_data['org_id'] = org_id
-    
+
     await query.edit_message_text("👤 Enter user's Telegram username or ID:")
     return ADD_USER_DETAILS
 
 async def user_details_received(update: Update, context: ContextTypes.DEFAULT_TYPE):
     try:
-        user_input = update.message.text
-        session = Session()
-        
-        # Find or create user
-        if user_input.startswith("@"):
-            user = session.query(User).filter_by(username=user_input[1:]).first()
-        else:
-            user = session.query(User).filter_by(telegram_id=user_input).first()
-        
-        if not user:
-            await update.message.reply_text("❌ User not found. Create user first with /adduser")
-            return ConversationHandler.END
-        
-        # Add to organization
-        session.add(UserOrganization(
-            user_id=str(user.telegram_id),
-            org_id=context.user_data['org_id']
-        ))
-        session.commit()
-        
+        user = await organizations.add_member(context.user_data['org_id'], update.message.text)
+        leaderboard_cache.invalidate(org_scope(context.user_data['org_id']))
         await update.message.reply_text(
             f"✅ User @{user.username} added to organization\n"
             f"User ID: {user.telegram_id}"
         )
+    except NotFound:
+        await update.message.reply_text("❌ User not found. Create user first with /adduser")
     except Exception as e:
         await update.message.reply_text(f"❌ Error: {str(e)}")
-    finally:
-        session.close()
-    
+
     return ConversationHandler.END
 
 async def add_points(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -797,36 +1112,21 @@ async def add_points(update: Update, context: ContextTypes.DEFAULT_TYPE):
     try:
         username = args[0].lstrip("@")
         amount = float(args[1])
-        
-        if amount <= 0:
-            await update.message.reply_text("❌ Amount must be positive")
-            return
 
-        session = Session()
-        user = session.query(User).filter_by(username=username).first()
-        
-        if not user:
-            await update.message.reply_text("❌ User not found")
+        if not (math.isfinite(amount) and amount > 0):
+            await update.message.reply_text("❌ Amount must be a positive number")
             return
-            
-        user.points_balance += amount
-        session.commit()
-        
-        # Notify user
-        try:
-            await context.bot.send_message(
-                chat_id=user.telegram_id,
-                text=f"🎁 Admin added {amount} points to your account!\nNew balance: {user.points_balance}"
-            )
-        except Exception as e:
-            print(f"Could not notify user: {e}")
-        
+
+        await users.add_points(username, amount, notify=points_added_notifications)
+        leaderboard_cache.invalidate(GLOBAL_SCOPE)
+        notifier.wake()
+
         await update.message.reply_text(f"✅ Added {amount} points to @{username}")
-        
+
+    except NotFound as e:
+        await update.message.reply_text(user_not_found_text(e))
     except ValueError:
         await update.message.reply_text("❌ Invalid amount")
-    finally:
-        session.close()
 
 async def reset_user(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if not is_admin(str(update.effective_user.id)):
@@ -839,28 +1139,15 @@ async def reset_user(update: Update, context: ContextTypes.DEFAULT_TYPE):
         return
 
     username = args[0].lstrip("@")
-    session = Session()
     try:
-        user = session.query(User).filter_by(username=username).first()
-        if not user:
-            await update.message.reply_text("❌ User not found")
-            return
-            
-        user.points_balance = 0
-        session.commit()
-        
-        # Notify user
-        try:
-            await context.bot.send_message(
-                chat_id=user.telegram_id,
-                text="🔄 Your points have been reset to 0 by admin"
-            )
-        except Exception as e:
-            print(f"Could not notify user: {e}")
-            
-        await update.message.reply_text(f"✅ Reset @{username}'s points to 0")
-    finally:
-        session.close()
+        await users.reset(username, notify=points_reset_notifications)
+    except NotFound as e:
+        await update.message.reply_text(user_not_found_text(e))
+        return
+    leaderboard_cache.invalidate(GLOBAL_SCOPE)
+    notifier.wake()
+
+    await update.message.reply_text(f"✅ Reset @{username}'s points to 0")
 
 async def user_info(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if not is_admin(str(update.effective_user.id)):
@@ -873,24 +1160,19 @@ async def user_info(update: Update, context: ContextTypes.DEFAULT_TYPE):
         return
 
     username = args[0].lstrip("@")
-    session = Session()
     try:
-        user = session.query(User).filter_by(username=username).first()
-        if not user:
-            await update.message.reply_text("❌ User not found")
-            return
-            
-        recognitions = session.query(Recognition).filter_by(receiver_id=user.telegram_id).count()
-        
-        response = (
-            f"👤 User: @{user.username}\n"
-            f"🆔 ID: {user.telegram_id}\n"
-            f"💰 Balance: {user.points_balance}\n"
-            f"🏆 Total Recognitions: {recognitions}"
-        )
-        await update.message.reply_text(response)
-    finally:
-        session.close()
+        user, received = await users.info(username)
+    except NotFound as e:
+        await update.message.reply_text(user_not_found_text(e))
+        return
+
+    response = (
+        f"👤 User: @{user.username}\n"
+        f"🆔 ID: {user.telegram_id}\n"
+        f"💰 Balance: {user.points_balance}\n"
+        f"🏆 Total Recognitions: {received}"
+    )
+    await update.message.reply_text(response)
 
 # --- Enhanced Give Bonus with PM Notifications ---
 async def give_bonus(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -902,174 +1184,149 @@ async def give_bonus(update: Update, context: ContextTypes.DEFAULT_TYPE):
     try:
         receiver_username = args[0].lstrip("@")
         amount = float(args[1])
-        
-        if amount <= 0:
-            await update.message.reply_text("❌ Amount must be positive")
+
+        if not (math.isfinite(amount) and amount > 0):
+            await update.message.reply_text("❌ Amount must be a positive number")
             return
 
         tags = [arg for arg in args[2:] if arg.startswith("#")]
         message = " ".join([arg for arg in args[2:] if not arg.startswith("#")])
-        
-        session = Session()
-        giver = get_or_create_user(update.effective_user.id, update.effective_user.username)
-        receiver = session.query(User).filter_by(username=receiver_username).first()
-
-        if not receiver:
-            await update.message.reply_text("❌ User not found")
-            return
-            
-        if giver.points_balance < amount:
-            await update.message.reply_text("❌ Insufficient points")
-            return
+        group_id = str(update.effective_chat.id) if update.effective_chat.type in ['group', 'supergroup'] else None
 
         # Perform transaction
-        giver.points_balance -= amount
-        receiver.points_balance += amount
-        
-        recognition = Recognition(
-            giver_id=str(giver.telegram_id),
-            receiver_id=str(receiver.telegram_id),
-            points=amount,
-            message=message,
-            tags=",".join(tags)
+        giver, receiver, recognition = await recognitions.give(
+            update.effective_user.id,
+            update.effective_user.username,
+            receiver_username,
+            amount,
+            message,
+            tags=tags,
+            group_id=group_id,
+            notify=bonus_notifications
         )
-        session.add(recognition)
-        session.commit()
-        
-        # Notify receiver
-        try:
-            await context.bot.send_message(
-                chat_id=receiver.telegram_id,
-                text=f"🎉 You received {amount} points from @{giver.username}!\n"
-                     f"Message: {message}\n"
-                     f"Your new balance: {receiver.points_balance}"
-            )
-        except Exception as e:
-            print(f"Could not notify receiver: {e}")
-            
-        # Notify giver
-        try:
-            await context.bot.send_message(
-                chat_id=giver.telegram_id,
-                text=f"✅ You gave {amount} points to @{receiver_username}!\n"
-                     f"Your new balance: {giver.points_balance}"
-            )
-        except Exception as e:
-            print(f"Could not notify giver: {e}")
-            
+        invalidate_leaderboards(group_id)
+        notifier.wake()
+
         # Public response
-        response = f"🎉 @{giver.username} gave {amount} points to @{receiver_username}!"
+        response = f"🎉 @{giver.username} gave {amount} points to @{receiver.username}!"
         if tags:
             response += f"\n🏷 Tags: {', '.join(tags)}"
         response += f"\n📝 Message: {message}"
-        
+
         await update.message.reply_text(response)
-        
+
+    except NotFound as e:
+        await update.message.reply_text(user_not_found_text(e))
+    except InsufficientPoints:
+        await update.message.reply_text("❌ Insufficient points")
     except ValueError:
         await update.message.reply_text("❌ Invalid amount format")
     except Exception as e:
         await update.message.reply_text(f"❌ Error: {str(e)}")
-    finally:
-        session.close()
-    # Redemption functions 
+
+# Redemption functions
 async def redeem_reward(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    user = get_or_create_user(update.effective_user.id, update.effective_user.username)
     args = context.args
     if not args:
         await update.message.reply_text("❌ Usage: /redeem <reward_id>")
         return
-    
-    session = Session()
+
     try:
-        reward = session.query(Reward).get(args[0])
-        if not reward:
-            await update.message.reply_text("❌ Reward not found")
-            return
-            
-        if user.points_balance < reward.points_required:
-            await update.message.reply_text("❌ Insufficient points")
-            return
-            
-        request = RedemptionRequest(
-            user_id=str(user.telegram_id),
-            reward_id=reward.id
+        user, reward, request = await redemptions.request(
+            update.effective_user.id,
+            update.effective_user.username,
+            args[0],
+            notify=redemption_request_notifications
         )
-        session.add(request)
-        
-        if not reward.requires_approval:
-            user.points_balance -= reward.points_required
-            request.status = 'approved'
-            session.commit()
-            await update.message.reply_text(f"✅ Redeemed {reward.name}!")
-        else:
-            session.commit()
-            await update.message.reply_text("⏳ Reward request sent for approval")
-            for admin_id in ADMIN_IDS:
-                await context.bot.send_message(
-                    chat_id=admin_id,
-                    text=f"🆕 Redemption request #{request.id} from @{user.username}"
-                )
-    finally:
-        session.close()
+    except NotFound:
+        await update.message.reply_text("❌ Reward not found")
+        return
+    except InsufficientPoints:
+        await update.message.reply_text("❌ Insufficient points")
+        return
+
+    if request.status == 'approved':
+        leaderboard_cache.invalidate(GLOBAL_SCOPE)
+        await update.message.reply_text(f"✅ Redeemed {reward.name}!")
+    else:
+        notifier.wake()
+        await update.message.reply_text("⏳ Reward request sent for approval")
 
 async def approve_redemption(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if not is_admin(str(update.effective_user.id)):
         await update.message.reply_text("❌ Admin only")
         return
-    
+
     args = context.args
     if not args:
         await update.message.reply_text("❌ Usage: /approve <request_id>")
         return
-    
-    session = Session()
+
     try:
-        request = session.query(RedemptionRequest).get(args[0])
-        if not request or request.status != 'pending':
-            await update.message.reply_text("❌ Invalid request")
-            return
-            
-        user = session.query(User).filter_by(telegram_id=request.user_id).first()
-        reward = session.query(Reward).get(request.reward_id)
-        
-        if user.points_balance < reward.points_required:
-            await update.message.reply_text("❌ User has insufficient points")
-            return
-            
-        user.points_balance -= reward.points_required
-        request.status = 'approved'
-        session.commit()
-        
-        await update.message.reply_text(f"✅ Approved request #{request.id}")
-        await context.bot.send_message(
-            chat_id=user.telegram_id,
-            text=f"🎉 Your {reward.name} redemption was approved!"
-        )
-    finally:
-        session.close()
+        user, reward, request = await redemptions.approve(args[0], notify=redemption_approved_notifications)
+    except NotFound:
+        await update.message.reply_text("❌ Invalid request")
+        return
+    except InsufficientPoints:
+        await update.message.reply_text("❌ User has insufficient points")
+        return
+    leaderboard_cache.invalidate(GLOBAL_SCOPE)
+    notifier.wake()
+
+    await update.message.reply_text(f"✅ Approved request #{request.id}")
+
+# --- Application ---
+def build_application(token=BOT_TOKEN, request=None, get_updates_request=None):
+    """Application with every handler registered; pass requests to swap the Bot API transport."""
+    # /search keeps its terms in chat_data for the paging buttons
+    persistence = DatabasePersistence(update_interval=PERSISTENCE_FLUSH_INTERVAL, stateful_commands={"search"})
+    builder = (
+        Application.builder().token(token)
+        # Every Bot API call except long polling is timed
+        .request(InstrumentedRequest(request or HTTPXRequest(connection_pool_size=BOT_API_POOL_SIZE)))
+        .concurrent_updates(CONCURRENT_UPDATES)
+        .persistence(persistence)
+        # Deliver queued notifications, including any left from before a restart
+        .post_init(start_background)
+        .post_stop(stop_background)
+    )
+    if get_updates_request:
+        builder = builder.get_updates_request(get_updates_request)
+    app = builder.build()
 
-if __name__ == "__main__":
-    app = Application.builder().token(BOT_TOKEN).build()
+    # Pick up conversation progress and user/chat data written by other workers
+    app.add_handler(TypeHandler(Update, persistence.sync), group=-1)
     
     # User commands
     app.add_handler(CommandHandler("start", start))
     app.add_handler(CommandHandler("bonus", give_bonus))
-    app.add_handler(CommandHandler("balance", lambda u,c: u.message.reply_text(f"💰 Balance: {get_or_create_user(u.effective_user.id, u.effective_user.username).points_balance}")))
+    app.add_handler(CommandHandler("balance", balance))
+    app.add_handler(CommandHandler("history", history))
     app.add_handler(CommandHandler("leaderboard", leaderboard))
+    app.add_handler(CommandHandler("orgstats", org_stats))
+    app.add_handler(CommandHandler("trending", trending))
+    app.add_handler(CommandHandler("tags", tag_profile))
+    app.add_handler(CommandHandler("search", search))
+    app.add_handler(CommandHandler("linkgroup", link_group))
     app.add_handler(CommandHandler("rewards", list_rewards))
     app.add_handler(CommandHandler("redeem", redeem_reward))
     app.add_handler(CommandHandler("recurring", set_recurring_bonus))
     
     # Admin commands
-    app.add_handler(CommandHandler("addorg", add_org))
     app.add_handler(CommandHandler("approve", approve_redemption))
     app.add_handler(CommandHandler("addpoints", add_points))
     app.add_handler(CommandHandler("reset", reset_user))
     app.add_handler(CommandHandler("announce", announce))
     app.add_handler(CommandHandler("userinfo", user_info))
     app.add_handler(CommandHandler("export", export_data))
+    app.add_handler(CommandHandler("rebuild_leaderboards", rebuild_leaderboards))
+    app.add_handler(CommandHandler("outbox", outbox_status))
+    app.add_handler(CommandHandler("perf", perf))
+    # A roster arrives as a document captioned /import <org_id>, or is replied to with the command
+    app.add_handler(CommandHandler("import", import_roster))
+    app.add_handler(MessageHandler(filters.Document.ALL & filters.CaptionRegex(r"^/import(@\w+)?(\s|$)"), import_roster))
     
-    conv_handler = ConversationHandler(
+    conv_handler = SharedConversationHandler(
         entry_points=[CommandHandler('recognize', start_cross_group_bonus)],
         states={
             ORG_CHOOSE: [CallbackQueryHandler(org_chosen)],
@@ -1078,19 +1335,23 @@ if __name__ == "__main__":
             AMOUNT_INPUT: [MessageHandler(filters.TEXT & ~filters.COMMAND, amount_received)],
             MESSAGE_INPUT: [MessageHandler(filters.TEXT & ~filters.COMMAND, message_received)]
         },
-        fallbacks=[]
+        fallbacks=[],
+        name='recognize',
+        persistent=True
     )
 
-    conv_add_user = ConversationHandler(
+    conv_add_user = SharedConversationHandler(
     entry_points=[CommandHandler('add_user', add_user)],
     states={
         ADD_USER_ORG: [CallbackQueryHandler(org_selected)],
         ADD_USER_DETAILS: [MessageHandler(filters.TEXT & ~filters.COMMAND, user_details_received)]
     },
-    fallbacks=[]
+    fallbacks=[],
+    name='add_user',
+    persistent=True
     )
 
-    conv_org = ConversationHandler(
+    conv_org = SharedConversationHandler(
     entry_points=[CommandHandler('addorg', add_org)],
     states={
         ORG_NAME: [MessageHandler(filters.TEXT & ~filters.COMMAND, org_name_received)],
@@ -1098,7 +1359,9 @@ if __name__ == "__main__":
         GROUP_INFO: [MessageHandler(filters.TEXT & ~filters.COMMAND, group_info_received)],
         CONFIRM_GROUP: [MessageHandler(filters.TEXT & ~filters.COMMAND, confirm_group_import)]
     },
-    fallbacks=[]
+    fallbacks=[],
+    name='addorg',
+    persistent=True
     )
 
     app.add_handler(conv_org)
@@ -1106,11 +1369,67 @@ if __name__ == "__main__":
     
     app.add_handler(conv_handler)
     app.add_handler(CallbackQueryHandler(button_handler))
+    app.add_handler(InlineQueryHandler(inline_user_search))
     app.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, handle_comment))
     
+    # Latency, errors and DB/API work per handler
+    metrics.instrument_handlers(app)
+    metrics.gauge(
+        "rahmat_outbox_dispatched", "Notifications handled by this worker's outbox dispatcher",
+        lambda: {(("stat", key),): value for key, value in notifier.stats().items()}
+    )
+    metrics.gauge(
+        "rahmat_leaderboard_cache", "Rendered leaderboard cache entries, hits, misses and hit rate",
+        lambda: {(("stat", key),): value for key, value in leaderboard_cache.stats().items()}
+    )
+    metrics.gauge(
+        "rahmat_user_cache", "Cached user entries, hits, misses and hit rate",
+        lambda: {(("stat", key),): value for key, value in user_cache.stats().items()}
+    )
+
+    # Finish announcements interrupted by a restart
+    app.job_queue.run_once(metrics.instrument(resume_broadcasts, "resume_broadcasts", kind='job'), 0)
+    return app
+
+def run_bot(app):
+    if BOT_MODE == "webhook":
+        if not (WEBHOOK_URL and WEBHOOK_SECRET):
+            raise SystemExit("BOT_MODE=webhook needs WEBHOOK_URL and WEBHOOK_SECRET")
+        # Telegram sends the secret in X-Telegram-Bot-Api-Secret-Token; other requests get 403.
+        # Accepted updates are queued and handled CONCURRENT_UPDATES at a time.
+        app.run_webhook(
+            listen=WEBHOOK_LISTEN,
+            port=WEBHOOK_PORT,
+            url_path=WEBHOOK_PATH,
+            webhook_url=WEBHOOK_URL,
+            secret_token=WEBHOOK_SECRET,
+            max_connections=WEBHOOK_MAX_CONNECTIONS
+        )
+    else:
+        app.run_polling()
+
+if __name__ == "__main__":
+    warm_username_index()
+    app = build_application()
+
     # Start scheduler
-    scheduler.add_job(process_recurring_bonuses, 'interval', minutes=60)
+    scheduler.add_job(metrics.instrument(process_recurring_bonuses, "process_recurring_bonuses", kind='job'), 'interval', minutes=60)
+    scheduler.add_job(metrics.instrument(snapshot_balances, "snapshot_balances", kind='job'), 'interval', hours=SNAPSHOT_INTERVAL_HOURS)
+    scheduler.add_job(
+        metrics.instrument(compact_rollups, "compact_rollups", kind='job'), 'interval', hours=24,
+        next_run_time=datetime.datetime.now()
+    )
+    if ARCHIVE_DATABASE:
+        scheduler.add_job(
+            metrics.instrument(archive_recognitions, "archive_recognitions", kind='job'), 'interval', hours=24,
+            next_run_time=datetime.datetime.now()
+        )
+    if INDEX_REFRESH_INTERVAL:
+        # Picks up users and groups that other workers sharing the database added
+        scheduler.add_job(warm_username_index, 'interval', seconds=INDEX_REFRESH_INTERVAL)
+    if METRICS_FILE:
+        scheduler.add_job(write_metrics_file, 'interval', seconds=METRICS_FILE_INTERVAL)
     scheduler.start()
     
-    print("Bot is running...")
-    app.run_polling()
\ No newline at end of file
+    print(f"Bot is running ({BOT_MODE})...")
+    run_bot(app)
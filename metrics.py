@@ -0,0 +1,272 @@
+# metrics.py
+import asyncio
+import contextvars
+import functools
+import os
+import threading
+import time
+from sqlalchemy import event
+from telegram.ext import ApplicationHandlerStop, ConversationHandler
+from telegram.request import BaseRequest
+from database import engine
+from query_log import query_log
+
+SECONDS_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 500)
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # the last one is +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+        else:
+            self.counts[-1] += 1
+        self.sum += value
+        self.count += 1
+
+    def quantile(self, q):
+        """Upper bound of the bucket holding the q-th observation; coarse but cheap."""
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for bound, count in zip(self.buckets, self.counts):
+            seen += count
+            if seen >= rank:
+                return bound
+        return float("inf")
+
+class UpdateStats:
+    """Work done on behalf of one update or job run, collected through a context variable."""
+
+    __slots__ = ("name", "statements", "db_seconds", "api_calls", "shapes")
+
+    def __init__(self, name=None):
+        self.name = name
+        self.statements = 0
+        self.db_seconds = 0.0
+        self.api_calls = 0
+        self.shapes = {}  # normalized SQL -> executions, filled by the query log
+
+_current = contextvars.ContextVar("update_stats", default=None)
+
+class Metrics:
+    """In-process registry of histograms and counters, rendered in Prometheus text format.
+
+    Observations come from the event loop and from DB worker threads, hence the lock.
+    """
+
+    HELP = {
+        "rahmat_handler_seconds": ("histogram", "Time spent in a handler per update"),
+        "rahmat_handler_sql_statements": ("histogram", "SQL statements executed per update"),
+        "rahmat_handler_db_seconds": ("histogram", "Time spent executing SQL per update"),
+        "rahmat_handler_bot_api_calls": ("histogram", "Bot API calls made per update"),
+        "rahmat_handler_errors_total": ("counter", "Updates whose handler raised"),
+        "rahmat_job_seconds": ("histogram", "Duration of a scheduled job run"),
+        "rahmat_job_sql_statements": ("histogram", "SQL statements executed per job run"),
+        "rahmat_job_db_seconds": ("histogram", "Time spent executing SQL per job run"),
+        "rahmat_job_bot_api_calls": ("histogram", "Bot API calls made per job run"),
+        "rahmat_job_errors_total": ("counter", "Job runs that raised"),
+        "rahmat_bot_api_seconds": ("histogram", "Bot API call latency"),
+        "rahmat_bot_api_errors_total": ("counter", "Bot API calls answered with an error status or failed"),
+        "rahmat_handler_repeated_queries_total": ("counter", "Updates that repeated one query shape (likely N+1)"),
+        "rahmat_job_repeated_queries_total": ("counter", "Job runs that repeated one query shape (likely N+1)"),
+        "rahmat_sql_statements_total": ("counter", "SQL statements executed"),
+        "rahmat_sql_seconds_total": ("counter", "Time spent executing SQL"),
+    }
+
+    def __init__(self):
+        self.started = time.time()
+        self._lock = threading.Lock()
+        self._histograms = {}  # (name, labels) -> Histogram
+        self._counters = {}    # (name, labels) -> float
+        self._gauges = {}      # name -> (help, fn returning {labels: value})
+
+    def observe(self, name, labels, value, buckets=SECONDS_BUCKETS):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = Histogram(buckets)
+            histogram.observe(value)
+
+    def inc(self, name, labels=None, amount=1):
+        key = (name, tuple(sorted((labels or {}).items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + amount
+
+    def gauge(self, name, help, fn):
+        """Report fn()'s {label tuple: value} mapping as a gauge at every scrape."""
+        self._gauges[name] = (help, fn)
+
+    def histograms(self, name):
+        """{label value: Histogram} of a family labelled by one name, e.g. handler."""
+        with self._lock:
+            return {labels[0][1]: h for (n, labels), h in self._histograms.items() if n == name and labels}
+
+    def counter(self, name, **labels):
+        with self._lock:
+            return self._counters.get((name, tuple(sorted(labels.items()))), 0)
+
+    # --- Instrumentation ---
+    def instrument(self, fn, name, kind="handler"):
+        """Wrap an async handler or job so every call records latency, errors and the DB/API work it caused."""
+        @functools.wraps(fn)
+        async def wrapper(*args, **kwargs):
+            stats = UpdateStats(name)
+            token = _current.set(stats)
+            started = time.perf_counter()
+            try:
+                return await fn(*args, **kwargs)
+            except ApplicationHandlerStop:
+                raise
+            except Exception:
+                self.inc(f"rahmat_{kind}_errors_total", {kind: name})
+                raise
+            finally:
+                _current.reset(token)
+                labels = {kind: name}
+                self.observe(f"rahmat_{kind}_seconds", labels, time.perf_counter() - started)
+                self.observe(f"rahmat_{kind}_sql_statements", labels, stats.statements, COUNT_BUCKETS)
+                self.observe(f"rahmat_{kind}_db_seconds", labels, stats.db_seconds)
+                self.observe(f"rahmat_{kind}_bot_api_calls", labels, stats.api_calls, COUNT_BUCKETS)
+                if query_log.finish(name, stats):
+                    self.inc(f"rahmat_{kind}_repeated_queries_total", labels)
+        return wrapper
+
+    def instrument_handlers(self, application):
+        """Wrap the callback of every handler registered so far, including conversation steps."""
+        for handlers in application.handlers.values():
+            for handler in handlers:
+                self._instrument_handler(handler)
+
+    def _instrument_handler(self, handler):
+        if isinstance(handler, ConversationHandler):
+            children = list(handler.entry_points) + list(handler.fallbacks)
+            for state_handlers in handler.states.values():
+                children += state_handlers
+            for child in children:
+                self._instrument_handler(child)
+        elif not getattr(handler.callback, "__wrapped__", None):
+            handler.callback = self.instrument(handler.callback, handler.callback.__name__)
+
+    # --- Export ---
+    def render(self):
+        """All metrics in the Prometheus text exposition format."""
+        with self._lock:
+            histograms = list(self._histograms.items())
+            counters = list(self._counters.items())
+        lines = []
+        described = set()
+
+        def describe(name, kind=None, help=None):
+            if name in described:
+                return
+            described.add(name)
+            kind, help = (kind, help) if help else self.HELP.get(name, ("untyped", name))
+            lines.append(f"# HELP {name} {help}")
+            lines.append(f"# TYPE {name} {kind}")
+
+        for (name, labels), histogram in sorted(histograms, key=lambda item: item[0]):
+            describe(name)
+            cumulative = 0
+            for bound, count in zip(list(histogram.buckets) + ["+Inf"], histogram.counts):
+                cumulative += count
+                lines.append(f"{name}_bucket{_labels(labels + (('le', str(bound)),))} {cumulative}")
+            lines.append(f"{name}_sum{_labels(labels)} {histogram.sum}")
+            lines.append(f"{name}_count{_labels(labels)} {histogram.count}")
+        for (name, labels), value in sorted(counters, key=lambda item: item[0]):
+            describe(name)
+            lines.append(f"{name}{_labels(labels)} {value}")
+        for name, (help, fn) in self._gauges.items():
+            describe(name, "gauge", help)
+            for labels, value in fn().items():
+                lines.append(f"{name}{_labels(labels)} {value}")
+        describe("rahmat_uptime_seconds", "gauge", "Seconds since the bot started")
+        lines.append(f"rahmat_uptime_seconds {time.time() - self.started:.0f}")
+        return "\n".join(lines) + "\n"
+
+    def write_file(self, path):
+        # Written whole then renamed, so a collector never reads half a file
+        temporary = f"{path}.tmp"
+        with open(temporary, "w") as f:
+            f.write(self.render())
+        os.replace(temporary, path)
+
+    async def serve(self, host, port):
+        """Serve render() over HTTP for Prometheus to scrape; returns the asyncio server."""
+        async def respond(reader, writer):
+            try:
+                await reader.readuntil(b"\r\n\r\n")
+                body = self.render().encode()
+                writer.write(
+                    b"HTTP/1.0 200 OK\r\nContent-Type: text/plain; version=0.0.4\r\n"
+                    + f"Content-Length: {len(body)}\r\n\r\n".encode() + body
+                )
+                await writer.drain()
+            except (asyncio.IncompleteReadError, ConnectionError):
+                pass
+            finally:
+                writer.close()
+        return await asyncio.start_server(respond, host, port)
+
+def _labels(labels):
+    if not labels:
+        return ""
+    def escape(value):
+        return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+    return "{" + ",".join(f'{k}="{escape(v)}"' for k, v in labels) + "}"
+
+metrics = Metrics()
+
+class InstrumentedRequest(BaseRequest):
+    """Wraps the Bot API transport to time every call and count it against the current update."""
+
+    def __init__(self, wrapped):
+        self._wrapped = wrapped
+
+    async def initialize(self):
+        await self._wrapped.initialize()
+
+    async def shutdown(self):
+        await self._wrapped.shutdown()
+
+    async def do_request(self, url, method, request_data=None, **kwargs):
+        api_method = url.rsplit("/", 1)[-1]
+        stats = _current.get()
+        if stats is not None:
+            stats.api_calls += 1
+        started = time.perf_counter()
+        try:
+            code, payload = await self._wrapped.do_request(url, method, request_data, **kwargs)
+        except Exception:
+            metrics.inc("rahmat_bot_api_errors_total", {"method": api_method, "status": "failed"})
+            raise
+        finally:
+            metrics.observe("rahmat_bot_api_seconds", {"method": api_method}, time.perf_counter() - started)
+        if code >= 400:
+            metrics.inc("rahmat_bot_api_errors_total", {"method": api_method, "status": str(code)})
+        return code, payload
+
+@event.listens_for(engine, "before_cursor_execute")
+def _start_statement(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("statement_started", []).append(time.perf_counter())
+
+@event.listens_for(engine, "after_cursor_execute")
+def _finish_statement(conn, cursor, statement, parameters, context, executemany):
+    elapsed = time.perf_counter() - conn.info["statement_started"].pop()
+    metrics.inc("rahmat_sql_statements_total")
+    metrics.inc("rahmat_sql_seconds_total", amount=elapsed)
+    # DB work runs on executor threads with the handler's context copied in
+    stats = _current.get()
+    if stats is not None:
+        stats.statements += 1
+        stats.db_seconds += elapsed
+    query_log.statement(stats, cursor, conn.dialect.name, statement, parameters, elapsed)
@@ -0,0 +1,386 @@
+# migrations.py
+import datetime
+from sqlalchemy import Boolean, Column, Date, DateTime, Float, Index, Integer, MetaData, String, Table, inspect, text
+from models import Tag
+
+# Each migration is (version, description, upgrade(conn)). Versions only ever
+# grow; never edit a migration that has shipped, append a new one instead.
+# Applied versions are recorded in the schema_version table.
+# Tables are spelled out as they were when their migration shipped rather than
+# taken from models.py, so later model changes need a migration of their own.
+
+TAG_BACKFILL_BATCH = 10000
+
+def _create(conn, *tables):
+    # Skips tables that exist: databases from before migrations already have the baseline
+    tables[0].metadata.create_all(conn, tables=tables)
+
+def _baseline(conn):
+    metadata = MetaData()
+    _create(
+        conn,
+        Table(
+            'organizations', metadata,
+            Column('id', Integer, primary_key=True),
+            Column('name', String),
+            Column('admin_id', String),
+            Column('created_at', DateTime)
+        ),
+        Table(
+            'user_organizations', metadata,
+            Column('id', Integer, primary_key=True),
+            Column('user_id', String),
+            Column('org_id', Integer)
+        ),
+        Table(
+            'users', metadata,
+            Column('id', Integer, primary_key=True),
+            Column('telegram_id', String, unique=True),
+            Column('username', String),
+            Column('points_balance', Float)
+        ),
+        Table(
+            'recognitions', metadata,
+            Column('id', Integer, primary_key=True),
+            Column('giver_id', String),
+            Column('receiver_id', String),
+            Column('points', Float),
+            Column('message', String),
+            Column('tags', String),
+            Column('group_id', String),
+            Column('created_at', DateTime)
+        ),
+        Table(
+            'rewards', metadata,
+            Column('id', Integer, primary_key=True),
+            Column('name', String),
+            Column('description', String),
+            Column('points_required', Float),
+            Column('requires_approval', Boolean)
+        ),
+        Table(
+            'redemption_requests', metadata,
+            Column('id', Integer, primary_key=True),
+            Column('user_id', String),
+            Column('reward_id', Integer),
+            Column('status', String),
+            Column('created_at', DateTime)
+        ),
+        Table(
+            'recurring_bonuses', metadata,
+            Column('id', Integer, primary_key=True),
+            Column('giver_id', String),
+            Column('receiver_id', String),
+            Column('amount', Float),
+            Column('interval', String),
+            Column('next_run', DateTime),
+            Column('is_active', Boolean)
+        ),
+        Table(
+            'groups', metadata,
+            Column('id', Integer, primary_key=True),
+            Column('org_id', Integer),
+            Column('group_name', String),
+            Column('telegram_group_id', String),
+            Column('is_public', Boolean)
+        ),
+        Table(
+            'comments', metadata,
+            Column('id', Integer, primary_key=True),
+            Column('recognition_id', Integer),
+            Column('user_id', String),
+            Column('text', String),
+            Column('created_at', DateTime)
+        )
+    )
+
+def _lookup_indexes(conn):
+    for statement in (
+        "CREATE INDEX IF NOT EXISTS ix_users_username ON users (username)",
+        "CREATE INDEX IF NOT EXISTS ix_recognitions_group_id ON recognitions (group_id)",
+        "CREATE INDEX IF NOT EXISTS ix_recognitions_receiver_id ON recognitions (receiver_id)",
+        "CREATE INDEX IF NOT EXISTS ix_recognitions_giver_id ON recognitions (giver_id)",
+        "CREATE INDEX IF NOT EXISTS ix_recognitions_created_at ON recognitions (created_at)",
+        "CREATE INDEX IF NOT EXISTS ix_recurring_bonuses_due ON recurring_bonuses (is_active, next_run)",
+        "CREATE INDEX IF NOT EXISTS ix_user_organizations_user_id ON user_organizations (user_id)",
+        "CREATE INDEX IF NOT EXISTS ix_user_organizations_org_id ON user_organizations (org_id)",
+        "CREATE INDEX IF NOT EXISTS ix_groups_org_id ON groups (org_id)",
+    ):
+        conn.execute(text(statement))
+
+def _group_points(conn):
+    _create(conn, Table(
+        'group_points', MetaData(),
+        Column('group_id', String, primary_key=True),
+        Column('user_id', String, primary_key=True),
+        Column('points', Float),
+        Index('ix_group_points_rank', 'group_id', 'points')
+    ))
+    conn.execute(text(
+        "INSERT INTO group_points (group_id, user_id, points) "
+        "SELECT group_id, receiver_id, SUM(points) FROM recognitions "
+        "WHERE group_id IS NOT NULL GROUP BY group_id, receiver_id"
+    ))
+
+def _broadcasts(conn):
+    _create(conn, Table(
+        'broadcasts', MetaData(),
+        Column('id', Integer, primary_key=True),
+        Column('admin_id', String),
+        Column('text', String),
+        Column('status', String, index=True),
+        Column('total', Integer),
+        Column('sent', Integer),
+        Column('failed', Integer),
+        Column('last_user_id', Integer),
+        Column('created_at', DateTime)
+    ))
+
+def _ledger(conn):
+    metadata = MetaData()
+    _create(
+        conn,
+        Table(
+            'ledger_entries', metadata,
+            Column('id', Integer, primary_key=True),
+            Column('user_id', String),
+            Column('amount', Integer),
+            Column('kind', String),
+            Column('counterparty_id', String),
+            Column('reference_id', Integer),
+            Column('created_at', DateTime),
+            Index('ix_ledger_entries_user', 'user_id', 'id')
+        ),
+        Table(
+            'balance_snapshots', metadata,
+            Column('user_id', String, primary_key=True),
+            Column('ledger_id', Integer, primary_key=True),
+            Column('balance', Integer),
+            Column('created_at', DateTime)
+        )
+    )
+    # Open every existing account with its current balance so the ledger explains it
+    conn.execute(text(
+        "INSERT INTO ledger_entries (user_id, amount, kind, created_at) "
+        "SELECT telegram_id, CAST(ROUND(COALESCE(points_balance, 0) * 100) AS INTEGER), 'opening', :now FROM users"
+    ), {"now": datetime.datetime.now()})
+
+def _bot_state(conn):
+    _create(conn, Table(
+        'bot_state', MetaData(),
+        Column('scope', String, primary_key=True),
+        Column('key', String, primary_key=True),
+        Column('data', String),
+        Column('updated_at', Float)
+    ))
+
+def _outbox(conn):
+    _create(conn, Table(
+        'outbox', MetaData(),
+        Column('id', Integer, primary_key=True),
+        Column('chat_id', String),
+        Column('kind', String),
+        Column('text', String),
+        Column('status', String),
+        Column('attempts', Integer),
+        Column('next_attempt_at', DateTime),
+        Column('last_error', String),
+        Column('created_at', DateTime),
+        Index('ix_outbox_due', 'status', 'next_attempt_at')
+    ))
+
+def _outbox_details(conn):
+    # Migration 7 used to build the table from the model, so some databases already have it
+    if 'details' not in {column['name'] for column in inspect(conn).get_columns('outbox')}:
+        conn.execute(text("ALTER TABLE outbox ADD COLUMN details VARCHAR"))
+
+def _unique_memberships(conn):
+    # Earlier imports could enroll a user twice; keep the first row of each pair
+    conn.execute(text(
+        "DELETE FROM user_organizations WHERE id NOT IN "
+        "(SELECT MIN(id) FROM user_organizations GROUP BY user_id, org_id)"
+    ))
+    conn.execute(text(
+        "CREATE UNIQUE INDEX IF NOT EXISTS ux_user_organizations_member ON user_organizations (user_id, org_id)"
+    ))
+
+def _points_rollups(conn):
+    _create(conn, Table(
+        'points_rollups', MetaData(),
+        Column('group_id', String, primary_key=True),
+        Column('period_start', Date, primary_key=True),
+        Column('span', String, primary_key=True),
+        Column('user_id', String, primary_key=True),
+        Column('received', Float),
+        Column('given', Float),
+        Index('ix_points_rollups_period', 'period_start')
+    ))
+    day = "DATE(created_at)" if conn.dialect.name == 'sqlite' else "CAST(created_at AS DATE)"
+    # Daily rows for all history; the compaction job folds old months together afterwards
+    conn.execute(text(
+        "INSERT INTO points_rollups (group_id, period_start, span, user_id, received, given) "
+        "SELECT group_id, day, 'day', user_id, SUM(received), SUM(given) FROM ("
+        f"SELECT COALESCE(group_id, '') AS group_id, {day} AS day, receiver_id AS user_id, points AS received, 0 AS given FROM recognitions "
+        "UNION ALL "
+        f"SELECT COALESCE(group_id, ''), {day}, giver_id, 0, points FROM recognitions"
+        ") AS activity GROUP BY group_id, day, user_id"
+    ))
+
+def _recognition_tags(conn):
+    metadata = MetaData()
+    _create(
+        conn,
+        Table(
+            'tags', metadata,
+            Column('id', Integer, primary_key=True),
+            Column('name', String, unique=True)
+        ),
+        Table(
+            'recognition_tags', metadata,
+            Column('recognition_id', Integer, primary_key=True),
+            Column('tag_id', Integer, primary_key=True),
+            Column('group_id', String),
+            Column('receiver_id', String),
+            Column('points', Float),
+            Column('created_at', DateTime),
+            Index('ix_recognition_tags_tag', 'tag_id', 'created_at'),
+            Index('ix_recognition_tags_group', 'group_id', 'created_at'),
+            Index('ix_recognition_tags_receiver', 'receiver_id', 'tag_id'),
+            Index('ix_recognition_tags_created_at', 'created_at')
+        )
+    )
+    # Split the comma-joined Recognition.tags strings, a batch of recognitions at a time
+    tag_ids = dict(conn.execute(text("SELECT name, id FROM tags")).all())
+    last_id = 0
+    while True:
+        rows = conn.execute(text(
+            "SELECT id, tags, group_id, receiver_id, points, created_at FROM recognitions "
+            "WHERE id > :last_id AND tags IS NOT NULL AND tags != '' ORDER BY id LIMIT :limit"
+        ), {"last_id": last_id, "limit": TAG_BACKFILL_BATCH}).all()
+        if not rows:
+            break
+        last_id = rows[-1].id
+        links = []
+        for row in rows:
+            for name in Tag.names(row.tags.split(',')):
+                if name not in tag_ids:
+                    tag_ids[name] = conn.execute(
+                        text("INSERT INTO tags (name) VALUES (:name) RETURNING id"), {"name": name}
+                    ).scalar()
+                links.append({
+                    "recognition_id": row.id,
+                    "tag_id": tag_ids[name],
+                    "group_id": row.group_id,
+                    "receiver_id": row.receiver_id,
+                    "points": row.points,
+                    "created_at": row.created_at
+                })
+        if links:
+            conn.execute(text(
+                "INSERT INTO recognition_tags (recognition_id, tag_id, group_id, receiver_id, points, created_at) "
+                "VALUES (:recognition_id, :tag_id, :group_id, :receiver_id, :points, :created_at)"
+            ), links)
+
+# Who may find a recognition: 'g<group>' for its group ('-' spelled 'n', which
+# the tokenizer would drop) and 'u<id>' for its giver and receiver
+SEARCH_SCOPE = (
+    "COALESCE('g' || replace({r}.group_id, '-', 'n') || ' ', '') || 'u' || {r}.giver_id || ' u' || {r}.receiver_id"
+)
+# A comment's scope is its recognition's plus the commenter
+_COMMENT_SCOPE = (
+    "COALESCE((SELECT " + SEARCH_SCOPE.format(r="r") + " FROM recognitions AS r WHERE r.id = {c}.recognition_id) || ' ', '')"
+    " || 'u' || {c}.user_id"
+)
+
+def _search_index(conn):
+    if conn.dialect.name != 'sqlite':
+        return  # FTS5 is SQLite's; /search reports it unavailable elsewhere
+    # Recognitions are rows 2 * id and comments 2 * id + 1
+    conn.execute(text(
+        "CREATE VIRTUAL TABLE IF NOT EXISTS search_index USING fts5("
+        "body, scope, tokenize = 'unicode61 remove_diacritics 2', prefix = '2 3')"
+    ))
+    recognition_row = "INSERT INTO search_index (rowid, body, scope) SELECT new.id * 2, new.message, " + SEARCH_SCOPE.format(r="new")
+    comment_row = "INSERT INTO search_index (rowid, body, scope) SELECT new.id * 2 + 1, new.text, " + _COMMENT_SCOPE.format(c="new")
+    for statement in (
+        "CREATE TRIGGER IF NOT EXISTS recognitions_search_insert AFTER INSERT ON recognitions "
+        f"WHEN new.message != '' BEGIN {recognition_row}; END",
+        "CREATE TRIGGER IF NOT EXISTS recognitions_search_delete AFTER DELETE ON recognitions "
+        "BEGIN DELETE FROM search_index WHERE rowid = old.id * 2; END",
+        "CREATE TRIGGER IF NOT EXISTS recognitions_search_update AFTER UPDATE OF message, group_id, giver_id, receiver_id ON recognitions "
+        f"BEGIN DELETE FROM search_index WHERE rowid = old.id * 2; {recognition_row} WHERE new.message != ''; END",
+        "CREATE TRIGGER IF NOT EXISTS comments_search_insert AFTER INSERT ON comments "
+        f"WHEN new.text != '' BEGIN {comment_row}; END",
+        "CREATE TRIGGER IF NOT EXISTS comments_search_delete AFTER DELETE ON comments "
+        "BEGIN DELETE FROM search_index WHERE rowid = old.id * 2 + 1; END",
+        "CREATE TRIGGER IF NOT EXISTS comments_search_update AFTER UPDATE OF text, recognition_id, user_id ON comments "
+        f"BEGIN DELETE FROM search_index WHERE rowid = old.id * 2 + 1; {comment_row} WHERE new.text != ''; END",
+    ):
+        conn.execute(text(statement))
+    conn.execute(text(
+        "INSERT INTO search_index (rowid, body, scope) SELECT id * 2, message, "
+        + SEARCH_SCOPE.format(r="recognitions") + " FROM recognitions WHERE message != ''"
+    ))
+    conn.execute(text(
+        "INSERT INTO search_index (rowid, body, scope) SELECT id * 2 + 1, text, "
+        + _COMMENT_SCOPE.format(c="comments") + " FROM comments WHERE text != ''"
+    ))
+
+def _bonus_anchor_day(conn):
+    # Left NULL for existing bonuses, which then keep the day of their next run
+    conn.execute(text("ALTER TABLE recurring_bonuses ADD COLUMN anchor_day INTEGER"))
+
+def _round_balances(conn):
+    # Float arithmetic left some balances a hair off the ledger's hundredths
+    conn.execute(text("UPDATE users SET points_balance = ROUND(points_balance * 100) / 100"))
+
+def _outbox_lease(conn):
+    # Leases used to overwrite next_attempt_at; rows leased that way become due when it passes
+    conn.execute(text("ALTER TABLE outbox ADD COLUMN leased_until TIMESTAMP"))
+
+MIGRATIONS = [
+    (1, "baseline schema", _baseline),
+    (2, "indexes on hot lookup columns", _lookup_indexes),
+    (3, "per-group leaderboard aggregates", _group_points),
+    (4, "resumable broadcasts", _broadcasts),
+    (5, "points ledger and balance snapshots", _ledger),
+    (6, "persisted conversation state", _bot_state),
+    (7, "notification outbox", _outbox),
+    (8, "notification digest details", _outbox_details),
+    (9, "unique organization memberships", _unique_memberships),
+    (10, "daily points rollups", _points_rollups),
+    (11, "normalized recognition tags", _recognition_tags),
+    (12, "full-text search index", _search_index),
+    (13, "monthly bonus anchor day", _bonus_anchor_day),
+    (14, "balances rounded to hundredths", _round_balances),
+    (15, "separate outbox claim lease", _outbox_lease),
+]
+
+def current_version(conn):
+    conn.execute(text(
+        "CREATE TABLE IF NOT EXISTS schema_version ("
+        "version INTEGER PRIMARY KEY, description VARCHAR(255), applied_at TIMESTAMP)"
+    ))
+    return conn.execute(text("SELECT COALESCE(MAX(version), 0) FROM schema_version")).scalar()
+
+def upgrade(engine, target=None):
+    """Apply pending migrations in order, each in its own transaction. Returns the new version."""
+    with engine.begin() as conn:
+        version = current_version(conn)
+    for number, description, migrate in MIGRATIONS:
+        if number <= version or (target is not None and number > target):
+            continue
+        with engine.begin() as conn:
+            migrate(conn)
+            conn.execute(
+                text("INSERT INTO schema_version (version, description, applied_at) VALUES (:v, :d, :t)"),
+                {"v": number, "d": description, "t": datetime.datetime.now()}
+            )
+        print(f"Applied migration {number}: {description}")
+        version = number
+    return version
+
+if __name__ == "__main__":
+    from database import engine
+    with engine.begin() as conn:
+        print(f"Schema version: {current_version(conn)}")
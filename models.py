@@ -0,0 +1,193 @@
+# models.py
+import datetime
+from sqlalchemy import Column, Integer, String, Float, Boolean, Date, DateTime, Index
+from sqlalchemy.ext.declarative import declarative_base
+
+Base = declarative_base()
+class Organization(Base):
+    __tablename__ = 'organizations'
+    id = Column(Integer, primary_key=True)
+    name = Column(String)
+    admin_id = Column(String)  # Telegram ID of org admin
+    created_at = Column(DateTime, default=datetime.datetime.now)
+
+class UserOrganization(Base):
+    __tablename__ = 'user_organizations'
+    # One row per membership; imports rely on it for INSERT ... ON CONFLICT
+    __table_args__ = (Index('ux_user_organizations_member', 'user_id', 'org_id', unique=True),)
+    id = Column(Integer, primary_key=True)
+    user_id = Column(String, index=True)
+    org_id = Column(Integer, index=True)
+
+class User(Base):
+    __tablename__ = 'users'
+    id = Column(Integer, primary_key=True)
+    telegram_id = Column(String, unique=True)
+    username = Column(String, index=True)
+    points_balance = Column(Float, default=100.0)
+
+class Recognition(Base):
+    __tablename__ = 'recognitions'
+    id = Column(Integer, primary_key=True)
+    giver_id = Column(String, index=True)
+    receiver_id = Column(String, index=True)
+    points = Column(Float)
+    message = Column(String)
+    tags = Column(String)
+    group_id = Column(String, index=True)
+    created_at = Column(DateTime, default=datetime.datetime.now, index=True)
+
+class Tag(Base):
+    # A hashtag, lowercased and without the '#'
+    __tablename__ = 'tags'
+    id = Column(Integer, primary_key=True)
+    name = Column(String, unique=True)
+
+    @staticmethod
+    def names(tags):
+        """Normalized names of hashtags as typed ('#TeamWork!' -> 'teamwork'), without duplicates."""
+        names = []
+        for tag in tags:
+            name = tag.strip().lstrip('#').rstrip('.,!?;:').lower()
+            if name and name not in names:
+                names.append(name)
+        return names
+
+class RecognitionTag(Base):
+    # Recognition <-> tag links, carrying the recognition columns tag analytics
+    # filter and sum on so they are answered from these indexes alone
+    __tablename__ = 'recognition_tags'
+    __table_args__ = (
+        Index('ix_recognition_tags_tag', 'tag_id', 'created_at'),
+        Index('ix_recognition_tags_group', 'group_id', 'created_at'),
+        Index('ix_recognition_tags_receiver', 'receiver_id', 'tag_id'),
+        Index('ix_recognition_tags_created_at', 'created_at'),
+    )
+    recognition_id = Column(Integer, primary_key=True)
+    tag_id = Column(Integer, primary_key=True)
+    group_id = Column(String)
+    receiver_id = Column(String)
+    points = Column(Float)
+    created_at = Column(DateTime)
+
+class Reward(Base):
+    __tablename__ = 'rewards'
+    id = Column(Integer, primary_key=True)
+    name = Column(String)
+    description = Column(String)
+    points_required = Column(Float)
+    requires_approval = Column(Boolean, default=True)
+
+class RedemptionRequest(Base):
+    __tablename__ = 'redemption_requests'
+    id = Column(Integer, primary_key=True)
+    user_id = Column(String)
+    reward_id = Column(Integer)
+    status = Column(String, default='pending')
+    created_at = Column(DateTime, default=datetime.datetime.now)
+
+class RecurringBonus(Base):
+    __tablename__ = 'recurring_bonuses'
+    __table_args__ = (Index('ix_recurring_bonuses_due', 'is_active', 'next_run'),)
+    id = Column(Integer, primary_key=True)
+    giver_id = Column(String)
+    receiver_id = Column(String)
+    amount = Column(Float)
+    interval = Column(String)
+    next_run = Column(DateTime)
+    is_active = Column(Boolean, default=True)
+    anchor_day = Column(Integer)  # day of month monthly runs fall on; next_run's day is clamped in short months
+
+class Group(Base):
+    __tablename__ = 'groups'
+    id = Column(Integer, primary_key=True)
+    org_id = Column(Integer, index=True)
+    group_name = Column(String)
+    telegram_group_id = Column(String)
+    is_public = Column(Boolean, default=True)
+
+class Comment(Base):
+    __tablename__ = 'comments'
+    id = Column(Integer, primary_key=True)
+    recognition_id = Column(Integer)
+    user_id = Column(String)
+    text = Column(String)
+    created_at = Column(DateTime, default=datetime.datetime.now)
+
+class GroupPoints(Base):
+    # Running total of points each user received in a group, kept in step with recognitions
+    __tablename__ = 'group_points'
+    __table_args__ = (Index('ix_group_points_rank', 'group_id', 'points'),)
+    group_id = Column(String, primary_key=True)
+    user_id = Column(String, primary_key=True)
+    points = Column(Float, default=0.0)
+
+class PointsRollup(Base):
+    # Points received and given per user and group over one day, or over a whole
+    # month once compacted (span 'month', period_start the 1st). group_id '' holds
+    # recognitions made outside any group, such as recurring bonuses.
+    __tablename__ = 'points_rollups'
+    __table_args__ = (Index('ix_points_rollups_period', 'period_start'),)
+    group_id = Column(String, primary_key=True)
+    period_start = Column(Date, primary_key=True)
+    span = Column(String, primary_key=True)  # day, month
+    user_id = Column(String, primary_key=True)
+    received = Column(Float, default=0.0)
+    given = Column(Float, default=0.0)
+
+class Broadcast(Base):
+    # An /announce run; last_user_id is the resume cursor over users.id
+    __tablename__ = 'broadcasts'
+    id = Column(Integer, primary_key=True)
+    admin_id = Column(String)
+    text = Column(String)
+    status = Column(String, default='running', index=True)
+    total = Column(Integer, default=0)
+    sent = Column(Integer, default=0)
+    failed = Column(Integer, default=0)
+    last_user_id = Column(Integer, default=0)
+    created_at = Column(DateTime, default=datetime.datetime.now)
+
+class LedgerEntry(Base):
+    # Append-only record of every balance change, in minor units (1 point = 100)
+    __tablename__ = 'ledger_entries'
+    __table_args__ = (Index('ix_ledger_entries_user', 'user_id', 'id'),)
+    id = Column(Integer, primary_key=True)
+    user_id = Column(String)
+    amount = Column(Integer)
+    kind = Column(String)  # opening, transfer, grant, reset, redemption, recurring
+    counterparty_id = Column(String)
+    reference_id = Column(Integer)  # recognition, redemption request or recurring bonus id
+    created_at = Column(DateTime, default=datetime.datetime.now)
+
+class BalanceSnapshot(Base):
+    # A user's balance after every ledger entry up to and including ledger_id
+    __tablename__ = 'balance_snapshots'
+    user_id = Column(String, primary_key=True)
+    ledger_id = Column(Integer, primary_key=True)
+    balance = Column(Integer)
+    created_at = Column(DateTime, default=datetime.datetime.now)
+
+class BotState(Base):
+    # Persisted user_data, chat_data, bot_data and conversation states as JSON
+    __tablename__ = 'bot_state'
+    scope = Column(String, primary_key=True)  # user_data, chat_data, bot_data or conversation:<name>
+    key = Column(String, primary_key=True)
+    data = Column(String)
+    updated_at = Column(Float)  # time.time() of the write, so workers can tell newer state
+
+class OutboxMessage(Base):
+    # A notification written in the transaction that caused it; deleted once delivered
+    __tablename__ = 'outbox'
+    __table_args__ = (Index('ix_outbox_due', 'status', 'next_attempt_at'),)
+    id = Column(Integer, primary_key=True)
+    chat_id = Column(String)
+    kind = Column(String)
+    text = Column(String)
+    details = Column(String)  # JSON the digest is built from
+    status = Column(String, default='pending')  # pending or dead
+    attempts = Column(Integer, default=0)
+    next_attempt_at = Column(DateTime, default=datetime.datetime.now)
+    leased_until = Column(DateTime)  # set while a worker sends it; NULL until first claimed
+    last_error = Column(String)
+    created_at = Column(DateTime, default=datetime.datetime.now)
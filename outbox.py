@@ -0,0 +1,186 @@
+# outbox.py
+import asyncio
+import datetime
+import json
+from collections import Counter
+from telegram.error import BadRequest, Forbidden, RetryAfter
+from broadcast import RateLimiter
+from config import URGENT_NOTIFICATIONS
+from repository import outbox
+
+OUTBOX_WORKERS = 8
+OUTBOX_RATE = 25  # messages per second, within Telegram's per-bot limit
+OUTBOX_BATCH_SIZE = 100
+OUTBOX_POLL_INTERVAL = 1.0  # seconds; other workers' messages are picked up this often
+OUTBOX_LEASE = 60  # seconds a claimed message is reserved before another worker may retry it
+OUTBOX_MAX_ATTEMPTS = 8
+OUTBOX_BACKOFF = 5  # seconds before the first retry, doubling after each failure
+OUTBOX_MAX_BACKOFF = 3600
+DIGEST_MAX_MESSAGES = 10  # recognition messages quoted in a digest; the rest are counted
+TELEGRAM_MAX_LENGTH = 4096
+
+def digest_text(messages):
+    """One message standing in for several notifications to the same chat."""
+    received = [json.loads(m.details) for m in messages if m.details]
+    parts = []
+    if received:
+        total = round(sum(d["points"] for d in received), 2)
+        givers = Counter()
+        for d in received:
+            givers[d["from"]] += d["points"]
+        lines = [
+            f"🎉 You received {total} points in {len(received)} recognitions!",
+            "From: " + ", ".join(f"@{name} ({round(points, 2)})" for name, points in givers.most_common())
+        ]
+        quoted = [d for d in received if d.get("message")]
+        lines += [f"• @{d['from']}: {d['message']}" for d in quoted[:DIGEST_MAX_MESSAGES]]
+        if len(quoted) > DIGEST_MAX_MESSAGES:
+            lines.append(f"…and {len(quoted) - DIGEST_MAX_MESSAGES} more")
+        balances = [d["balance"] for d in received if "balance" in d]
+        if balances:
+            lines.append(f"Your new balance: {balances[-1]}")
+        parts.append("\n".join(lines))
+    parts += [m.text for m in messages if not m.details]
+    text = "\n\n".join(parts)
+    return text if len(text) <= TELEGRAM_MAX_LENGTH else text[:TELEGRAM_MAX_LENGTH - 1] + "…"
+
+class OutboxDispatcher:
+    """Delivers queued notifications in the background.
+
+    A claim loop leases due messages from the outbox table and feeds a pool of
+    sender tasks; results are written back in one transaction per loop.
+    Non-urgent messages leased together for one chat are sent as a single digest.
+    Delivery is at-least-once: a worker that dies after sending but before
+    recording it leaves the lease to expire and the message is sent again.
+    """
+
+    def __init__(self, workers=OUTBOX_WORKERS, rate=OUTBOX_RATE, batch_size=OUTBOX_BATCH_SIZE):
+        self.workers = workers
+        self.batch_size = batch_size
+        self.limiter = RateLimiter(rate)
+        self.sent = 0
+        self.retried = 0
+        self.dead = 0
+        self.digests = 0
+        self.saved_calls = 0  # notifications delivered inside a digest instead of on their own
+        self._bot = None
+        self._task = None
+        self._queue = asyncio.Queue()
+        self._wakeup = asyncio.Event()
+        self._delivered = []
+        self._failed = []
+
+    def wake(self):
+        """Called after committing notifications so they go out without waiting for the next poll."""
+        self._wakeup.set()
+
+    def start(self, bot):
+        # Its own task rather than Application.create_task, which stop() would wait on forever
+        self._task = asyncio.create_task(self.run(bot))
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+            await self._record_results()
+
+    async def run(self, bot):
+        self._bot = bot
+        senders = [asyncio.create_task(self._send_loop()) for _ in range(self.workers)]
+        try:
+            while True:
+                try:
+                    await self._record_results()
+                    if self._queue.qsize() < self.workers and await self._claim() == self.batch_size:
+                        continue
+                except Exception as e:
+                    print(f"Outbox dispatch failed: {e}")
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), OUTBOX_POLL_INTERVAL)
+                except asyncio.TimeoutError:
+                    pass
+                self._wakeup.clear()
+        finally:
+            for sender in senders:
+                sender.cancel()
+
+    async def _claim(self):
+        now = datetime.datetime.now()
+        messages = await outbox.claim(now, now + datetime.timedelta(seconds=OUTBOX_LEASE), self.batch_size)
+        digests = {}
+        for message in messages:
+            if message.kind in URGENT_NOTIFICATIONS:
+                self._queue.put_nowait([message])
+            else:
+                digests.setdefault(message.chat_id, []).append(message)
+        for batch in digests.values():
+            self._queue.put_nowait(batch)
+        return len(messages)
+
+    async def _record_results(self):
+        delivered, self._delivered = self._delivered, []
+        failed, self._failed = self._failed, []
+        if not (delivered or failed):
+            return
+        try:
+            await outbox.complete(delivered, failed)
+        except Exception:
+            self._delivered = delivered + self._delivered
+            self._failed = failed + self._failed
+            raise
+
+    async def _send_loop(self):
+        while True:
+            messages = await self._queue.get()
+            await self._deliver(messages)
+            if self._queue.empty():
+                self.wake()
+
+    async def _deliver(self, messages):
+        text = messages[0].text if len(messages) == 1 else digest_text(messages)
+        await self.limiter.acquire()
+        try:
+            await self._bot.send_message(chat_id=messages[0].chat_id, text=text)
+        except RetryAfter as e:
+            # A flood-wait applies to the whole bot, so every sender backs off
+            self.limiter.pause(e.retry_after)
+            for message in messages:
+                self._retry(message, e.retry_after, e)
+        except (Forbidden, BadRequest) as e:
+            # Blocked the bot or chat no longer exists; retrying won't help
+            for message in messages:
+                self._fail(message, message.attempts + 1, None, e)
+        except Exception as e:
+            for message in messages:
+                self._retry(message, min(OUTBOX_BACKOFF * 2 ** message.attempts, OUTBOX_MAX_BACKOFF), e)
+        else:
+            self.sent += 1
+            if len(messages) > 1:
+                self.digests += 1
+                self.saved_calls += len(messages) - 1
+            self._delivered.extend(message.id for message in messages)
+
+    def _retry(self, message, delay, error):
+        attempts = message.attempts + 1
+        if attempts >= OUTBOX_MAX_ATTEMPTS:
+            self._fail(message, attempts, None, error)
+            return
+        self.retried += 1
+        self._fail(message, attempts, datetime.datetime.now() + datetime.timedelta(seconds=delay), error)
+
+    def _fail(self, message, attempts, next_attempt_at, error):
+        if next_attempt_at is None:
+            self.dead += 1
+            print(f"Dead-lettered {message.kind} notification #{message.id} to {message.chat_id}: {error}")
+        self._failed.append((message.id, attempts, next_attempt_at, str(error)[:255]))
+
+    def stats(self):
+        return {
+            "sent": self.sent,
+            "retried": self.retried,
+            "dead": self.dead,
+            "digests": self.digests,
+            "saved_calls": self.saved_calls,
+            "queued": self._queue.qsize()
+        }
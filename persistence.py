@@ -0,0 +1,174 @@
+# persistence.py
+import asyncio
+import json
+import time
+from telegram import Update
+from telegram.ext import BasePersistence, ContextTypes, ConversationHandler, PersistenceInput
+from repository import bot_state
+
+CONVERSATION_SCOPE = "conversation:"
+
+class SharedConversationHandler(ConversationHandler):
+    """ConversationHandler whose state another worker may have advanced.
+
+    DatabasePersistence.sync() loads the latest state for the update's
+    conversation before the handler looks at it.
+    """
+
+    def conversation_key(self, update):
+        return self._get_key(update)
+
+    def load_state(self, key, state):
+        if state is None:
+            self._conversations.data.pop(key, None)
+        else:
+            self._conversations.update_no_track({key: state})
+
+class DatabasePersistence(BasePersistence):
+    """Keeps user_data, chat_data, bot_data and conversation states in the bot_state table.
+
+    PTB hands over changed entries every update_interval seconds; they are
+    written together in one transaction. Before each update sync() pulls in
+    anything another worker wrote since, so several processes can share one
+    database and a restarted worker resumes half-finished conversations.
+    """
+
+    def __init__(self, update_interval=2, stateful_commands=()):
+        super().__init__(store_data=PersistenceInput(callback_data=False), update_interval=update_interval)
+        # Commands outside conversations that still read user or chat data
+        self.stateful_commands = set(stateful_commands)
+        self._pending = {}   # (scope, key) -> JSON, or None to delete
+        self._known = {}     # (scope, key) -> updated_at of the version held in memory
+        self._writing = None
+
+    # --- Loading ---
+    async def _load(self, scope):
+        loaded = {}
+        for key, data, updated_at in await bot_state.load(scope):
+            self._known[(scope, key)] = updated_at
+            loaded[key] = json.loads(data)
+        return loaded
+
+    async def get_user_data(self):
+        return {int(key): data for key, data in (await self._load("user_data")).items()}
+
+    async def get_chat_data(self):
+        return {int(key): data for key, data in (await self._load("chat_data")).items()}
+
+    async def get_bot_data(self):
+        return (await self._load("bot_data")).get("bot", {})
+
+    async def get_callback_data(self):
+        return None
+
+    async def get_conversations(self, name):
+        states = await self._load(CONVERSATION_SCOPE + name)
+        return {tuple(json.loads(key)): state for key, state in states.items() if state is not None}
+
+    # --- Writing ---
+    async def update_user_data(self, user_id, data):
+        await self._stage("user_data", user_id, json.dumps(data))
+
+    async def update_chat_data(self, chat_id, data):
+        await self._stage("chat_data", chat_id, json.dumps(data))
+
+    async def update_bot_data(self, data):
+        await self._stage("bot_data", "bot", json.dumps(data))
+
+    async def update_callback_data(self, data):
+        pass
+
+    async def update_conversation(self, name, key, new_state):
+        # An ended conversation is stored as null rather than deleted, so other workers see it end
+        await self._stage(CONVERSATION_SCOPE + name, json.dumps(list(key)), json.dumps(new_state))
+
+    async def drop_user_data(self, user_id):
+        await self._stage("user_data", user_id, None)
+
+    async def drop_chat_data(self, chat_id):
+        await self._stage("chat_data", chat_id, None)
+
+    async def flush(self):
+        await self._write_pending()
+
+    async def _stage(self, scope, key, data):
+        """Queue a JSON value, or None to delete, for the next write."""
+        self._pending[(scope, str(key))] = data
+        # PTB passes every changed entry at once; they all join the same write
+        if self._writing is None:
+            self._writing = asyncio.ensure_future(self._write_soon())
+        await asyncio.shield(self._writing)
+
+    async def _write_soon(self):
+        await asyncio.sleep(0)
+        self._writing = None
+        await self._write_pending()
+
+    async def _write_pending(self):
+        pending, self._pending = self._pending, {}
+        if not pending:
+            return
+        now = time.time()
+        try:
+            await bot_state.save(pending, now)
+        except Exception:
+            # Keep the entries for the next flush unless they were changed again meanwhile
+            self._pending = {**pending, **self._pending}
+            raise
+        for entry in pending:
+            self._known[entry] = now
+
+    # --- Sharing between workers ---
+    async def refresh_user_data(self, user_id, user_data):
+        pass
+
+    async def refresh_chat_data(self, chat_id, chat_data):
+        pass
+
+    async def refresh_bot_data(self, bot_data):
+        pass
+
+    async def sync(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Handler for group -1: bring this update's state up to date with the database in one query."""
+        user, chat = update.effective_user, update.effective_chat
+        handlers = list(self._conversation_handlers(context.application))
+        if user is None or update.inline_query or self._is_stateless_command(update, handlers):
+            return
+        wanted = {("user_data", str(user.id)): None}
+        if chat is not None:
+            wanted[("chat_data", str(chat.id))] = None
+            for handler in handlers:
+                key = handler.conversation_key(update)
+                wanted[(CONVERSATION_SCOPE + handler.name, json.dumps(list(key)))] = (handler, key)
+
+        for entry, (data, updated_at) in (await bot_state.fetch(list(wanted))).items():
+            if updated_at <= self._known.get(entry, 0) or entry in self._pending:
+                continue
+            self._known[entry] = updated_at
+            scope = entry[0]
+            if scope == "user_data":
+                context.user_data.clear()
+                context.user_data.update(json.loads(data))
+            elif scope == "chat_data":
+                context.chat_data.clear()
+                context.chat_data.update(json.loads(data))
+            else:
+                handler, key = wanted[entry]
+                handler.load_state(key, json.loads(data))
+
+    def _is_stateless_command(self, update, handlers):
+        # Commands outside conversations don't read user/chat data; skip the query for them
+        message = update.message
+        if not (message and message.text and message.text.startswith("/")):
+            return False
+        command = (message.text[1:].split(maxsplit=1) or [""])[0].split("@")[0].lower()
+        if command in self.stateful_commands:
+            return False
+        return not any(entry.check_update(update) for handler in handlers for entry in handler.entry_points)
+
+    @staticmethod
+    def _conversation_handlers(application):
+        for handlers in application.handlers.values():
+            for handler in handlers:
+                if isinstance(handler, SharedConversationHandler) and handler.persistent:
+                    yield handler
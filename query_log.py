@@ -0,0 +1,84 @@
+# query_log.py
+import functools
+import re
+import threading
+from config import N_PLUS_ONE_THRESHOLD, SLOW_QUERY_MS
+
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_NUMBER = re.compile(r"\b\d+(?:\.\d+)?\b")
+_PLACEHOLDER_LIST = re.compile(r"\(\s*\?(?:\s*,\s*\?)+\s*\)")
+_SPACE = re.compile(r"\s+")
+
+@functools.lru_cache(maxsize=1024)
+def normalize(statement):
+    """SQL with literals and IN-list lengths erased, so one query shape maps to one string."""
+    shape = _STRING.sub("?", statement)
+    shape = _NUMBER.sub("?", shape)
+    shape = _PLACEHOLDER_LIST.sub("(?, ...)", shape)
+    return _SPACE.sub(" ", shape).strip()
+
+def explain(cursor, dialect, statement, parameters):
+    """Query plan for a statement, run on the same DBAPI connection without firing engine events."""
+    prefix = "EXPLAIN QUERY PLAN " if dialect == "sqlite" else "EXPLAIN "
+    if isinstance(parameters, list):  # executemany: the first row stands in for the rest
+        parameters = parameters[0] if parameters else ()
+    try:
+        plan = cursor.connection.cursor()
+        try:
+            plan.execute(prefix + statement, parameters)
+            return [str(row[-1]) for row in plan.fetchall()]
+        finally:
+            plan.close()
+    except Exception as e:
+        return [f"(no plan: {e})"]
+
+class QueryLog:
+    """Diagnostics on top of the per-update statement stream.
+
+    Statements slower than SLOW_QUERY_MS are logged with the handler that ran
+    them and, the first time a shape is seen, its query plan. With
+    N_PLUS_ONE_THRESHOLD set, statements are grouped by normalized SQL within
+    each update and a shape repeated that often is reported as a likely N+1,
+    once per handler and shape.
+    """
+
+    def __init__(self, slow_ms=SLOW_QUERY_MS, repeat_threshold=N_PLUS_ONE_THRESHOLD):
+        self.slow_seconds = slow_ms / 1000
+        self.repeat_threshold = repeat_threshold
+        self._lock = threading.Lock()
+        self._explained = set()
+        self._reported = set()
+
+    def statement(self, stats, cursor, dialect, statement, parameters, elapsed):
+        """Called after every statement; stats is the running update's UpdateStats or None."""
+        if self.repeat_threshold and stats is not None:
+            shape = normalize(statement)
+            stats.shapes[shape] = stats.shapes.get(shape, 0) + 1
+        if self.slow_seconds and elapsed >= self.slow_seconds:
+            self._log_slow(stats, cursor, dialect, statement, parameters, elapsed)
+
+    def finish(self, name, stats):
+        """Repeated shapes of a finished update as [(shape, count)], logging new ones."""
+        if not self.repeat_threshold:
+            return []
+        repeated = [(shape, count) for shape, count in stats.shapes.items() if count >= self.repeat_threshold]
+        for shape, count in repeated:
+            with self._lock:
+                if (name, shape) in self._reported:
+                    continue
+                self._reported.add((name, shape))
+            print(f"Possible N+1 in {name}: {count} x {shape}")
+        return repeated
+
+    def _log_slow(self, stats, cursor, dialect, statement, parameters, elapsed):
+        shape = normalize(statement)
+        origin = stats.name if stats is not None else "outside any handler"
+        message = f"Slow query ({elapsed * 1000:.0f} ms) in {origin}: {shape}"
+        with self._lock:
+            first = shape not in self._explained
+            self._explained.add(shape)
+        if first:
+            message += "".join(f"\n    {line}" for line in explain(cursor, dialect, statement, parameters))
+        print(message)
+
+query_log = QueryLog()
@@ -0,0 +1,1327 @@
+# repository.py
+import calendar
+import datetime
+import json
+import math
+from sqlalchemy import Date, and_, bindparam, case, delete, event, func, insert, literal, or_, select, text, union, union_all, update
+from sqlalchemy.dialects import postgresql, sqlite
+from archive import (
+    ARCHIVE_SCHEMA,
+    archived_comments,
+    archived_recognitions,
+    comment_tables,
+    has_archive,
+    recognition_tables,
+    search_index
+)
+from cache import GroupDirectory, UserCache
+from config import DIGEST_WINDOW, URGENT_NOTIFICATIONS, USER_CACHE_TTL
+from database import Session, run_in_session
+from migrations import SEARCH_SCOPE
+from username_index import UsernameIndex
+from models import (
+    Organization,
+    UserOrganization,
+    User,
+    Recognition,
+    Reward,
+    RedemptionRequest,
+    RecurringBonus,
+    Group,
+    Comment,
+    GroupPoints,
+    Broadcast,
+    LedgerEntry,
+    BalanceSnapshot,
+    BotState,
+    OutboxMessage,
+    PointsRollup,
+    Tag,
+    RecognitionTag
+)
+
+# All handler DB access goes through these repositories. Every method runs its
+# queries in a single transaction on the DB thread pool and returns detached objects.
+
+class NotFound(Exception):
+    pass
+
+class UserNotFound(NotFound):
+    def __init__(self, username, suggestions=()):
+        super().__init__(username)
+        self.suggestions = list(suggestions)
+
+class InsufficientPoints(Exception):
+    pass
+
+# Due recurring bonuses are paid this many per transaction
+RECURRING_BATCH_SIZE = 1000
+# Members enrolled per transaction by bulk imports
+IMPORT_CHUNK_SIZE = 1000
+# Ledger amounts are stored as integers in hundredths of a point
+POINTS_SCALE = 100
+STARTING_BALANCE = User.__table__.c.points_balance.default.arg
+
+# /search lists matches among the newest index entries first (recognitions are two
+# rows apart, comments in between) and reads older ones when those don't fill a page
+SEARCH_RECENT_ROWS = 200000
+
+USER_CACHE_SIZE = 10000
+
+user_cache = UserCache(maxsize=USER_CACHE_SIZE, ttl=USER_CACHE_TTL)
+username_index = UsernameIndex()
+group_directory = GroupDirectory()
+
+@event.listens_for(Session, "before_commit")
+def _write_queued_rows(session):
+    # One multi-row insert per table and transaction instead of an ORM object per row.
+    # Core inserts: the ORM bulk path splits rows whenever their NULL columns differ.
+    for key, model in (('ledger', LedgerEntry), ('outbox', OutboxMessage)):
+        rows = session.info.pop(key, None)
+        if rows:
+            session.execute(insert(model.__table__), rows)
+    rollups = session.info.pop('rollups', None)
+    if rollups:
+        _write_rollups(session, rollups)
+
+@event.listens_for(Session, "after_commit")
+def _invalidate_changed_users(session):
+    changed = session.info.pop('changed_users', None)
+    if changed:
+        user_cache.invalidate(*changed)
+    for telegram_id, username in session.info.pop('usernames', {}).items():
+        username_index.set_username(telegram_id, username)
+    for org_id, telegram_id in session.info.pop('memberships', ()):
+        username_index.add_member(org_id, telegram_id)
+    for chat_id, org_id in session.info.pop('groups', ()):
+        group_directory.link(chat_id, org_id)
+
+@event.listens_for(Session, "after_rollback")
+def _forget_changed_users(session):
+    for key in ('changed_users', 'usernames', 'memberships', 'groups', 'ledger', 'outbox', 'rollups'):
+        session.info.pop(key, None)
+
+def _mark_changed(session, telegram_id):
+    # Cached copies are dropped once the transaction commits
+    session.info.setdefault('changed_users', set()).add(str(telegram_id))
+
+def _index_username(session, telegram_id, username):
+    session.info.setdefault('usernames', {})[str(telegram_id)] = username
+
+def _index_membership(session, org_id, telegram_id):
+    session.info.setdefault('memberships', []).append((org_id, str(telegram_id)))
+
+def _index_group(session, chat_id, org_id):
+    session.info.setdefault('groups', []).append((str(chat_id), org_id))
+
+# Dialects with INSERT ... ON CONFLICT
+_CONFLICT_INSERTS = {'sqlite': sqlite.insert, 'postgresql': postgresql.insert}
+
+def _insert_missing(session, model, rows, keys):
+    """Insert rows whose keys (a unique index) aren't taken yet; returns the key tuples inserted."""
+    table = model.__table__
+    dialect_insert = _CONFLICT_INSERTS.get(session.get_bind().dialect.name)
+    if dialect_insert is None:
+        # No ON CONFLICT: look each row up first, which concurrent inserts can race
+        inserted = []
+        for row in rows:
+            if session.execute(select(table.c.id).filter_by(**{key: row[key] for key in keys})).first() is None:
+                session.execute(insert(table), row)
+                inserted.append(tuple(row[key] for key in keys))
+        return inserted
+    statement = (
+        dialect_insert(table).values(rows)
+        .on_conflict_do_nothing(index_elements=keys)
+        .returning(*(table.c[key] for key in keys))
+    )
+    return [tuple(row) for row in session.execute(statement)]
+
+def warm_username_index():
+    """Load every username, organization membership and group link into the in-memory indexes.
+
+    Run at startup and every INDEX_REFRESH_INTERVAL seconds, which picks up
+    users and groups added by other workers.
+    """
+    username_index.start_reload()
+    group_directory.start_reload()
+    session = Session()
+    try:
+        username_index.load(
+            session.query(User.telegram_id, User.username).all(),
+            session.query(UserOrganization.org_id, UserOrganization.user_id).all()
+        )
+        group_directory.load(
+            session.query(Group.telegram_group_id, Group.org_id).filter(Group.org_id.isnot(None)).all()
+        )
+    finally:
+        session.close()
+
+def to_minor(points):
+    return int(round(points * POINTS_SCALE))
+
+def from_minor(amount):
+    return amount / POINTS_SCALE
+
+def _add_months(when, months, day=None):
+    """`when` moved by whole months onto `day` (default its own day of month)."""
+    year, month = divmod(when.year * 12 + when.month - 1 + months, 12)
+    # Clamp to the last day of shorter months (Jan 31 -> Feb 28)
+    day = min(day or when.day, calendar.monthrange(year, month + 1)[1])
+    return when.replace(year=year, month=month + 1, day=day)
+
+def _advance(interval, when, anchor_day=None):
+    if interval == 'daily':
+        return when + datetime.timedelta(days=1)
+    if interval == 'weekly':
+        return when + datetime.timedelta(weeks=1)
+    if interval == 'monthly':
+        return _add_months(when, 1, anchor_day)
+    raise ValueError(f"Invalid interval: {interval}")
+
+def next_run_after(interval, last_run, now=None, anchor_day=None):
+    """Next slot on the interval's schedule from last_run that is later than now.
+
+    Monthly slots fall on anchor_day (default last_run's day), clamped only in
+    months too short for it, so Jan 31 runs on Feb 28 and then Mar 31.
+    Runs missed while the bot was down are skipped rather than paid out in a burst.
+    """
+    now = now or last_run
+    anchor_day = anchor_day or last_run.day
+    next_run = _advance(interval, last_run, anchor_day)
+    while next_run <= now:
+        next_run = _advance(interval, next_run, anchor_day)
+    return next_run
+
+def _get_or_create_user(session, telegram_id, username):
+    user = session.query(User).filter_by(telegram_id=str(telegram_id)).first()
+    if not user:
+        user = User(telegram_id=str(telegram_id), username=username)
+        session.add(user)
+        session.flush()
+        _record(session, user.telegram_id, user.points_balance, 'opening')
+        _index_username(session, user.telegram_id, username)
+    elif user.username != username:
+        user.username = username
+        _mark_changed(session, user.telegram_id)
+        _index_username(session, user.telegram_id, username)
+    return user
+
+def _get_user_by_username(session, username, requested_by=None):
+    """Resolve a username in any case; on failure suggest close names from the requester's orgs."""
+    telegram_id = username_index.resolve(username)
+    if telegram_id is not None:
+        user = session.query(User).filter_by(telegram_id=telegram_id).first()
+    else:
+        # Index not warmed (scripts, benchmarks): fall back to an exact indexed match
+        user = session.query(User).filter_by(username=username).first()
+    if not user:
+        org_ids = username_index.orgs_of(requested_by) if requested_by else None
+        raise UserNotFound(username, username_index.suggest(username, org_ids))
+    return user
+
+def _record(session, telegram_id, points, kind, counterparty_id=None, reference_id=None):
+    # Written at commit together with the transaction's other entries; nothing reads them before
+    _mark_changed(session, telegram_id)
+    session.info.setdefault('ledger', []).append({
+        "user_id": str(telegram_id),
+        "amount": to_minor(points),
+        "kind": kind,
+        "counterparty_id": counterparty_id,
+        "reference_id": reference_id,
+        "created_at": datetime.datetime.now()
+    })
+
+def _to_hundredths(points):
+    return from_minor(to_minor(points))
+
+def _valid_amount(points, allow_zero=False):
+    """Whether points is a finite amount of at least a hundredth of a point (or zero, if allowed)."""
+    if points is None or not math.isfinite(points):
+        return False  # NULL (a stored NaN), NaN or infinity
+    return to_minor(points) >= 0 if allow_zero else to_minor(points) > 0
+
+def _rounded_balance(balance):
+    # Balances are floats; rounding every write to hundredths keeps them equal to
+    # the ledger's integer sum instead of drifting (99.00000000000001).
+    # One-argument ROUND because PostgreSQL has no ROUND(double precision, int).
+    return func.round(balance * POINTS_SCALE) / POINTS_SCALE
+
+def _debit(session, telegram_id, amount, kind, counterparty_id=None, reference_id=None):
+    """Take amount from a balance only if it covers it; False means insufficient funds."""
+    if not _valid_amount(amount, allow_zero=True):
+        return False  # a negative debit would be a credit
+    amount = _to_hundredths(amount)
+    debited = session.execute(
+        update(User)
+        .where(User.telegram_id == telegram_id, User.points_balance >= amount)
+        .values(points_balance=_rounded_balance(User.points_balance - amount))
+        .execution_options(synchronize_session=False)
+    ).rowcount
+    if debited != 1:
+        return False
+    _record(session, telegram_id, -amount, kind, counterparty_id, reference_id)
+    return True
+
+def _credit(session, telegram_id, amount, kind, counterparty_id=None, reference_id=None):
+    if not _valid_amount(amount, allow_zero=True):
+        raise ValueError(f"Invalid amount: {amount}")
+    amount = _to_hundredths(amount)
+    session.execute(
+        update(User)
+        .where(User.telegram_id == telegram_id)
+        .values(points_balance=_rounded_balance(User.points_balance + amount))
+        .execution_options(synchronize_session=False)
+    )
+    _record(session, telegram_id, amount, kind, counterparty_id, reference_id)
+
+def _transfer(session, giver_id, receiver_id, amount, kind='transfer', reference_id=None):
+    """Move points between users inside the caller's transaction.
+
+    The balance check and debit are one conditional UPDATE, so concurrent transfers
+    can't both spend the same points and no read-modify-write update is lost.
+    Returns False, changing nothing, when the giver can't cover the amount or it
+    isn't a finite positive number once rounded to hundredths of a point.
+    """
+    if not _valid_amount(amount):
+        return False
+    if not _debit(session, giver_id, amount, kind, receiver_id, reference_id):
+        return False
+    _credit(session, receiver_id, amount, kind, giver_id, reference_id)
+    return True
+
+def _reset_balance(session, telegram_id):
+    # Writing the row first locks it (SQLite: the database) until commit, so the
+    # balance read next is the one zeroed and recorded in the ledger; NULL counts as 0
+    user = update(User).where(User.telegram_id == telegram_id).execution_options(synchronize_session=False)
+    session.execute(user.values(points_balance=func.coalesce(User.points_balance, 0)))
+    balance = session.query(User.points_balance).filter_by(telegram_id=telegram_id).scalar() or 0
+    session.execute(user.values(points_balance=0))
+    _record(session, telegram_id, -balance, 'reset')
+
+def _notify(session, notify, *args):
+    """Queue the (chat_id, kind, text, details) notifications notify(*args) returns in this transaction.
+
+    Non-urgent ones wait DIGEST_WINDOW seconds so later ones for the same chat can join a digest.
+    """
+    if notify is None:
+        return
+    now = datetime.datetime.now()
+    held_until = now + datetime.timedelta(seconds=DIGEST_WINDOW)
+    session.info.setdefault('outbox', []).extend(
+        {
+            "chat_id": str(chat_id),
+            "kind": kind,
+            "text": text,
+            "details": json.dumps(details) if details is not None else None,
+            "status": 'pending',
+            "attempts": 0,
+            "next_attempt_at": now if kind in URGENT_NOTIFICATIONS else held_until,
+            "created_at": now
+        }
+        for chat_id, kind, text, details in notify(*args)
+    )
+
+def _roll_up(session, group_id, giver_id, receiver_id, amount):
+    """Count a recognition in today's rollups; written at commit with the transaction's others."""
+    rollups = session.info.setdefault('rollups', {})
+    today = datetime.date.today()
+    group_id = group_id or ''
+    rollups.setdefault((group_id, today, str(receiver_id)), [0.0, 0.0])[0] += amount
+    rollups.setdefault((group_id, today, str(giver_id)), [0.0, 0.0])[1] += amount
+
+def _write_rollups(session, rollups):
+    table = PointsRollup.__table__
+    rows = [
+        {"group_id": group_id, "period_start": day, "span": 'day', "user_id": user_id, "received": received, "given": given}
+        for (group_id, day, user_id), (received, given) in rollups.items()
+    ]
+    dialect_insert = _CONFLICT_INSERTS.get(session.get_bind().dialect.name)
+    if dialect_insert is None:
+        for row in rows:
+            updated = session.execute(
+                update(table)
+                .where(table.c.group_id == row["group_id"], table.c.period_start == row["period_start"],
+                       table.c.span == 'day', table.c.user_id == row["user_id"])
+                .values(received=table.c.received + row["received"], given=table.c.given + row["given"])
+            ).rowcount
+            if not updated:
+                session.execute(insert(table), row)
+        return
+    statement = dialect_insert(table)
+    session.execute(
+        statement.on_conflict_do_update(
+            index_elements=['group_id', 'period_start', 'span', 'user_id'],
+            set_={
+                "received": table.c.received + statement.excluded.received,
+                "given": table.c.given + statement.excluded.given
+            }
+        ),
+        rows
+    )
+
+def _top_members(session, totals, members, limit):
+    """(username, points) for the first `limit` rows of a (user_id, points) query ranked
+    best first, skipping users outside `members` unless that is None."""
+    if members is None:
+        ranked = session.execute(totals.limit(limit)).all()
+    else:
+        # Stream the ranking and stop once enough members were seen, rather
+        # than sending the membership set to the database
+        ranked = []
+        for user_id, points in session.execute(totals.execution_options(yield_per=limit)):
+            if user_id in members:
+                ranked.append((user_id, points))
+                if len(ranked) == limit:
+                    break
+    usernames = dict(
+        session.query(User.telegram_id, User.username).filter(User.telegram_id.in_([u for u, _ in ranked]))
+    ) if ranked else {}
+    return [(usernames.get(user_id), points) for user_id, points in ranked]
+
+def _link_tags(session, recognition, tags):
+    names = Tag.names(tags)
+    if not names:
+        return
+    _insert_missing(session, Tag, [{'name': name} for name in names], ('name',))
+    tag_ids = session.execute(select(Tag.id).where(Tag.name.in_(names))).scalars()
+    session.execute(insert(RecognitionTag.__table__), [
+        {
+            'recognition_id': recognition.id,
+            'tag_id': tag_id,
+            'group_id': recognition.group_id,
+            'receiver_id': recognition.receiver_id,
+            'points': recognition.points,
+            'created_at': recognition.created_at
+        }
+        for tag_id in tag_ids
+    ])
+
+def _find_recognition(session, recognition_id):
+    """A recognition by id, or its read-only row once archived."""
+    recognition = session.get(Recognition, recognition_id)
+    if recognition is None and has_archive(session.get_bind()):
+        recognition = session.execute(
+            select(archived_recognitions).where(archived_recognitions.c.id == recognition_id)
+        ).first()
+    return recognition
+
+def _scope_archived_comment(session, comment):
+    # The search index trigger only sees main.recognitions (SQLite triggers can't
+    # reach attached databases), so a comment on an archived recognition got just
+    # its commenter's scope; add the recognition's from the archive
+    session.execute(text(
+        "UPDATE main.search_index SET scope = COALESCE("
+        "(SELECT " + SEARCH_SCOPE.format(r="r") + " FROM main.recognitions AS r WHERE r.id = :recognition_id), "
+        "(SELECT " + SEARCH_SCOPE.format(r="r") + f" FROM {ARCHIVE_SCHEMA}.recognitions AS r WHERE r.id = :recognition_id)"
+        ") || ' u' || :user_id WHERE rowid = :rowid"
+    ), {"recognition_id": comment.recognition_id, "user_id": comment.user_id, "rowid": comment.id * 2 + 1})
+
+def _rows_by_id(session, tables, ids):
+    found = {}
+    for table in tables:
+        if ids:
+            found.update((row.id, row) for row in session.execute(select(table).where(table.c.id.in_(ids))))
+    return found
+
+def _ranked_matches(session, schema, match, count):
+    """The first count (rowid, snippet) from a search index: matches among the newest
+    SEARCH_RECENT_ROWS entries best first, then older matches best first.
+
+    The order doesn't depend on count, so successive pages never overlap or skip.
+    """
+    # Ranking costs a score per match, which for common words is most of the index;
+    # older entries are only scored once the newest ones run out
+    newest = session.execute(text(f"SELECT rowid FROM {schema}.search_index ORDER BY rowid DESC LIMIT 1")).scalar() or 0
+    floor = max(newest - SEARCH_RECENT_ROWS, 0)
+    windows = ["rowid >= :floor", "rowid < :floor"] if floor else ["rowid >= :floor"]
+    rows = []
+    for window in windows:
+        rows += session.execute(text(
+            f"SELECT rowid, snippet(search_index, 0, '«', '»', '…', 12) FROM {schema}.search_index "
+            f"WHERE search_index MATCH :match AND {window} "
+            "ORDER BY bm25(search_index, 1.0, 0.0) LIMIT :count"
+        ), {"match": match, "floor": floor, "count": count - len(rows)}).all()
+        if len(rows) == count:
+            break
+    return rows
+
+def _match_terms(terms):
+    """An FTS5 query requiring every word of terms; a trailing * makes a word a prefix."""
+    words = []
+    for word in terms.replace('"', ' ').split():
+        prefix = word.endswith('*')
+        word = word.rstrip('*')
+        if word:
+            words.append(f'"{word}"*' if prefix else f'"{word}"')
+    return " ".join(words)
+
+def _search_scopes(group_ids, user_id):
+    # Tokens of the search index's scope column, as written by migration 12's triggers
+    scopes = ['g' + str(group_id).replace('-', 'n') for group_id in group_ids or ()]
+    if user_id is not None:
+        scopes.append(f'u{user_id}')
+    return scopes
+
+def _credit_group_points(session, group_id, user_id, amount):
+    credited = session.execute(
+        update(GroupPoints)
+        .where(GroupPoints.group_id == group_id, GroupPoints.user_id == user_id)
+        .values(points=GroupPoints.points + amount)
+    ).rowcount
+    if not credited:
+        session.add(GroupPoints(group_id=group_id, user_id=user_id, points=amount))
+
+class UserRepository:
+    async def get_or_create(self, telegram_id, username):
+        key = str(telegram_id)
+        user = user_cache.get(key)
+        if user is not None and user.username == username:
+            return user
+
+        generation = user_cache.generation(key)
+        user = await run_in_session(_get_or_create_user, telegram_id, username)
+        user_cache.put(key, user, generation)
+        return user
+
+    async def get_by_username(self, username):
+        def _query(session):
+            return session.query(User).filter_by(username=username).first()
+        return await run_in_session(_query)
+
+    async def add_points(self, username, amount, notify=None):
+        def _query(session):
+            user = _get_user_by_username(session, username)
+            _credit(session, user.telegram_id, amount, 'grant')
+            session.refresh(user)
+            _notify(session, notify, user, amount)
+            return user
+        return await run_in_session(_query)
+
+    async def reset(self, username, notify=None):
+        def _query(session):
+            user = _get_user_by_username(session, username)
+            _reset_balance(session, user.telegram_id)
+            session.refresh(user)
+            _notify(session, notify, user)
+            return user
+        return await run_in_session(_query)
+
+    async def info(self, username):
+        def _query(session):
+            user = _get_user_by_username(session, username)
+            received = sum(
+                session.execute(select(func.count()).select_from(table).where(table.c.receiver_id == user.telegram_id)).scalar()
+                for table in recognition_tables(session.get_bind())
+            )
+            return user, received
+        return await run_in_session(_query)
+
+    async def top_by_balance(self, limit=10):
+        def _query(session):
+            return session.query(User).order_by(User.points_balance.desc()).limit(limit).all()
+        return await run_in_session(_query)
+
+class RecognitionRepository:
+    async def give(self, giver_id, giver_username, receiver_username, amount, message, tags=None, group_id=None, notify=None):
+        if not _valid_amount(amount):
+            raise ValueError(f"Invalid amount: {amount}")
+        # Balances move by hundredths of a point; the recognition, group totals and rollups must match
+        amount = _to_hundredths(amount)
+
+        def _query(session):
+            giver = _get_or_create_user(session, giver_id, giver_username)
+            receiver = _get_user_by_username(session, receiver_username, giver_id)
+            recognition = Recognition(
+                giver_id=str(giver.telegram_id),
+                receiver_id=str(receiver.telegram_id),
+                points=amount,
+                message=message,
+                tags=",".join(tags) if tags is not None else None,
+                group_id=group_id
+            )
+            session.add(recognition)
+            session.flush()
+            if not _transfer(session, giver.telegram_id, receiver.telegram_id, amount, reference_id=recognition.id):
+                raise InsufficientPoints()
+
+            session.refresh(giver)
+            session.refresh(receiver)
+            if group_id is not None:
+                _credit_group_points(session, group_id, recognition.receiver_id, amount)
+            _roll_up(session, group_id, recognition.giver_id, recognition.receiver_id, amount)
+            _link_tags(session, recognition, tags or ())
+            _notify(session, notify, giver, receiver, recognition)
+            session.flush()
+            return giver, receiver, recognition
+        return await run_in_session(_query)
+
+    async def get(self, recognition_id):
+        def _query(session):
+            return _find_recognition(session, recognition_id)
+        return await run_in_session(_query)
+
+    async def add_comment(self, recognition_id, user_id, username, text):
+        def _query(session):
+            user = _get_or_create_user(session, user_id, username)
+            comment = Comment(
+                recognition_id=recognition_id,
+                user_id=str(user.telegram_id),
+                text=text
+            )
+            session.add(comment)
+            session.flush()
+            recognition = _find_recognition(session, recognition_id) if recognition_id else None
+            if recognition is not None and not isinstance(recognition, Recognition):
+                _scope_archived_comment(session, comment)
+            return user, recognition
+        return await run_in_session(_query)
+
+    async def group_leaderboard(self, group_id, limit=10):
+        def _query(session):
+            return (
+                session.query(User.username, GroupPoints.points)
+                .select_from(GroupPoints)
+                .outerjoin(User, User.telegram_id == GroupPoints.user_id)
+                .filter(GroupPoints.group_id == group_id)
+                .order_by(GroupPoints.points.desc())
+                .limit(limit)
+                .all()
+            )
+        return await run_in_session(_query)
+
+    async def window_leaderboard(self, start, end, group_ids=None, members=None, limit=10):
+        """Top (username, points received) from start up to end (dates, end exclusive), from the rollups.
+
+        group_ids limits it to those groups; None counts everything, including
+        recognitions made outside groups. Compacted months are only ever covered
+        whole, since windows reaching back that far are calendar months.
+        """
+        def _query(session):
+            totals = (
+                select(PointsRollup.user_id, func.sum(PointsRollup.received))
+                .where(PointsRollup.period_start >= start, PointsRollup.period_start < end)
+                .group_by(PointsRollup.user_id)
+                .having(func.sum(PointsRollup.received) > 0)
+                .order_by(func.sum(PointsRollup.received).desc())
+            )
+            if group_ids is not None:
+                totals = totals.where(PointsRollup.group_id.in_(group_ids))
+            return _top_members(session, totals, members, limit)
+        return await run_in_session(_query)
+
+    async def org_leaderboard(self, group_ids, members, limit=10):
+        """Top (username, points received) across the given groups, all-time, counting only members."""
+        def _query(session):
+            totals = (
+                select(GroupPoints.user_id, func.sum(GroupPoints.points))
+                .where(GroupPoints.group_id.in_(group_ids))
+                .group_by(GroupPoints.user_id)
+                .having(func.sum(GroupPoints.points) > 0)
+                .order_by(func.sum(GroupPoints.points).desc())
+            )
+            return _top_members(session, totals, members, limit)
+        return await run_in_session(_query)
+
+    async def group_stats(self, group_ids, start=None, end=None, org_id=None):
+        """Activity in the given groups, optionally between two dates and of one organization's members, from the rollups.
+
+        Returns (points, givers, receivers, [(group_id, points)] busiest first).
+        """
+        def _query(session):
+            window = [PointsRollup.group_id.in_(group_ids)]
+            if org_id is not None:
+                window.append(PointsRollup.user_id.in_(
+                    select(UserOrganization.user_id).where(UserOrganization.org_id == org_id)
+                ))
+            if start is not None:
+                window += [PointsRollup.period_start >= start, PointsRollup.period_start < end]
+            by_group = (
+                session.query(PointsRollup.group_id, func.sum(PointsRollup.received))
+                .filter(*window)
+                .group_by(PointsRollup.group_id)
+                .order_by(func.sum(PointsRollup.received).desc())
+                .all()
+            )
+            givers, receivers = session.query(
+                func.count(func.distinct(case((PointsRollup.given > 0, PointsRollup.user_id)))),
+                func.count(func.distinct(case((PointsRollup.received > 0, PointsRollup.user_id))))
+            ).filter(*window).one()
+            return sum(points for _, points in by_group), givers, receivers, by_group
+        return await run_in_session(_query)
+
+    async def trending_tags(self, start, end, group_ids=None, limit=10):
+        """Most used tags from start up to end as [(name, uses, points)]; group_ids limits it to those groups."""
+        def _query(session):
+            window = [RecognitionTag.created_at >= start, RecognitionTag.created_at < end]
+            if group_ids is not None:
+                window.append(RecognitionTag.group_id.in_(group_ids))
+            uses = func.count().label('uses')
+            top = (
+                select(RecognitionTag.tag_id, uses, func.sum(RecognitionTag.points).label('points'))
+                .where(*window)
+                .group_by(RecognitionTag.tag_id)
+                .order_by(uses.desc())
+                .limit(limit)
+                .subquery()
+            )
+            return session.execute(
+                select(Tag.name, top.c.uses, top.c.points)
+                .join(top, top.c.tag_id == Tag.id)
+                .order_by(top.c.uses.desc(), Tag.name)
+            ).all()
+        return await run_in_session(_query)
+
+    async def tag_leaderboard(self, tag, start=None, end=None, group_ids=None, members=None, limit=10):
+        """Top (username, points received) in recognitions carrying a tag, optionally between two dates,
+        in the given groups and counting only `members`."""
+        def _query(session):
+            tag_id = session.execute(select(Tag.id).where(Tag.name == tag)).scalar()
+            if tag_id is None:
+                return []
+            totals = (
+                select(RecognitionTag.receiver_id, func.sum(RecognitionTag.points))
+                .where(RecognitionTag.tag_id == tag_id)
+                .group_by(RecognitionTag.receiver_id)
+                .order_by(func.sum(RecognitionTag.points).desc())
+            )
+            if start is not None:
+                totals = totals.where(RecognitionTag.created_at >= start, RecognitionTag.created_at < end)
+            if group_ids is not None:
+                totals = totals.where(RecognitionTag.group_id.in_(group_ids))
+            return _top_members(session, totals, members, limit)
+        return await run_in_session(_query)
+
+    async def tag_profile(self, username, limit=10):
+        """(user, [(tag name, times recognized, points)]) for the tags a user was recognized with most."""
+        def _query(session):
+            user = _get_user_by_username(session, username)
+            uses = func.count().label('uses')
+            tags = session.execute(
+                select(Tag.name, uses, func.sum(RecognitionTag.points))
+                .join(Tag, Tag.id == RecognitionTag.tag_id)
+                .where(RecognitionTag.receiver_id == user.telegram_id)
+                .group_by(Tag.name)
+                .order_by(uses.desc(), Tag.name)
+                .limit(limit)
+            ).all()
+            return user, tags
+        return await run_in_session(_query)
+
+    async def search(self, terms, group_ids=None, user_id=None, offset=0, limit=10):
+        """Recognitions and comments matching terms, best first, hot before archived:
+        ([(recognition, comment or None, snippet)],
+        {telegram_id: username}, whether more follow).
+
+        Only recognitions in group_ids, or given, received or commented on by
+        user_id, are found unless both are None. Returns None without a search index.
+        """
+        def _query(session):
+            if session.get_bind().dialect.name != 'sqlite':
+                return None
+            match = _match_terms(terms)
+            if not match:
+                return [], {}, False
+            match = f"body:({match})"
+            scopes = _search_scopes(group_ids, user_id)
+            if scopes:
+                match += f" AND scope:({' OR '.join(scopes)})"
+            # Archived entries come after the hot ones: they are only read once those run out
+            wanted = offset + limit + 1
+            rows = _ranked_matches(session, 'main', match, wanted)
+            bind = session.get_bind()
+            if len(rows) < wanted and has_archive(bind):
+                rows += _ranked_matches(session, ARCHIVE_SCHEMA, match, wanted - len(rows))
+            rows = rows[offset:]
+            more = len(rows) > limit
+            rows = rows[:limit]
+
+            # Rows 2 * id are recognitions and 2 * id + 1 comments; ids stay the same when archived
+            comments = _rows_by_id(session, comment_tables(bind), [rowid // 2 for rowid, _ in rows if rowid % 2])
+            recognition_ids = [rowid // 2 for rowid, _ in rows if not rowid % 2]
+            recognition_ids += [c.recognition_id for c in comments.values() if c.recognition_id]
+            found = _rows_by_id(session, recognition_tables(bind), recognition_ids)
+            hits = []
+            for rowid, snippet in rows:
+                comment = comments.get(rowid // 2) if rowid % 2 else None
+                recognition = found.get(comment.recognition_id if comment else rowid // 2)
+                if comment or recognition:
+                    hits.append((recognition, comment, snippet))
+            people = {c.user_id for c in comments.values()}
+            for recognition in found.values():
+                people.update((recognition.giver_id, recognition.receiver_id))
+            usernames = dict(
+                session.query(User.telegram_id, User.username).filter(User.telegram_id.in_(people))
+            ) if people else {}
+            return hits, usernames, more
+        return await run_in_session(_query)
+
+    async def compact_rollups(self, before):
+        """Fold the daily rollups of the oldest month starting before `before` into one row per group and user.
+
+        Returns (month, daily rows removed), or None when no such month is left.
+        """
+        def _query(session):
+            first = (
+                session.query(func.min(PointsRollup.period_start))
+                .filter(PointsRollup.span == 'day', PointsRollup.period_start < before)
+                .scalar()
+            )
+            if first is None:
+                return None
+            month = first.replace(day=1)
+            in_month = and_(
+                PointsRollup.span == 'day',
+                PointsRollup.period_start >= month,
+                PointsRollup.period_start < _add_months(month, 1)
+            )
+            monthly = (
+                select(
+                    PointsRollup.group_id,
+                    literal(month, Date),
+                    literal('month'),
+                    PointsRollup.user_id,
+                    func.sum(PointsRollup.received),
+                    func.sum(PointsRollup.given)
+                )
+                .where(in_month)
+                .group_by(PointsRollup.group_id, PointsRollup.user_id)
+            )
+            session.execute(insert(PointsRollup).from_select(
+                ['group_id', 'period_start', 'span', 'user_id', 'received', 'given'], monthly
+            ))
+            return month, session.execute(delete(PointsRollup).where(in_month)).rowcount
+        return await run_in_session(_query)
+
+    async def archive_month(self, before):
+        """Move the recognitions and comments of the oldest whole month ending by `before`
+        into the archive database, with their search index entries.
+
+        Aggregates (group points, rollups, tag links) stay in the main database and
+        are unchanged. The newest row of each table is never moved, so SQLite keeps
+        handing out ids above the archived ones. Returns (month, recognitions moved,
+        comments moved), or None when no such month is left or there is no archive.
+        """
+        def _query(session):
+            if not has_archive(session.get_bind()):
+                return None
+            newest = {
+                table: session.execute(select(func.max(table.c.id))).scalar() or 0
+                for table in (Recognition.__table__, Comment.__table__)
+            }
+            first = (
+                session.query(func.min(Recognition.created_at))
+                .filter(Recognition.id < newest[Recognition.__table__])
+                .scalar()
+            )
+            if first is None:
+                return None
+            month = first.date().replace(day=1)
+            if _add_months(month, 1) > before:
+                return None
+            end = datetime.datetime.combine(_add_months(month, 1), datetime.time())
+
+            moved = []
+            for hot, cold, parity in ((Recognition.__table__, archived_recognitions, 0), (Comment.__table__, archived_comments, 1)):
+                old = and_(hot.c.created_at < end, hot.c.id < newest[hot])
+                # OR IGNORE/REPLACE: a crash between the two files' commits leaves rows in
+                # both, and the next run must be able to move them again
+                session.execute(
+                    insert(cold).prefix_with("OR IGNORE").from_select([c.name for c in hot.columns], select(hot).where(old))
+                )
+                hot_index, cold_index = search_index(), search_index(ARCHIVE_SCHEMA)
+                session.execute(insert(cold_index).prefix_with("OR REPLACE").from_select(
+                    ['rowid', 'body', 'scope'],
+                    select(hot_index.c.rowid, hot_index.c.body, hot_index.c.scope)
+                    .where(hot_index.c.rowid.in_(select(hot.c.id * 2 + parity).where(old)))
+                ))
+                # The delete triggers drop the hot search index entries
+                moved.append(session.execute(delete(hot).where(old)).rowcount)
+            return month, moved[0], moved[1]
+        return await run_in_session(_query)
+
+    async def participants(self, group_id, after=None, limit=IMPORT_CHUNK_SIZE):
+        """(telegram_id, username) of users who gave or received points in a group, by keyset on telegram_id."""
+        def _query(session):
+            seen = union(*(
+                select(table.c[column]).where(table.c.group_id == str(group_id))
+                for table in recognition_tables(session.get_bind())
+                for column in ('giver_id', 'receiver_id')
+            ))
+            query = session.query(User.telegram_id, User.username).filter(User.telegram_id.in_(seen))
+            if after is not None:
+                query = query.filter(User.telegram_id > after)
+            return [tuple(row) for row in query.order_by(User.telegram_id).limit(limit)]
+        return await run_in_session(_query)
+
+    async def rebuild_group_points(self):
+        """Recompute every group leaderboard aggregate from recognition history."""
+        def _query(session):
+            session.execute(delete(GroupPoints))
+            history = union_all(*(
+                select(table.c.group_id, table.c.receiver_id, table.c.points).where(table.c.group_id.isnot(None))
+                for table in recognition_tables(session.get_bind())
+            )).subquery()
+            totals = (
+                select(history.c.group_id, history.c.receiver_id, func.sum(history.c.points))
+                .group_by(history.c.group_id, history.c.receiver_id)
+            )
+            return session.execute(
+                insert(GroupPoints).from_select(['group_id', 'user_id', 'points'], totals)
+            ).rowcount
+        return await run_in_session(_query)
+
+class RewardRepository:
+    async def all(self):
+        def _query(session):
+            return session.query(Reward).all()
+        return await run_in_session(_query)
+
+class RedemptionRepository:
+    async def request(self, user_id, username, reward_id, notify=None):
+        def _query(session):
+            user = _get_or_create_user(session, user_id, username)
+            reward = session.get(Reward, reward_id)
+            if not reward:
+                raise NotFound(reward_id)
+            if user.points_balance < reward.points_required:
+                # Only a courtesy check; the debit itself is conditional
+                raise InsufficientPoints()
+
+            request = RedemptionRequest(
+                user_id=str(user.telegram_id),
+                reward_id=reward.id
+            )
+            session.add(request)
+            session.flush()
+            if not reward.requires_approval:
+                if not _debit(session, user.telegram_id, reward.points_required, 'redemption', reference_id=request.id):
+                    raise InsufficientPoints()
+                request.status = 'approved'
+            session.flush()
+            _notify(session, notify, user, reward, request)
+            return user, reward, request
+        return await run_in_session(_query)
+
+    async def approve(self, request_id, notify=None):
+        def _query(session):
+            request = session.get(RedemptionRequest, request_id)
+            if not request:
+                raise NotFound(request_id)
+            # Claim the request first so two admins can't approve it twice
+            claimed = session.execute(
+                update(RedemptionRequest)
+                .where(RedemptionRequest.id == request.id, RedemptionRequest.status == 'pending')
+                .values(status='approved')
+                .execution_options(synchronize_session=False)
+            ).rowcount
+            if not claimed:
+                raise NotFound(request_id)
+
+            user = session.query(User).filter_by(telegram_id=request.user_id).first()
+            reward = session.get(Reward, request.reward_id)
+            if not _debit(session, user.telegram_id, reward.points_required, 'redemption', reference_id=request.id):
+                raise InsufficientPoints()
+            session.refresh(request)
+            _notify(session, notify, user, reward, request)
+            return user, reward, request
+        return await run_in_session(_query)
+
+class RecurringBonusRepository:
+    async def create(self, giver_id, giver_username, receiver_username, amount, interval, next_run, anchor_day=None):
+        def _query(session):
+            if not _valid_amount(amount):
+                raise ValueError(f"Invalid amount: {amount}")
+            giver = _get_or_create_user(session, giver_id, giver_username)
+            receiver = _get_user_by_username(session, receiver_username, giver_id)
+            if giver.points_balance < amount:
+                raise InsufficientPoints()
+
+            bonus = RecurringBonus(
+                giver_id=str(giver.telegram_id),
+                receiver_id=str(receiver.telegram_id),
+                amount=_to_hundredths(amount),
+                interval=interval,
+                next_run=next_run,
+                anchor_day=anchor_day
+            )
+            session.add(bonus)
+            return bonus
+        return await run_in_session(_query)
+
+    async def process_due_batch(self, now, after_id=0, limit=RECURRING_BATCH_SIZE, notify=None):
+        """Pay up to `limit` due bonuses with ids above after_id in one transaction.
+
+        Returns (last id examined, [(giver, receiver, bonus) paid]); the id is None once
+        no due bonuses remain. Bonuses the giver can't afford stay due for the next run.
+        """
+        def _query(session):
+            bonuses = (
+                session.query(RecurringBonus)
+                .filter(
+                    RecurringBonus.is_active == True,
+                    RecurringBonus.next_run <= now,
+                    RecurringBonus.id > after_id
+                )
+                .order_by(RecurringBonus.id)
+                .limit(limit)
+                .all()
+            )
+            if not bonuses:
+                return None, []
+
+            telegram_ids = {b.giver_id for b in bonuses} | {b.receiver_id for b in bonuses}
+            users_by_id = {
+                user.telegram_id: user
+                for user in session.query(User).filter(User.telegram_id.in_(telegram_ids))
+            }
+            paid = []
+            recognitions = []
+            # Without this every balance UPDATE would first flush the previous
+            # bonus's changes one by one; at commit they go out as batched statements
+            with session.no_autoflush:
+                for bonus in bonuses:
+                    giver = users_by_id.get(bonus.giver_id)
+                    receiver = users_by_id.get(bonus.receiver_id)
+                    if not giver or not receiver:
+                        continue
+                    if not _valid_amount(bonus.amount):
+                        # Stored before amounts were validated (NaN reads back as NULL); never payable
+                        bonus.is_active = False
+                        print(f"Disabled recurring bonus {bonus.id}: invalid amount {bonus.amount}")
+                        continue
+                    # The amount the balances move by, so the recognition and rollups agree with them
+                    amount = _to_hundredths(bonus.amount)
+                    if not _transfer(session, giver.telegram_id, receiver.telegram_id, amount, 'recurring', bonus.id):
+                        continue
+
+                    recognitions.append({
+                        "giver_id": bonus.giver_id,
+                        "receiver_id": bonus.receiver_id,
+                        "points": amount,
+                        "message": f"Recurring bonus ({bonus.interval})",
+                        "group_id": None
+                    })
+                    _roll_up(session, None, bonus.giver_id, bonus.receiver_id, amount)
+                    bonus.next_run = next_run_after(bonus.interval, bonus.next_run, now, bonus.anchor_day)
+                    _notify(session, notify, giver, receiver, bonus)
+                    paid.append((giver, receiver, bonus))
+            if recognitions:
+                session.execute(insert(Recognition.__table__), recognitions)
+            return bonuses[-1].id, paid
+        return await run_in_session(_query)
+
+class OrganizationRepository:
+    async def all(self):
+        def _query(session):
+            return session.query(Organization).all()
+        return await run_in_session(_query)
+
+    async def administered_by(self, user_id):
+        def _query(session):
+            return session.query(Organization).filter_by(admin_id=str(user_id)).all()
+        return await run_in_session(_query)
+
+    async def groups(self, org_id):
+        def _query(session):
+            return session.query(Group).filter_by(org_id=org_id).all()
+        return await run_in_session(_query)
+
+    async def get_group(self, group_id):
+        def _query(session):
+            return session.get(Group, group_id)
+        return await run_in_session(_query)
+
+    async def get(self, org_id):
+        def _query(session):
+            return session.get(Organization, org_id)
+        return await run_in_session(_query)
+
+    async def link_group(self, org_id, chat_id, title):
+        """Attach a group chat to an organization, moving it if it was linked elsewhere."""
+        def _query(session):
+            group = session.query(Group).filter_by(telegram_group_id=str(chat_id)).first()
+            if group is None:
+                group = Group(telegram_group_id=str(chat_id))
+                session.add(group)
+            group.org_id = org_id
+            group.group_name = title
+            _index_group(session, chat_id, org_id)
+            return group
+        return await run_in_session(_query)
+
+    async def create(self, name, admin_id):
+        def _query(session):
+            org = Organization(name=name, admin_id=str(admin_id))
+            session.add(org)
+            session.flush()
+            return org
+        return await run_in_session(_query)
+
+    async def import_members(self, org_id, members):
+        """Enroll (telegram_id, username) members, creating unknown users, in one transaction.
+
+        Set-based and idempotent: users and memberships that already exist are
+        left alone, except that a username the roster has changed is updated.
+        Returns (users created, memberships added). Callers split large rosters
+        into IMPORT_CHUNK_SIZE pieces.
+        """
+        def _query(session):
+            usernames = {str(telegram_id): username or None for telegram_id, username in members}
+            if not usernames:
+                return 0, 0
+            created = {telegram_id for telegram_id, in _insert_missing(
+                session, User, [{"telegram_id": t, "username": u} for t, u in usernames.items()], ['telegram_id']
+            )}
+            for telegram_id in created:
+                _record(session, telegram_id, STARTING_BALANCE, 'opening')
+                if usernames[telegram_id]:
+                    _index_username(session, telegram_id, usernames[telegram_id])
+
+            renamed = [
+                {"key": telegram_id, "new_username": usernames[telegram_id]}
+                for telegram_id, username in session.query(User.telegram_id, User.username)
+                .filter(User.telegram_id.in_(set(usernames) - created))
+                if usernames[telegram_id] and usernames[telegram_id] != username
+            ]
+            if renamed:
+                session.execute(
+                    update(User.__table__)
+                    .where(User.__table__.c.telegram_id == bindparam('key'))
+                    .values(username=bindparam('new_username')),
+                    renamed
+                )
+                for row in renamed:
+                    _mark_changed(session, row["key"])
+                    _index_username(session, row["key"], row["new_username"])
+
+            joined = _insert_missing(
+                session, UserOrganization, [{"user_id": t, "org_id": org_id} for t in usernames], ['user_id', 'org_id']
+            )
+            for telegram_id, _ in joined:
+                _index_membership(session, org_id, telegram_id)
+            return len(created), len(joined)
+        return await run_in_session(_query)
+
+    async def add_member(self, org_id, user_ref):
+        """Add a user, given as '@username' or a Telegram ID, to an organization."""
+        def _query(session):
+            if user_ref.startswith("@"):
+                user = _get_user_by_username(session, user_ref[1:])
+            else:
+                user = session.query(User).filter_by(telegram_id=user_ref).first()
+            if not user:
+                raise NotFound(user_ref)
+            if _insert_missing(session, UserOrganization, [{"user_id": user.telegram_id, "org_id": org_id}], ['user_id', 'org_id']):
+                _index_membership(session, org_id, user.telegram_id)
+            return user
+        return await run_in_session(_query)
+
+class BroadcastRepository:
+    async def create(self, admin_id, text):
+        def _query(session):
+            broadcast = Broadcast(admin_id=str(admin_id), text=text, total=session.query(User).count())
+            session.add(broadcast)
+            session.flush()
+            return broadcast
+        return await run_in_session(_query)
+
+    async def unfinished(self):
+        def _query(session):
+            return session.query(Broadcast).filter_by(status='running').all()
+        return await run_in_session(_query)
+
+    async def recipients_after(self, last_user_id, limit):
+        """Next chunk of (users.id, telegram_id, username) by keyset on users.id."""
+        def _query(session):
+            return (
+                session.query(User.id, User.telegram_id, User.username)
+                .filter(User.id > last_user_id)
+                .order_by(User.id)
+                .limit(limit)
+                .all()
+            )
+        return await run_in_session(_query)
+
+    async def checkpoint(self, broadcast_id, last_user_id, sent, failed, status='running'):
+        def _query(session):
+            session.execute(
+                update(Broadcast)
+                .where(Broadcast.id == broadcast_id)
+                .values(last_user_id=last_user_id, sent=sent, failed=failed, status=status)
+            )
+        return await run_in_session(_query)
+
+class LedgerRepository:
+    async def history(self, user_id, before_id=None, limit=10):
+        """A page of a user's ledger, newest first, as (entry, counterparty username).
+
+        Keyset pagination on (user_id, id): pass the last id shown as before_id.
+        """
+        def _query(session):
+            query = (
+                session.query(LedgerEntry, User.username)
+                .outerjoin(User, User.telegram_id == LedgerEntry.counterparty_id)
+                .filter(LedgerEntry.user_id == str(user_id))
+            )
+            if before_id is not None:
+                query = query.filter(LedgerEntry.id < before_id)
+            return query.order_by(LedgerEntry.id.desc()).limit(limit).all()
+        return await run_in_session(_query)
+
+    async def balance_at(self, user_id, when):
+        """Balance in points at `when`: the latest snapshot before it plus the entries since."""
+        def _query(session):
+            snapshot = (
+                session.query(BalanceSnapshot)
+                .filter(BalanceSnapshot.user_id == str(user_id), BalanceSnapshot.created_at <= when)
+                .order_by(BalanceSnapshot.ledger_id.desc())
+                .first()
+            )
+            tail = session.query(func.coalesce(func.sum(LedgerEntry.amount), 0)).filter(
+                LedgerEntry.user_id == str(user_id),
+                LedgerEntry.id > (snapshot.ledger_id if snapshot else 0),
+                LedgerEntry.created_at <= when
+            ).scalar()
+            return from_minor((snapshot.balance if snapshot else 0) + tail)
+        return await run_in_session(_query)
+
+    async def snapshot(self):
+        """Snapshot every balance that changed since its last snapshot. Returns rows written."""
+        def _query(session):
+            upto = session.query(func.max(LedgerEntry.id)).scalar()
+            if upto is None:
+                return 0
+            return session.execute(text(
+                "INSERT INTO balance_snapshots (user_id, ledger_id, balance, created_at) "
+                "SELECT e.user_id, MAX(e.id), COALESCE(s.balance, 0) + SUM(e.amount), :now "
+                "FROM ledger_entries e "
+                "LEFT JOIN (SELECT user_id, MAX(ledger_id) AS ledger_id FROM balance_snapshots GROUP BY user_id) latest "
+                "ON latest.user_id = e.user_id "
+                "LEFT JOIN balance_snapshots s ON s.user_id = latest.user_id AND s.ledger_id = latest.ledger_id "
+                "WHERE e.id > COALESCE(latest.ledger_id, 0) AND e.id <= :upto "
+                "GROUP BY e.user_id, s.balance"
+            ), {"now": datetime.datetime.now(), "upto": upto}).rowcount
+        return await run_in_session(_query)
+
+class StateRepository:
+    async def load(self, scope):
+        """All (key, data, updated_at) rows of a scope."""
+        def _query(session):
+            return session.execute(
+                select(BotState.key, BotState.data, BotState.updated_at).where(BotState.scope == scope)
+            ).all()
+        return await run_in_session(_query)
+
+    async def fetch(self, keys):
+        """{(scope, key): (data, updated_at)} for the requested pairs that exist."""
+        def _query(session):
+            rows = session.execute(
+                select(BotState.scope, BotState.key, BotState.data, BotState.updated_at)
+                .where(or_(*(and_(BotState.scope == scope, BotState.key == key) for scope, key in keys)))
+            )
+            return {(row.scope, row.key): (row.data, row.updated_at) for row in rows}
+        return await run_in_session(_query)
+
+    async def save(self, entries, updated_at):
+        """Write {(scope, key): data} in one transaction; None deletes the entry."""
+        def _query(session):
+            for (scope, key), data in entries.items():
+                match = (BotState.scope == scope, BotState.key == key)
+                if data is None:
+                    session.execute(delete(BotState).where(*match))
+                    continue
+                written = session.execute(
+                    update(BotState).where(*match).values(data=data, updated_at=updated_at)
+                ).rowcount
+                if not written:
+                    session.add(BotState(scope=scope, key=key, data=data, updated_at=updated_at))
+        await run_in_session(_query)
+
+class OutboxRepository:
+    async def claim(self, now, lease_until, limit):
+        """Lease up to `limit` due messages to this worker until lease_until.
+
+        Non-urgent messages for the same chats that are still waiting out their
+        first digest window are leased with them so they can go out as one
+        digest; ones already tried keep their retry backoff. Each row is claimed
+        with a conditional update, so workers sharing the database never take
+        the same message; an expired lease makes it due again.
+        """
+        unleased = or_(OutboxMessage.leased_until.is_(None), OutboxMessage.leased_until <= now)
+        due = and_(OutboxMessage.status == 'pending', OutboxMessage.next_attempt_at <= now, unleased)
+        # Never tried nor leased, so no sender has it and no backoff applies
+        held = and_(
+            OutboxMessage.status == 'pending',
+            OutboxMessage.attempts == 0,
+            OutboxMessage.leased_until.is_(None),
+            OutboxMessage.kind.notin_(URGENT_NOTIFICATIONS)
+        )
+
+        def _lease(session, message_ids, condition):
+            return [
+                message_id for message_id in message_ids
+                if session.execute(
+                    update(OutboxMessage)
+                    .where(OutboxMessage.id == message_id, condition)
+                    .values(leased_until=lease_until)
+                    .execution_options(synchronize_session=False)
+                ).rowcount
+            ]
+
+        def _query(session):
+            rows = session.execute(
+                select(OutboxMessage.id, OutboxMessage.chat_id, OutboxMessage.kind)
+                .where(due)
+                .order_by(OutboxMessage.next_attempt_at, OutboxMessage.id)
+                .limit(limit)
+            ).all()
+            claimed = _lease(session, [row.id for row in rows], due)
+            if not claimed:
+                return []
+
+            digest_chats = {row.chat_id for row in rows if row.id in claimed and row.kind not in URGENT_NOTIFICATIONS}
+            if digest_chats:
+                waiting = session.execute(
+                    select(OutboxMessage.id).where(held, OutboxMessage.chat_id.in_(digest_chats))
+                ).scalars().all()
+                claimed += _lease(session, waiting, held)
+            return session.query(OutboxMessage).filter(OutboxMessage.id.in_(claimed)).order_by(OutboxMessage.id).all()
+        return await run_in_session(_query)
+
+    async def complete(self, delivered, failed):
+        """Delete delivered message ids; failed is [(id, attempts, next_attempt_at or None to dead-letter, error)]."""
+        def _query(session):
+            if delivered:
+                session.execute(delete(OutboxMessage).where(OutboxMessage.id.in_(delivered)))
+            for message_id, attempts, next_attempt_at, error in failed:
+                values = {"attempts": attempts, "last_error": error, "leased_until": None}
+                if next_attempt_at is None:
+                    values["status"] = 'dead'
+                else:
+                    values["next_attempt_at"] = next_attempt_at
+                session.execute(
+                    update(OutboxMessage)
+                    .where(OutboxMessage.id == message_id)
+                    .values(**values)
+                    .execution_options(synchronize_session=False)
+                )
+        await run_in_session(_query)
+
+    async def counts(self):
+        """{status: messages} for pending and dead-lettered notifications."""
+        def _query(session):
+            return dict(session.execute(
+                select(OutboxMessage.status, func.count()).group_by(OutboxMessage.status)
+            ).all())
+        return await run_in_session(_query)
+
+users = UserRepository()
+recognitions = RecognitionRepository()
+rewards = RewardRepository()
+redemptions = RedemptionRepository()
+recurring_bonuses = RecurringBonusRepository()
+organizations = OrganizationRepository()
+broadcasts = BroadcastRepository()
+ledger = LedgerRepository()
+bot_state = StateRepository()
+outbox = OutboxRepository()
@@ -0,0 +1,73 @@
+# roster.py
+import csv
+import io
+import json
+
+ROSTER_MAX_BYTES = 20 * 1024 * 1024  # the Bot API won't hand bots bigger files
+ID_COLUMNS = ("telegram_id", "id", "user_id")
+
+def _member(telegram_id, username, where):
+    telegram_id = str(telegram_id).strip()
+    if not telegram_id.lstrip("-").isdigit():
+        raise ValueError(f"{where}: '{telegram_id}' is not a Telegram ID")
+    username = (username or "").strip().lstrip("@") or None
+    return telegram_id, username
+
+def _parse_csv(text):
+    rows = list(csv.reader(io.StringIO(text)))
+    if not rows:
+        return []
+    header = [column.strip().lower() for column in rows[0]]
+    id_column = next((header.index(name) for name in ID_COLUMNS if name in header), None)
+    if id_column is None:
+        # No header: telegram_id[,username] on every line
+        id_column, name_column, start = 0, 1, 0
+    else:
+        name_column = header.index("username") if "username" in header else None
+        start = 1
+    members = []
+    for number, row in enumerate(rows[start:], start + 1):
+        if not any(cell.strip() for cell in row):
+            continue
+        username = row[name_column] if name_column is not None and name_column < len(row) else None
+        members.append(_member(row[id_column], username, f"Line {number}"))
+    return members
+
+def _parse_json(text):
+    data = json.loads(text)
+    if isinstance(data, dict):
+        data = data.get("members", [])
+    if not isinstance(data, list):
+        raise ValueError('JSON must be a list of members, or an object with a "members" list')
+    members = []
+    for number, entry in enumerate(data, 1):
+        where = f"Entry {number}"
+        if isinstance(entry, dict):
+            telegram_id = next((entry[name] for name in ID_COLUMNS if name in entry), "")
+            username = entry.get("username")
+        else:
+            telegram_id, username = entry, None
+        if isinstance(telegram_id, (dict, list, bool, float)):
+            raise ValueError(f"{where}: the Telegram ID must be a number or a string")
+        if username is not None and not isinstance(username, str):
+            raise ValueError(f"{where}: the username must be a string")
+        members.append(_member(telegram_id, username, where))
+    return members
+
+def parse_roster(filename, data):
+    """(telegram_id, username) pairs from an uploaded CSV or JSON roster, one per Telegram ID.
+
+    CSV needs a telegram_id (or id/user_id) column and may have a username column;
+    without a header every line is telegram_id[,username]. JSON is a list of IDs or
+    of objects with those keys, optionally under "members". Raises ValueError.
+    """
+    text = data.decode("utf-8-sig")
+    if filename.lower().endswith(".json") or text.lstrip().startswith(("[", "{")):
+        try:
+            members = _parse_json(text)
+        except json.JSONDecodeError as e:
+            raise ValueError(f"Invalid JSON: {e}")
+    else:
+        members = _parse_csv(text)
+    # A later line for the same ID wins
+    return list(dict(members).items())
@@ -0,0 +1,35 @@
+# tests/conftest.py
+import os
+import sys
+import tempfile
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+# database.py opens DATABASE_URL on import; keep test runs out of the working directory.
+# The archive is attached too, so reads that span both databases are exercised.
+_directory = tempfile.mkdtemp(prefix='rahmat-tests-')
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{os.path.join(_directory, 'bot.db')}")
+os.environ.setdefault("ARCHIVE_DATABASE", os.path.join(_directory, 'archive.db'))
+
+@pytest.fixture
+def session():
+    from database import Session
+    session = Session()
+    yield session
+    session.rollback()
+    session.close()
+
+@pytest.fixture
+def make_user(session):
+    """Create committed users with fresh telegram ids: make_user(balance=100.0) -> telegram_id."""
+    from models import User
+    def make(balance=100.0):
+        user = User(username=None, points_balance=balance)
+        session.add(user)
+        session.flush()
+        user.telegram_id = f"test{user.id}"
+        user.username = user.telegram_id
+        session.commit()
+        return user.telegram_id
+    return make
@@ -0,0 +1,39 @@
+# tests/test_amounts.py
+import asyncio
+import datetime
+
+import pytest
+from models import RecurringBonus, User
+from repository import _credit, _transfer, recurring_bonuses
+
+def balance(session, telegram_id):
+    session.expire_all()
+    return session.query(User.points_balance).filter_by(telegram_id=telegram_id).scalar()
+
+@pytest.mark.parametrize("amount", [None, float("nan"), float("inf"), float("-inf"), -1, 0, 0.001])
+def test_transfer_rejects_invalid_amounts(session, make_user, amount):
+    giver, receiver = make_user(), make_user()
+    assert _transfer(session, giver, receiver, amount) is False
+    session.commit()
+    assert (balance(session, giver), balance(session, receiver)) == (100.0, 100.0)
+
+def test_credit_rejects_non_finite_amounts(session, make_user):
+    user = make_user()
+    for amount in (None, float("nan"), float("inf")):
+        with pytest.raises(ValueError):
+            _credit(session, user, amount, 'grant')
+
+def test_due_batch_disables_bonus_without_amount_and_pays_the_rest(session, make_user):
+    giver, receiver = make_user(), make_user()
+    now = datetime.datetime.now()
+    broken = RecurringBonus(giver_id=giver, receiver_id=receiver, amount=None, interval='daily', next_run=now)
+    good = RecurringBonus(giver_id=giver, receiver_id=receiver, amount=5, interval='daily', next_run=now)
+    session.add_all([broken, good])
+    session.commit()
+
+    _, paid = asyncio.run(recurring_bonuses.process_due_batch(now, after_id=broken.id - 1, limit=2))
+
+    assert [bonus.id for _, _, bonus in paid] == [good.id]
+    session.expire_all()
+    assert session.get(RecurringBonus, broken.id).is_active is False
+    assert (balance(session, giver), balance(session, receiver)) == (95.0, 105.0)
@@ -0,0 +1,49 @@
+# tests/test_balances.py
+import asyncio
+import datetime
+
+from sqlalchemy import func
+from models import GroupPoints, LedgerEntry, PointsRollup, Recognition, User
+from repository import _reset_balance, _transfer, recognitions
+
+def balance(session, telegram_id):
+    session.expire_all()
+    return session.query(User.points_balance).filter_by(telegram_id=telegram_id).scalar()
+
+def ledger_total(session, telegram_id):
+    return session.query(func.sum(LedgerEntry.amount)).filter_by(user_id=telegram_id).scalar() or 0
+
+def test_repeated_transfers_stay_in_hundredths(session, make_user):
+    giver, receiver = make_user(), make_user()
+    for _ in range(10):
+        assert _transfer(session, giver, receiver, 0.1)
+    session.commit()
+    assert (balance(session, giver), balance(session, receiver)) == (99.0, 101.0)
+    assert ledger_total(session, receiver) == 100
+
+def test_give_stores_the_rounded_amount_everywhere(session, make_user):
+    giver, receiver = make_user(), make_user()
+    _, _, recognition = asyncio.run(recognitions.give(giver, giver, receiver, 0.333, "thanks", group_id="-42"))
+    assert recognition.points == 0.33
+    assert balance(session, receiver) == 100.33
+    assert session.get(Recognition, recognition.id).points == 0.33
+    assert session.get(GroupPoints, ("-42", receiver)).points == 0.33
+    received = session.query(PointsRollup.received).filter_by(
+        group_id="-42", user_id=receiver, period_start=datetime.date.today(), span='day'
+    ).scalar()
+    assert received == 0.33
+
+def test_reset_records_the_balance_it_removed(session, make_user):
+    user = make_user(balance=42.5)
+    _reset_balance(session, user)
+    session.commit()
+    assert balance(session, user) == 0
+    assert ledger_total(session, user) == -4250
+
+def test_reset_treats_a_null_balance_as_zero(session, make_user):
+    user = make_user()
+    session.query(User).filter_by(telegram_id=user).update({User.points_balance: None})
+    _reset_balance(session, user)
+    session.commit()
+    assert balance(session, user) == 0
+    assert ledger_total(session, user) == 0
@@ -0,0 +1,37 @@
+# tests/test_cache.py
+import time
+
+from cache import GroupDirectory, UserCache
+
+def test_user_cache_skips_loads_that_raced_an_invalidation():
+    cache = UserCache()
+    generation = cache.generation("1")
+    cache.invalidate("1")  # a commit changed the user while it was being read
+    cache.put("1", "stale", generation)
+    assert cache.get("1") is None
+    cache.put("1", "fresh", cache.generation("1"))
+    assert cache.get("1") == "fresh"
+
+def test_user_cache_evicts_least_recently_used():
+    cache = UserCache(maxsize=2)
+    for key in ("1", "2"):
+        cache.put(key, key, 0)
+    cache.get("1")
+    cache.put("3", "3", 0)
+    assert (cache.get("1"), cache.get("2"), cache.get("3")) == ("1", None, "3")
+    assert cache.stats()["entries"] == 2
+
+def test_user_cache_entries_expire():
+    cache = UserCache(ttl=0.01)
+    cache.put("1", "user", 0)
+    time.sleep(0.02)
+    assert cache.get("1") is None
+    assert cache.stats()["misses"] == 1
+
+def test_group_directory_moves_relinked_groups():
+    directory = GroupDirectory()
+    directory.load([(-1, 1), (-2, 1)])
+    directory.link(-2, 2)
+    assert directory.org_of("-2") == 2
+    assert directory.groups(1) == ["-1"]
+    assert directory.groups(2) == ["-2"]
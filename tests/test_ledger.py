@@ -0,0 +1,21 @@
+# tests/test_ledger.py
+import asyncio
+import datetime
+
+from repository import _credit, _debit, ledger
+
+def test_balance_at_adds_entries_after_the_latest_snapshot(session, make_user):
+    user = make_user()
+    _credit(session, user, 10, 'grant')
+    session.commit()
+    before_second = datetime.datetime.now()
+    _debit(session, user, 2.5, 'redemption')
+    session.commit()
+    assert asyncio.run(ledger.balance_at(user, before_second)) == 10
+    assert asyncio.run(ledger.balance_at(user, datetime.datetime.now())) == 7.5
+
+    asyncio.run(ledger.snapshot())
+    _credit(session, user, 0.25, 'grant')
+    session.commit()
+    assert asyncio.run(ledger.balance_at(user, before_second)) == 10
+    assert asyncio.run(ledger.balance_at(user, datetime.datetime.now())) == 7.75
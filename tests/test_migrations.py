@@ -0,0 +1,38 @@
+# tests/test_migrations.py
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import create_engine, inspect, text
+from migrations import MIGRATIONS, upgrade
+from models import Base
+
+LOOKUPS = {
+    "SELECT * FROM users WHERE username = 'alice'": "ix_users_username",
+    "SELECT * FROM recognitions WHERE group_id = '-1001'": "ix_recognitions_group_id",
+    "SELECT * FROM recurring_bonuses WHERE is_active = 1 AND next_run <= '2026-01-01'": "ix_recurring_bonuses_due",
+}
+
+def query_plan(engine, statement):
+    with engine.connect() as conn:
+        return " ".join(row[-1] for row in conn.execute(text(f"EXPLAIN QUERY PLAN {statement}")))
+
+def test_upgrade_from_baseline_turns_scans_into_index_searches(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'bot.db'}")
+    assert upgrade(engine, target=1) == 1
+    for statement in LOOKUPS:
+        assert query_plan(engine, statement).startswith("SCAN")
+
+    assert upgrade(engine) == MIGRATIONS[-1][0]
+    for statement, index in LOOKUPS.items():
+        assert query_plan(engine, statement).startswith("SEARCH")
+        assert index in query_plan(engine, statement)
+
+def test_fresh_database_matches_models(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'bot.db'}")
+    upgrade(engine)
+    inspector = inspect(engine)
+    for table in Base.metadata.sorted_tables:
+        assert {column["name"] for column in inspector.get_columns(table.name)} == {column.name for column in table.columns}
+        assert {index["name"] for index in inspector.get_indexes(table.name)} == {index.name for index in table.indexes}
@@ -0,0 +1,35 @@
+# tests/test_outbox.py
+import json
+from types import SimpleNamespace
+
+from outbox import DIGEST_MAX_MESSAGES, TELEGRAM_MAX_LENGTH, digest_text
+
+def received(points, giver, message="thanks", balance=None):
+    details = {"points": points, "from": giver, "message": message}
+    if balance is not None:
+        details["balance"] = balance
+    return SimpleNamespace(details=json.dumps(details), text=f"{points} from {giver}")
+
+def test_digest_totals_points_per_giver_and_appends_plain_messages():
+    text = digest_text([
+        received(0.1, "ann"),
+        received(0.2, "bob"),
+        received(5, "ann", balance=105.3),
+        SimpleNamespace(details=None, text="Your redemption was approved"),
+    ])
+    assert text.splitlines()[:2] == [
+        "🎉 You received 5.3 points in 3 recognitions!",
+        "From: @ann (5.1), @bob (0.2)",
+    ]
+    assert "Your new balance: 105.3" in text
+    assert text.endswith("\n\nYour redemption was approved")
+
+def test_digest_quotes_a_limited_number_of_messages():
+    text = digest_text([received(1, "ann", f"message {i}") for i in range(DIGEST_MAX_MESSAGES + 3)])
+    assert text.count("• @ann") == DIGEST_MAX_MESSAGES
+    assert "…and 3 more" in text
+
+def test_digest_fits_one_telegram_message():
+    text = digest_text([received(1, "ann", "x" * 1000) for _ in range(DIGEST_MAX_MESSAGES)])
+    assert len(text) == TELEGRAM_MAX_LENGTH
+    assert text.endswith("…")
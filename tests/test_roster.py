@@ -0,0 +1,30 @@
+# tests/test_roster.py
+import pytest
+from roster import parse_roster
+
+def test_csv_with_header_in_any_column_order():
+    data = b"username,telegram_id\n@alice,1\n,2\n\nbob,3\n"
+    assert parse_roster("team.csv", data) == [("1", "alice"), ("2", None), ("3", "bob")]
+
+def test_csv_without_header_and_later_lines_win():
+    assert parse_roster("team.csv", b"1,alice\n2\n1,alicia\n") == [("1", "alicia"), ("2", None)]
+
+def test_json_list_of_ids_or_objects():
+    assert parse_roster("team.json", b'[1, {"id": 2, "username": "@bob"}]') == [("1", None), ("2", "bob")]
+    assert parse_roster("team.json", b'{"members": [{"user_id": "3"}]}') == [("3", None)]
+
+@pytest.mark.parametrize("filename, data", [
+    ("team.csv", b"telegram_id\nabc\n"),
+    ("team.json", b"[1, 2"),
+    ("team.json", b'[{"username": "alice"}]'),
+    ("team.json", b'"1,2,3"'),
+    ("team.json", b'42'),
+    ("team.json", b'{"members": {"1": "alice"}}'),
+    ("team.json", b'[{"id": 1, "username": ["alice"]}]'),
+    ("team.json", b'[{"id": 1, "username": 7}]'),
+    ("team.json", b'[[1, "alice"]]'),
+    ("team.csv", b"\xff\xfe1,alice"),
+])
+def test_bad_rosters_raise_value_error(filename, data):
+    with pytest.raises(ValueError):
+        parse_roster(filename, data)
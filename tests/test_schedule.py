@@ -0,0 +1,41 @@
+# tests/test_schedule.py
+from datetime import datetime
+
+import pytest
+from repository import next_run_after
+
+def runs(interval, start, count, anchor_day=None):
+    found, run = [], start
+    for _ in range(count):
+        run = next_run_after(interval, run, anchor_day=anchor_day)
+        found.append(run)
+    return found
+
+def test_december_rolls_over_into_january():
+    assert next_run_after('monthly', datetime(2025, 12, 15, 9)) == datetime(2026, 1, 15, 9)
+    assert next_run_after('monthly', datetime(2025, 12, 31), anchor_day=31) == datetime(2026, 1, 31)
+    assert next_run_after('daily', datetime(2025, 12, 31, 23, 30)) == datetime(2026, 1, 1, 23, 30)
+    assert next_run_after('weekly', datetime(2025, 12, 29)) == datetime(2026, 1, 5)
+
+def test_day_31_is_clamped_in_short_months_and_restored_after():
+    assert runs('monthly', datetime(2026, 1, 31, 9), 5, anchor_day=31) == [
+        datetime(2026, 2, 28, 9),
+        datetime(2026, 3, 31, 9),
+        datetime(2026, 4, 30, 9),
+        datetime(2026, 5, 31, 9),
+        datetime(2026, 6, 30, 9),
+    ]
+
+def test_leap_year_february_has_29_days():
+    assert runs('monthly', datetime(2024, 1, 31), 2, anchor_day=31) == [datetime(2024, 2, 29), datetime(2024, 3, 31)]
+    assert runs('monthly', datetime(2024, 1, 29), 2) == [datetime(2024, 2, 29), datetime(2024, 3, 29)]
+    assert next_run_after('monthly', datetime(2023, 1, 29)) == datetime(2023, 2, 28)
+
+def test_missed_runs_are_skipped_and_keep_the_anchor():
+    now = datetime(2026, 4, 1)
+    assert next_run_after('monthly', datetime(2026, 1, 31), now, anchor_day=31) == datetime(2026, 4, 30)
+    assert next_run_after('daily', datetime(2026, 3, 1, 8), now) == datetime(2026, 4, 1, 8)
+
+def test_unknown_interval():
+    with pytest.raises(ValueError):
+        next_run_after('yearly', datetime(2026, 1, 1))
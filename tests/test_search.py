@@ -0,0 +1,47 @@
+# tests/test_search.py
+import asyncio
+
+from sqlalchemy import insert
+import repository
+from archive import archived_recognitions
+from main import SEARCHES_KEPT, remember_search
+from models import Recognition
+from repository import recognitions
+
+def test_pages_follow_one_order_across_the_recent_window(session, monkeypatch):
+    session.execute(insert(Recognition), [
+        {"giver_id": "1", "receiver_id": "2", "points": 1, "group_id": "-77",
+         "message": "pagingword " + "filler " * (i % 5)}
+        for i in range(60)
+    ])
+    session.commit()
+    monkeypatch.setattr(repository, "SEARCH_RECENT_ROWS", 50)  # the window holds only some matches
+
+    everything, _, _ = asyncio.run(recognitions.search("pagingword", ["-77"], None, 0, 100))
+    paged, offset, more = [], 0, True
+    while more:
+        hits, _, more = asyncio.run(recognitions.search("pagingword", ["-77"], None, offset, 7))
+        paged += hits
+        offset += 7
+    assert len(everything) == 60
+    assert [r.id for r, _, _ in paged] == [r.id for r, _, _ in everything]
+
+def test_remembered_searches_are_shared_by_the_chat_and_bounded():
+    chat_data = {}
+    search_id = remember_search(chat_data, "release migr*")
+    assert chat_data["searches"][search_id] == "release migr*"
+    assert len(f"search_{search_id}_1000") <= 64  # Telegram's callback data limit
+    for i in range(SEARCHES_KEPT):
+        remember_search(chat_data, f"terms {i}")
+    assert search_id not in chat_data["searches"]
+    assert len(chat_data["searches"]) == SEARCHES_KEPT
+
+def test_comments_on_archived_recognitions_keep_the_group_scope(session):
+    session.execute(insert(archived_recognitions), [
+        {"id": 900001, "giver_id": "1", "receiver_id": "2", "points": 1, "message": "old news", "group_id": "-88"}
+    ])
+    session.commit()
+    asyncio.run(recognitions.add_comment(900001, "3", "carol", "latecomerword"))
+
+    hits, _, _ = asyncio.run(recognitions.search("latecomerword", ["-88"], None))
+    assert [(recognition.id, comment.text) for recognition, comment, _ in hits] == [(900001, "latecomerword")]
@@ -0,0 +1,77 @@
+# tests/test_username_index.py
+import threading
+import time
+
+from username_index import UsernameIndex
+
+def loaded_index():
+    index = UsernameIndex()
+    index.load(
+        [("1", "Alice"), ("2", "alfred"), ("3", "Bob"), ("4", None)],
+        [(10, "1"), (10, "3"), (20, "2"), (20, "4")]
+    )
+    return index
+
+def test_resolve_ignores_case():
+    index = loaded_index()
+    assert index.resolve("ALICE") == "1"
+    assert index.resolve("carol") is None
+
+def test_complete_and_members_per_organization():
+    index = loaded_index()
+    assert index.complete("al") == ["alfred", "Alice"]
+    assert index.complete("al", org_ids=[20]) == ["alfred"]
+    assert index.members(20) == {"2", "4"}
+    assert index.orgs_of("1") == {10}
+
+def test_renamed_and_new_members_are_indexed():
+    index = loaded_index()
+    index.set_username("1", "Alicia")
+    index.add_member(20, "3")
+    assert index.resolve("alice") is None
+    assert index.complete("al", org_ids=[10]) == ["Alicia"]
+    assert index.complete("b", org_ids=[20]) == ["Bob"]
+
+def test_load_matches_incremental_updates():
+    users = [(str(i), f"user{i % 700}") for i in range(1000)]  # some names move to later accounts
+    memberships = [(i % 7, str(i)) for i in range(0, 1000, 3)]
+    loaded = UsernameIndex()
+    loaded.load(users, memberships)
+    incremental = UsernameIndex()
+    for telegram_id, username in users:
+        incremental.set_username(telegram_id, username)
+    for org_id, telegram_id in memberships:
+        incremental.add_member(org_id, telegram_id)
+    for attribute in ("_by_name", "_name_of", "_sorted", "_org_sorted", "_member_orgs", "_org_members"):
+        assert getattr(loaded, attribute) == getattr(incremental, attribute)
+
+def test_lookups_during_reload_see_a_whole_index():
+    users = [(str(i), f"user{i}") for i in range(50000)]
+    index = UsernameIndex()
+    index.load(users, [])
+    misses = []
+    done = threading.Event()
+
+    def reload():
+        for _ in range(5):
+            index.load(users, [])
+        done.set()
+
+    thread = threading.Thread(target=reload)
+    thread.start()
+    while not done.is_set():
+        if index.resolve("user49999") is None:
+            misses.append(1)
+        time.sleep(0)
+    thread.join()
+    assert not misses
+
+def test_reload_keeps_updates_made_while_reading_rows():
+    index = loaded_index()
+    index.start_reload()
+    rows = [("1", "Alice"), ("2", "alfred"), ("3", "Bob")]  # read before the commits below
+    index.set_username("5", "Dave")
+    index.add_member(10, "5")
+    index.load(rows, [(10, "1")])
+    assert index.resolve("dave") == "5"
+    assert index.members(10) == {"1", "5"}
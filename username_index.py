@@ -0,0 +1,167 @@
+# username_index.py
+import difflib
+import threading
+from bisect import bisect_left, insort
+
+class UsernameIndex:
+    """Case-insensitive in-memory index of usernames, globally and per organization.
+
+    Names are kept in sorted lists so a prefix lookup is a binary search plus a
+    slice. Updated from DB worker threads after commits, hence the lock.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._by_name = {}        # lowercase name -> (username, telegram_id)
+        self._name_of = {}        # telegram_id -> lowercase name
+        self._sorted = []
+        self._org_sorted = {}     # org_id -> sorted lowercase names of members
+        self._member_orgs = {}    # telegram_id -> {org_id}
+        self._org_members = {}    # org_id -> {telegram_id}
+        self._replay = None       # updates made while a reload reads the database
+
+    def start_reload(self):
+        """Call before reading the rows for load(); updates from then on are re-applied on top of them."""
+        with self._lock:
+            self._replay = []
+
+    def load(self, users, memberships):
+        """Replace the index with (telegram_id, username) users and (org_id, telegram_id) memberships.
+
+        Built outside the lock and swapped in whole, so lookups during a reload
+        see either the old index or the new one.
+        """
+        by_name, name_of = {}, {}
+        for telegram_id, username in users:
+            if not username:
+                continue
+            telegram_id, name = str(telegram_id), username.lower()
+            previous = by_name.get(name)
+            if previous:
+                name_of.pop(previous[1], None)
+            by_name[name] = (username, telegram_id)
+            name_of[telegram_id] = name
+        member_orgs, org_members = {}, {}
+        for org_id, telegram_id in memberships:
+            telegram_id = str(telegram_id)
+            member_orgs.setdefault(telegram_id, set()).add(org_id)
+            org_members.setdefault(org_id, set()).add(telegram_id)
+        org_sorted = {
+            org_id: sorted(name_of[telegram_id] for telegram_id in members if telegram_id in name_of)
+            for org_id, members in org_members.items()
+        }
+        names = sorted(by_name)
+        with self._lock:
+            self._by_name = by_name
+            self._name_of = name_of
+            self._sorted = names
+            self._org_sorted = org_sorted
+            self._member_orgs = member_orgs
+            self._org_members = org_members
+            for update, args in self._replay or ():
+                update(*args)
+            self._replay = None
+
+    def set_username(self, telegram_id, username):
+        with self._lock:
+            self._set_username(telegram_id, username)
+            if self._replay is not None:
+                self._replay.append((self._set_username, (telegram_id, username)))
+
+    def add_member(self, org_id, telegram_id):
+        with self._lock:
+            self._add_member(org_id, telegram_id)
+            if self._replay is not None:
+                self._replay.append((self._add_member, (org_id, telegram_id)))
+
+    def resolve(self, username):
+        """telegram_id for a username in any case, or None."""
+        with self._lock:
+            entry = self._by_name.get(username.lower())
+            return entry[1] if entry else None
+
+    def orgs_of(self, telegram_id):
+        with self._lock:
+            return set(self._member_orgs.get(str(telegram_id), ()))
+
+    def members(self, org_id):
+        """Telegram IDs enrolled in an organization, as a snapshot."""
+        with self._lock:
+            return frozenset(self._org_members.get(org_id, ()))
+
+    def complete(self, prefix, org_ids=None, limit=10):
+        """Usernames starting with prefix, within the given organizations if any."""
+        prefix = prefix.lower()
+        with self._lock:
+            matches = set()
+            for names in self._scopes(org_ids):
+                start = bisect_left(names, prefix)
+                for name in names[start:start + limit]:
+                    if not name.startswith(prefix):
+                        break
+                    matches.add(name)
+            return [self._by_name[name][0] for name in sorted(matches)[:limit]]
+
+    def suggest(self, username, org_ids=None, limit=3):
+        """Closest known usernames to a failed lookup, for "did you mean" replies."""
+        target = username.lower()
+        with self._lock:
+            # Compare against names sharing the first letter; a full scan would be O(users)
+            candidates = set()
+            for names in self._scopes(org_ids):
+                start = bisect_left(names, target[:1])
+                for name in names[start:]:
+                    if not name.startswith(target[:1]):
+                        break
+                    candidates.add(name)
+            matches = difflib.get_close_matches(target, candidates, n=limit, cutoff=0.6)
+            return [self._by_name[name][0] for name in matches]
+
+    def _scopes(self, org_ids):
+        if not org_ids:
+            return [self._sorted]
+        return [self._org_sorted.get(org_id, []) for org_id in org_ids]
+
+    def _set_username(self, telegram_id, username):
+        telegram_id = str(telegram_id)
+        old = self._name_of.pop(telegram_id, None)
+        if old is not None:
+            self._by_name.pop(old, None)
+            self._discard(self._sorted, old)
+            for org_id in self._member_orgs.get(telegram_id, ()):
+                self._discard(self._org_sorted[org_id], old)
+        if not username:
+            return
+
+        name = username.lower()
+        previous = self._by_name.get(name)
+        if previous:
+            # The name moved to another account (usernames are unique on Telegram)
+            self._name_of.pop(previous[1], None)
+            for org_id in self._member_orgs.get(previous[1], ()):
+                self._discard(self._org_sorted[org_id], name)
+        else:
+            insort(self._sorted, name)
+        self._by_name[name] = (username, telegram_id)
+        self._name_of[telegram_id] = name
+        for org_id in self._member_orgs.get(telegram_id, ()):
+            insort(self._org_sorted[org_id], name)
+
+    def _add_member(self, org_id, telegram_id):
+        telegram_id = str(telegram_id)
+        orgs = self._member_orgs.setdefault(telegram_id, set())
+        if org_id in orgs:
+            return
+        orgs.add(org_id)
+        self._org_members.setdefault(org_id, set()).add(telegram_id)
+        name = self._name_of.get(telegram_id)
+        if name is not None:
+            insort(self._org_sorted.setdefault(org_id, []), name)
+        else:
+            self._org_sorted.setdefault(org_id, [])
+
+    @staticmethod
+    def _discard(names, name):
+        i = bisect_left(names, name)
+        if i < len(names) and names[i] == name:
+            del names[i]